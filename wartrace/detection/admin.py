@@ -1,3 +1,48 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 
-# Register your models here.
+from .models import Detection, DetectionConfig
+from .services import staleness
+
+
+@admin.register(DetectionConfig)
+class DetectionConfigAdmin(admin.ModelAdmin):
+    list_display = ('detector_type', 'display_name', 'is_enabled', 'confidence_threshold', 'iou_threshold', 'version', 'updated_at')
+    list_editable = ('is_enabled', 'confidence_threshold', 'iou_threshold')
+    readonly_fields = ('version', 'updated_at')
+
+
+class StaleFilter(admin.SimpleListFilter):
+    """Detections computed with other weights or parameters than their detector uses now"""
+    title = 'model version'
+    parameter_name = 'stale'
+
+    def lookups(self, request, model_admin):
+        return (
+            ('yes', 'Stale'),
+            ('no', 'Up to date'),
+        )
+
+    def queryset(self, request, queryset):
+        if self.value() == 'yes':
+            return queryset.filter(id__in=staleness.stale_detections().values('id'))
+        if self.value() == 'no':
+            return queryset.exclude(id__in=staleness.stale_detections().values('id'))
+        return queryset
+
+
+@admin.register(Detection)
+class DetectionAdmin(admin.ModelAdmin):
+    list_display = ('id', 'marker_file', 'detector_type', 'model_name', 'short_fingerprint', 'created_at')
+    list_filter = (StaleFilter, 'detector_type', 'model_name')
+    list_select_related = ('marker_file',)
+    readonly_fields = ('fingerprint', 'created_at', 'updated_at')
+    actions = ['queue_reprocessing']
+
+    @admin.display(description='Fingerprint')
+    def short_fingerprint(self, obj):
+        return obj.fingerprint[:12]
+
+    @admin.action(description='Reprocess the markers of the selected detections in the background')
+    def queue_reprocessing(self, request, queryset):
+        queued = staleness.queue_stale_reprocessing(queryset)
+        self.message_user(request, f"Queued {queued} background reprocessing jobs.", messages.SUCCESS)
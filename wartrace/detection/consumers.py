@@ -0,0 +1,57 @@
+import json
+from channels.generic.websocket import AsyncWebsocketConsumer
+from channels.db import database_sync_to_async
+from content.models import Marker
+from .services import jobs, notifications
+
+class ProcessingStatusConsumer(AsyncWebsocketConsumer):
+    """
+    Streams a marker's detection progress to the browser.
+
+    Inference workers publish to the marker's group as files finish; each
+    message has the same shape as the `marker_processing_status` response,
+    which stays available as a polling fallback.
+    """
+    async def connect(self):
+        self.marker_id = int(self.scope['url_route']['kwargs']['marker_id'])
+        self.group_name = notifications.marker_group(self.marker_id)
+        self.user = self.scope['user']
+
+        if not await self.can_view():
+            await self.close()
+            return
+
+        # Join marker group
+        await self.channel_layer.group_add(
+            self.group_name,
+            self.channel_name
+        )
+
+        await self.accept()
+
+        # Send the current state so the client doesn't wait for the next update
+        await self.send(text_data=json.dumps(await self.current_status()))
+
+    async def disconnect(self, close_code):
+        # Leave marker group
+        if hasattr(self, 'group_name'):
+            await self.channel_layer.group_discard(
+                self.group_name,
+                self.channel_name
+            )
+
+    async def processing_status(self, event):
+        # Send status update to WebSocket
+        await self.send(text_data=json.dumps(event['status']))
+
+    @database_sync_to_async
+    def can_view(self):
+        # Same rule as marker_processing_status
+        if not self.user.is_authenticated:
+            return False
+        marker = Marker.objects.filter(id=self.marker_id).first()
+        return marker is not None and (self.user.is_staff or marker.user_id == self.user.id)
+
+    @database_sync_to_async
+    def current_status(self):
+        return notifications.status_message(jobs.get_latest_job(self.marker_id), self.marker_id)
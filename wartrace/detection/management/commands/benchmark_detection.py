@@ -0,0 +1,107 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from detection.services import benchmark
+from detection.services.main import MODEL_CONFIG
+
+
+def parse_resolution(value):
+    """Parse WIDTHxHEIGHT"""
+    try:
+        width, height = (int(part) for part in value.lower().split('x'))
+    except ValueError:
+        raise ValueError(f"Expected WIDTHxHEIGHT, got {value}")
+    return width, height
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks the detection pipeline on synthetic images and compares the timings with a baseline'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--detector-types',
+            nargs='*',
+            default=None,
+            help='Detector types to benchmark (defaults to all configured ones)'
+        )
+        parser.add_argument(
+            '--resolutions',
+            nargs='*',
+            type=parse_resolution,
+            default=benchmark.DEFAULT_RESOLUTIONS,
+            help='Image sizes as WIDTHxHEIGHT'
+        )
+        parser.add_argument(
+            '--densities',
+            nargs='*',
+            type=int,
+            default=benchmark.DEFAULT_DENSITIES,
+            help='Objects per image'
+        )
+        parser.add_argument('--repeats', type=int, default=benchmark.DEFAULT_REPEATS, help='Timed runs per case')
+        parser.add_argument(
+            '--real-models',
+            action='store_true',
+            help='Use the configured weights instead of stub models (detector types without weights are skipped)'
+        )
+        parser.add_argument('--output', default='detection_benchmark.json', help='File the report is written to')
+        parser.add_argument('--baseline', default=None, help='Report to compare against')
+        parser.add_argument(
+            '--tolerance',
+            type=float,
+            default=benchmark.DEFAULT_TOLERANCE,
+            help='Allowed growth of each case\'s median run over the baseline, as a fraction'
+        )
+        parser.add_argument(
+            '--update-baseline',
+            action='store_true',
+            help='Write the report to --baseline instead of comparing against it'
+        )
+
+    def handle(self, *args, **options):
+        detector_types = options['detector_types'] or list(MODEL_CONFIG.keys())
+        for detector_type in detector_types:
+            if detector_type not in MODEL_CONFIG:
+                raise CommandError(f"Unknown detector type: {detector_type}")
+
+        if options['real_models']:
+            missing = set(detector_types) - set(benchmark.available_real_models(detector_types))
+            for detector_type in sorted(missing):
+                self.stdout.write(self.style.WARNING(f"{detector_type}: no model weights or backend, skipping"))
+
+        report = benchmark.run(
+            detector_types,
+            resolutions=options['resolutions'],
+            densities=options['densities'],
+            repeats=options['repeats'],
+            real_models=options['real_models'],
+            on_case=lambda name, stats: self.stdout.write(
+                f"{name:<55} p50 {stats['p50']:>9.2f} ms  p95 {stats['p95']:>9.2f} ms"
+            )
+        )
+        benchmark.save_report(report, options['output'])
+        self.stdout.write(f"Wrote {len(report['cases'])} cases to {options['output']}")
+
+        if not options['baseline']:
+            return
+        if options['update_baseline']:
+            benchmark.save_report(report, options['baseline'])
+            self.stdout.write(self.style.SUCCESS(f"Updated baseline {options['baseline']}"))
+            return
+
+        baseline = benchmark.load_report(options['baseline'])
+        if baseline is None:
+            raise CommandError(f"No baseline at {options['baseline']}, create one with --update-baseline")
+        try:
+            regressions = benchmark.compare(report, baseline, options['tolerance'])
+        except ValueError as e:
+            raise CommandError(f"{e}; record a new baseline with --update-baseline")
+
+        if regressions:
+            for regression in regressions:
+                self.stderr.write(
+                    f"{regression['case']}: {regression['baseline_p50']:.2f} -> {regression['p50']:.2f} ms "
+                    f"(x{regression['ratio']})"
+                )
+            raise CommandError(f"{len(regressions)} cases regressed by more than {options['tolerance']:.0%}")
+
+        self.stdout.write(self.style.SUCCESS(f"No regressions against {options['baseline']}"))
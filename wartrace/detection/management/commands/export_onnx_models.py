@@ -0,0 +1,165 @@
+import os
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from content.models import MarkerFile
+from detection.services import onnx_backend, tiling
+from detection.services.images import DecodedImage
+from detection.services.main import MODEL_CONFIG, get_processable_path, model_service, _is_yolo
+
+
+class Command(BaseCommand):
+    help = 'Exports detection models to ONNX (optionally int8) and compares speed and agreement with the originals'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--detector-types',
+            nargs='*',
+            default=None,
+            help='Detector types to export (defaults to all with a model file on disk)'
+        )
+        parser.add_argument(
+            '--quantize',
+            action='store_true',
+            help='Also write a dynamically quantized int8 model'
+        )
+        parser.add_argument(
+            '--opset',
+            type=int,
+            default=17,
+            help='ONNX opset version'
+        )
+        parser.add_argument(
+            '--samples',
+            type=int,
+            default=20,
+            help='Uploaded images used to compare the exports with the originals (0 to skip)'
+        )
+
+    def handle(self, *args, **options):
+        detector_types = options['detector_types'] or list(MODEL_CONFIG.keys())
+        images = self.sample_images(options['samples']) if options['samples'] else []
+
+        for detector_type in detector_types:
+            if detector_type not in MODEL_CONFIG:
+                raise CommandError(f"Unknown detector type: {detector_type}")
+
+            model_name, config = next(iter(MODEL_CONFIG[detector_type].items()))
+            if not os.path.exists(config['model_path']):
+                self.stdout.write(self.style.WARNING(f"{detector_type}: no model file at {config['model_path']}, skipping"))
+                continue
+
+            try:
+                fp32_path = onnx_backend.export_model(config, opset=options['opset'])
+                exports = [(onnx_backend.BACKEND_ONNX, fp32_path)]
+                if options['quantize']:
+                    exports.append((onnx_backend.BACKEND_ONNX_INT8, onnx_backend.quantize_model(fp32_path)))
+            except ImportError as e:
+                raise CommandError(
+                    f"Missing export dependency ({e.name}), install with: pip install onnx onnxruntime onnxslim tf2onnx"
+                )
+
+            native_size = os.path.getsize(config['model_path']) / (1024 * 1024)
+            for backend, path in exports:
+                self.stdout.write(self.style.SUCCESS(
+                    f"{detector_type}/{model_name} {backend}: {path} "
+                    f"({os.path.getsize(path) / (1024 * 1024):.1f} MB, native {native_size:.1f} MB)"
+                ))
+
+            if images:
+                self.compare(detector_type, config, [backend for backend, _ in exports], images)
+
+        for image in images:
+            image.release()
+
+    def sample_images(self, count):
+        """Decode up to `count` uploaded images, or make random ones if there are none"""
+        images = []
+        for marker_file in MarkerFile.objects.order_by('-id').iterator():
+            if len(images) >= count:
+                break
+            file_path = get_processable_path(marker_file)
+            if file_path:
+                images.append(DecodedImage(file_path))
+
+        if not images:
+            self.stdout.write(self.style.WARNING('No uploaded images found, comparing on random images'))
+            rng = np.random.default_rng(0)
+            images = [
+                DecodedImage(f"synthetic_{index}.jpg", rng.integers(0, 256, (720, 1280, 3), dtype=np.uint8))
+                for index in range(count)
+            ]
+        return images
+
+    def compare(self, detector_type, config, backends, images):
+        """Run the native and exported models on the same images and report speed and agreement"""
+        # Loaded directly, model_service may itself be configured to use the exports
+        if config['type'] == 'ultralytics':
+            from ultralytics import YOLO
+            native_model = YOLO(config['model_path'])
+        else:
+            import tensorflow as tf
+            native_model = tf.keras.models.load_model(config['model_path'])
+
+        self.run(detector_type, native_model, config, images[:1])
+        native_time, native_results = self.run(detector_type, native_model, config, images)
+
+        for backend in backends:
+            exported_config = onnx_backend.apply_backend(config, backend)
+            exported_model = onnx_backend.load_onnx_model(exported_config)
+            # Warm up so session initialisation is not timed
+            self.run(detector_type, exported_model, exported_config, images[:1])
+            exported_time, exported_results = self.run(detector_type, exported_model, exported_config, images)
+
+            if _is_yolo(config):
+                scores = [box_agreement(native_results[path], exported_results[path]) for path in native_results]
+                agreement = f"box agreement {100 * np.mean(scores):.1f}%"
+            else:
+                scores = [top_label_agreement(native_results[path], exported_results[path]) for path in native_results]
+                agreement = f"top label agreement {100 * np.mean(scores):.1f}%"
+
+            self.stdout.write(
+                f"  {backend}: {1000 * exported_time / len(images):.1f} ms/image vs "
+                f"{1000 * native_time / len(images):.1f} ms/image native "
+                f"({native_time / max(exported_time, 1e-9):.2f}x), {agreement}"
+            )
+
+    def run(self, detector_type, model, config, images):
+        """Return (seconds, results by file path) for one pass over the images"""
+        start_time = time.time()
+        if _is_yolo(config):
+            results = model_service._process_with_yolo_batch(images, detector_type, model, config)
+        else:
+            results = model_service._process_with_keras_batch(images, detector_type, model, config)
+        return time.time() - start_time, results
+
+
+def box_agreement(native, exported, iou_threshold=0.5):
+    """F1 score of the exported model's boxes against the native ones (same label, IoU >= threshold)"""
+    native_boxes = native.get('detections', [])
+    exported_boxes = exported.get('detections', [])
+    if not native_boxes and not exported_boxes:
+        return 1.0
+
+    matched = 0
+    unmatched = list(exported_boxes)
+    for det in native_boxes:
+        candidates = [other for other in unmatched if other['label'] == det['label']]
+        if not candidates:
+            continue
+        overlaps = tiling.box_overlaps(np.array(det['bbox']), np.array([c['bbox'] for c in candidates]))
+        best = int(overlaps.argmax())
+        if overlaps[best] >= iou_threshold:
+            matched += 1
+            unmatched.remove(candidates[best])
+
+    return 2 * matched / (len(native_boxes) + len(exported_boxes))
+
+
+def top_label_agreement(native, exported):
+    """1.0 if both models give the image the same top class"""
+    native_top = (native.get('classifications') or [{}])[0].get('label')
+    exported_top = (exported.get('classifications') or [{}])[0].get('label')
+    return float(native_top == exported_top)
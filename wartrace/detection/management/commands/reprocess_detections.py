@@ -0,0 +1,197 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from content.models import Marker
+from detection.services import backfill
+from detection.services.main import MODEL_CONFIG, model_service
+from detection.services.progress import ProgressTracker
+
+
+class Command(BaseCommand):
+    help = (
+        'Reprocesses archived marker files selected by filters through the job queue '
+        'or in local processes, resuming interrupted runs'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--detector-types',
+            nargs='*',
+            default=None,
+            help='Detector types to run (defaults to all configured ones)'
+        )
+        parser.add_argument('--date-from', type=date.fromisoformat, default=None, help='Only markers dated on or after YYYY-MM-DD')
+        parser.add_argument('--date-to', type=date.fromisoformat, default=None, help='Only markers dated on or before YYYY-MM-DD')
+        parser.add_argument(
+            '--categories',
+            nargs='*',
+            default=None,
+            choices=[choice for choice, _ in Marker.CATEGORY_CHOICES],
+            help='Only markers in these categories'
+        )
+        parser.add_argument('--marker-ids', nargs='*', type=int, default=None, help='Only these markers')
+        parser.add_argument(
+            '--fingerprints',
+            nargs='*',
+            default=None,
+            help='Files with results computed with one of these model fingerprints'
+        )
+        parser.add_argument(
+            '--stale',
+            action='store_true',
+            help='Files with results computed with other weights or parameters than the current ones'
+        )
+        parser.add_argument(
+            '--missing',
+            action='store_true',
+            help='Files without a result for at least one of the detector types'
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Replace every result of the selected files instead of only missing and stale ones'
+        )
+        parser.add_argument(
+            '--max-active-jobs',
+            type=int,
+            default=backfill.DEFAULT_MAX_ACTIVE_JOBS,
+            help='Background jobs of the run queued or running at a time'
+        )
+        parser.add_argument(
+            '--worker-timeout',
+            type=float,
+            default=backfill.DEFAULT_WORKER_TIMEOUT,
+            help='Seconds to wait for an inference worker to take the jobs before giving up'
+        )
+        parser.add_argument(
+            '--processes',
+            type=int,
+            default=None,
+            help='Process the files in this many local processes instead of queueing them for the inference workers'
+        )
+        parser.add_argument(
+            '--checkpoint',
+            default='reprocess_detections.checkpoint.json',
+            help='File recording finished files, used to resume an interrupted run'
+        )
+        parser.add_argument(
+            '--restart',
+            action='store_true',
+            help='Ignore an existing checkpoint and start over'
+        )
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many files would be processed')
+
+    def handle(self, *args, **options):
+        detector_types = options['detector_types'] or list(MODEL_CONFIG.keys())
+        for detector_type in detector_types:
+            if detector_type not in MODEL_CONFIG:
+                raise CommandError(f"Unknown detector type: {detector_type}")
+
+        # Without weights the files would never count as done, so leave those detectors out of the run
+        missing_weights = [
+            detector_type for detector_type in detector_types if not model_service.has_weights(detector_type)
+        ]
+        for detector_type in missing_weights:
+            self.stdout.write(self.style.WARNING(f"{detector_type}: no model weights, skipping"))
+        detector_types = [detector_type for detector_type in detector_types if detector_type not in missing_weights]
+        if not detector_types:
+            raise CommandError("None of the detector types has model weights")
+
+        filters = {
+            'detector_types': detector_types,
+            'date_from': options['date_from'],
+            'date_to': options['date_to'],
+            'categories': options['categories'],
+            'marker_ids': options['marker_ids'],
+            'fingerprints': options['fingerprints'],
+            'stale': options['stale'],
+            'missing': options['missing'],
+        }
+        file_ids = list(backfill.select_files(**filters).values_list('id', flat=True))
+
+        checkpoint = backfill.Checkpoint(options['checkpoint'], {**filters, 'force': options['force']})
+        if options['restart']:
+            checkpoint.remove()
+        try:
+            if checkpoint.load():
+                self.stdout.write(f"Resuming from {checkpoint.path}: {len(checkpoint.done)} files already done")
+        except ValueError as e:
+            raise CommandError(f"{e}; pass --restart or another --checkpoint")
+
+        pending = [file_id for file_id in file_ids if file_id not in checkpoint.done]
+        if options['processes']:
+            how = f"on {options['processes']} local processes"
+        else:
+            how = f"in up to {options['max_active_jobs']} background jobs at a time"
+        self.stdout.write(f"{len(file_ids)} files selected, {len(pending)} to process with {detector_types} {how}")
+        if options['dry_run'] or not pending:
+            return
+
+        progress = ProgressTracker(len(pending), detector_types, callback=self.report, report_interval=5.0)
+        totals = {'detections': 0, 'failed': 0}
+
+        def on_job(finished_ids, failed_ids, detections):
+            if failed_ids:
+                # Not checkpointed, so the next run retries these files
+                totals['failed'] += len(failed_ids)
+                self.stderr.write(f"{len(failed_ids)} files failed: {failed_ids}")
+                progress.files_skipped(len(failed_ids))
+
+            if finished_ids:
+                checkpoint.add(finished_ids)
+                totals['detections'] += detections
+                for detector_type in detector_types:
+                    progress.detector_done(detector_type, len(finished_ids))
+                progress.files_finished(finished_ids)
+
+        try:
+            if options['processes']:
+                backfill.run_local(
+                    pending,
+                    detector_types,
+                    processes=options['processes'],
+                    force=options['force'],
+                    on_job=on_job
+                )
+            else:
+                backfill.run(
+                    pending,
+                    detector_types,
+                    force=options['force'],
+                    max_active_jobs=options['max_active_jobs'],
+                    worker_timeout=options['worker_timeout'],
+                    on_job=on_job
+                )
+        except backfill.WorkersUnavailable as e:
+            raise CommandError(
+                f"{e}; start them with run_detection_workers or pass --processes, "
+                f"then run the same command again to resume"
+            )
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING(
+                f"Interrupted after {len(checkpoint.done)} files, run the same command again to resume"
+            ))
+            return
+
+        summary = progress.snapshot()
+        if totals['failed']:
+            self.stdout.write(self.style.WARNING(
+                f"Done with {totals['failed']} failed files, run the same command again to retry them"
+            ))
+        else:
+            checkpoint.remove()
+            self.stdout.write(self.style.SUCCESS(
+                f"Reprocessed {summary['files_done']} files in {summary['elapsed_seconds']:.0f}s "
+                f"({totals['detections']} detections)"
+            ))
+
+    def report(self, snapshot):
+        """Print a progress line with throughput and ETA"""
+        files_per_second = snapshot['throughput'] / max(1, len(snapshot['detectors']))
+        eta = snapshot['eta_seconds']
+        eta_text = f"{eta // 3600}h{eta % 3600 // 60:02d}m{eta % 60:02d}s" if eta is not None else 'unknown'
+        self.stdout.write(
+            f"{snapshot['files_done']}/{snapshot['files_total']} files, "
+            f"{files_per_second:.2f} files/s, ETA {eta_text}"
+        )
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from detection.services.workers import InferenceWorkerPool
+
+
+class Command(BaseCommand):
+    help = 'Starts the detection job queue and a pool of inference worker processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=None,
+            help='Number of worker processes (defaults to DETECTION_WORKERS["concurrency"])'
+        )
+
+    def handle(self, *args, **options):
+        pool = InferenceWorkerPool(concurrency=options['concurrency'])
+        pool.start()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Started {pool.concurrency} detection workers with {pool.threads} threads each"
+        ))
+
+        try:
+            pool.supervise()
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING('Stopping detection workers'))
+        finally:
+            pool.stop()
+
+        self.stdout.write(self.style.SUCCESS('Detection workers stopped'))
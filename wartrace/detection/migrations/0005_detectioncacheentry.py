@@ -0,0 +1,36 @@
+# Generated by Django 5.1.7 on 2026-10-17 23:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('detection', '0004_detectionjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DetectionCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cache_key', models.CharField(max_length=64, unique=True)),
+                ('content_hash', models.CharField(db_index=True, max_length=64)),
+                ('detector_type', models.CharField(max_length=50)),
+                ('model_name', models.CharField(max_length=100)),
+                ('model_hash', models.CharField(max_length=64)),
+                ('confidence_threshold', models.FloatField()),
+                ('iou_threshold', models.FloatField()),
+                ('detections', models.JSONField(default=list)),
+                ('summary', models.TextField(blank=True)),
+                ('annotated_image', models.FileField(blank=True, null=True, upload_to='detection_cache/')),
+                ('size_bytes', models.IntegerField(default=0)),
+                ('hits', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_used_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'ordering': ['-last_used_at'],
+            },
+        ),
+    ]
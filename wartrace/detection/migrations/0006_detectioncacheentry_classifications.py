@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-18 00:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('detection', '0005_detectioncacheentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='detectioncacheentry',
+            name='classifications',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
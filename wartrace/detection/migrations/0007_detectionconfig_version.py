@@ -0,0 +1,23 @@
+# Generated by Django 5.1.7 on 2026-10-18 00:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('detection', '0006_detectioncacheentry_classifications'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='detectionconfig',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='detectionconfig',
+            name='version',
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.7 on 2026-10-18 00:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('detection', '0007_detectionconfig_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='detectionjob',
+            name='progress_detail',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='detectionjob',
+            name='units_done',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='detectionjob',
+            name='units_total',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-18 00:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('detection', '0008_detectionjob_units'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='detectionjob',
+            name='incremental',
+            field=models.BooleanField(default=True),
+        ),
+    ]
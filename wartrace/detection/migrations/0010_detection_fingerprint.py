@@ -0,0 +1,42 @@
+# Generated by Django 5.1.7 on 2026-10-18 00:13
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def copy_fingerprints(apps, schema_editor):
+    """Fill the fingerprint of results that recorded their parameters hash in metadata"""
+    Detection = apps.get_model('detection', 'Detection')
+    for detection in Detection._default_manager.filter(metadata__has_key='params_key').only('id', 'metadata'):
+        Detection._default_manager.filter(id=detection.id).update(fingerprint=detection.metadata['params_key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0004_comment_upvotes_marker_damage_assessment_and_more'),
+        ('detection', '0009_detectionjob_incremental'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='detection',
+            name='fingerprint',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='detectionjob',
+            name='priority',
+            field=models.IntegerField(default=10),
+        ),
+        migrations.AddIndex(
+            model_name='detection',
+            index=models.Index(fields=['detector_type', 'fingerprint'], name='detection_d_detecto_400f10_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='detectionjob',
+            index=models.Index(fields=['status', '-priority', 'created_at'], name='detection_d_status_3d896c_idx'),
+        ),
+        migrations.RunPython(copy_fingerprints, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.1.7 on 2026-10-18 00:22
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0004_comment_upvotes_marker_damage_assessment_and_more'),
+        ('detection', '0010_detection_fingerprint'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='detectionjob',
+            name='priority',
+            field=models.IntegerField(choices=[(10, 'Interactive'), (5, 'Reprocess'), (0, 'Background')], default=10),
+        ),
+        migrations.AddIndex(
+            model_name='detectionjob',
+            index=models.Index(fields=['user', 'status'], name='detection_d_user_id_2e7dab_idx'),
+        ),
+    ]
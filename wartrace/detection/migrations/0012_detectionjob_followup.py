@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-18 00:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('detection', '0011_detectionjob_priority_classes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='detectionjob',
+            name='followup_detector_types',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.7 on 2026-10-18 00:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('detection', '0012_detectionjob_followup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='detectionjob',
+            name='cancel_requested',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='detectionjob',
+            name='deadline_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
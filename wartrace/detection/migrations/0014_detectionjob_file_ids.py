@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-18 00:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('detection', '0013_detectionjob_deadline_cancel'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='detectionjob',
+            name='file_ids',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
@@ -1,10 +1,11 @@
 from django.db import models
 from django.conf import settings
-from content.models import MarkerFile
+from content.models import Marker, MarkerFile
 import os
 import json
 from django.core.files.storage import default_storage
 from django.core.files.base import ContentFile # Import ContentFile
+from django.urls import reverse
 
 class Detection(models.Model):
     """
@@ -36,6 +37,10 @@ class Detection(models.Model):
     # Optional metadata/attributes as JSON (inference time, settings used, etc.)
     metadata = models.JSONField(null=True, blank=True)
     
+    # Hash of the model weights and effective parameters the result was computed with.
+    # Differs from the detector's current fingerprint once weights or settings change.
+    fingerprint = models.CharField(max_length=64, blank=True)
+    
     # Timestamp
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -44,6 +49,9 @@ class Detection(models.Model):
         # Ensure we don't process the same file with the same detector type multiple times
         unique_together = ('marker_file', 'detector_type')
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['detector_type', 'fingerprint']),
+        ]
     
     def __str__(self):
         return f"{self.detector_type} detection for {self.marker_file}"
@@ -78,6 +86,10 @@ class Detection(models.Model):
                  # If storage check fails, fallback to simple join
                  return os.path.join(settings.MEDIA_URL, path)
 
+        # New detections don't store an image, it is rendered on demand from the stored objects
+        if self.pk:
+            return reverse('detection:detection_image', args=[self.pk])
+
         return None # No image available
     
     @property
@@ -212,6 +224,10 @@ class DetectionConfig(models.Model):
     """
     Stores configuration information about available detection models.
     This allows for dynamic model configuration through the admin interface.
+    
+    Inference workers pick up changes without a restart. Besides the thresholds,
+    `config` may override the MODEL_CONFIG entry with `model_name`, `model_path`,
+    `batch_size`, `imgsz`, `crop_batch_size`, `preprocessing`, `tiling` and `crops`.
     """
     # Type of detector (object_detection, military_detection, etc.)
     detector_type = models.CharField(max_length=50, unique=True)
@@ -240,13 +256,204 @@ class DetectionConfig(models.Model):
     # IOU threshold for non-maximum suppression (0-1)
     iou_threshold = models.FloatField(default=0.45)
     
+    # Incremented on every save so inference workers notice changes and reload
+    version = models.PositiveIntegerField(default=1, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
+    
     class Meta:
         ordering = ['order', 'detector_type']
     
     def __str__(self):
         return self.display_name
     
+    def save(self, *args, **kwargs):
+        if self.pk:
+            self.version += 1
+        super().save(*args, **kwargs)
+    
     @property
     def get_config(self):
         """Return the configuration as a dictionary"""
         return self.config if isinstance(self.config, dict) else {}
+
+
+class DetectionJob(models.Model):
+    """
+    A queued or running request to process a marker's files.
+    Jobs are the shared queue between web processes and inference workers:
+    workers claim them with a time-limited lease and report progress here.
+    """
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CANCELLED = 'cancelled'
+    
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+        (STATUS_CANCELLED, 'Cancelled'),
+    ]
+    
+    ACTIVE_STATUSES = [STATUS_QUEUED, STATUS_RUNNING]
+    FINISHED_STATUSES = [STATUS_DONE, STATUS_FAILED, STATUS_CANCELLED]
+    
+    # Queued jobs are claimed highest priority first, shared fairly between users within a priority
+    PRIORITY_INTERACTIVE = 10   # First processing of a new marker, someone is waiting for it
+    PRIORITY_REPROCESS = 5      # Reprocessing requested by a user
+    PRIORITY_BACKGROUND = 0     # Fleet backfills and stale result refreshes
+    
+    PRIORITY_CHOICES = [
+        (PRIORITY_INTERACTIVE, 'Interactive'),
+        (PRIORITY_REPROCESS, 'Reprocess'),
+        (PRIORITY_BACKGROUND, 'Background'),
+    ]
+    
+    # Marker whose files are processed
+    marker = models.ForeignKey(
+        Marker, 
+        on_delete=models.CASCADE, 
+        related_name='detection_jobs'
+    )
+    
+    # User who requested the processing
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, 
+        on_delete=models.SET_NULL, 
+        null=True, 
+        blank=True, 
+        related_name='detection_jobs'
+    )
+    
+    # Detector types requested (object_detection, military_detection, etc.)
+    detector_types = models.JSONField(default=list)
+    
+    # Only process files whose results are missing or stale, keeping the others
+    incremental = models.BooleanField(default=True)
+    
+    # Only these files of the marker (empty = all of them), set by reprocessing runs
+    file_ids = models.JSONField(default=list, blank=True)
+    
+    # Detector types submitted again while the job was running, queued as a new job when it finishes
+    followup_detector_types = models.JSONField(default=list, blank=True)
+    
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    
+    priority = models.IntegerField(choices=PRIORITY_CHOICES, default=PRIORITY_INTERACTIVE)
+    
+    # Per-file progress
+    files_total = models.IntegerField(default=0)
+    files_done = models.IntegerField(default=0)
+    
+    # Per-detector progress (one unit = one file run through one detector)
+    units_total = models.IntegerField(default=0)
+    units_done = models.IntegerField(default=0)
+    
+    # Latest progress snapshot: per-detector counts, throughput, ETA and recent files
+    progress_detail = models.JSONField(default=dict, blank=True)
+    
+    # Final summary returned by process_marker, or the error message
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    
+    # Lease held by the worker currently running the job
+    worker_id = models.CharField(max_length=100, blank=True)
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.IntegerField(default=0)
+    
+    # Time budget of the current attempt, and a cancellation the worker picks up between batches
+    deadline_at = models.DateTimeField(null=True, blank=True)
+    cancel_requested = models.BooleanField(default=False)
+    
+    # Timestamps
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+            models.Index(fields=['status', '-priority', 'created_at']),
+            models.Index(fields=['user', 'status']),
+        ]
+        constraints = [
+            # At most one queued or running job per marker, across all processes
+            models.UniqueConstraint(
+                fields=['marker'],
+                condition=models.Q(status__in=['queued', 'running']),
+                name='unique_active_detection_job_per_marker'
+            ),
+        ]
+    
+    def __str__(self):
+        return f"Detection job {self.id} for marker {self.marker_id} ({self.status})"
+    
+    @property
+    def queue_wait(self):
+        """Return the seconds the job waited for a worker, None while it is still queued"""
+        if self.started_at is None:
+            return None
+        return (self.started_at - self.created_at).total_seconds()
+    
+    @property
+    def is_active(self):
+        """Check if the job is still queued or running"""
+        return self.status in self.ACTIVE_STATUSES
+    
+    @property
+    def progress(self):
+        """Return the share of work processed as a percentage (0-100)"""
+        if self.status == self.STATUS_DONE:
+            return 100
+        # Detector units move during a batch, files only once it is saved
+        if self.units_total:
+            return int(100 * self.units_done / self.units_total)
+        if not self.files_total:
+            return 0
+        return int(100 * self.files_done / self.files_total)
+
+
+class DetectionCacheEntry(models.Model):
+    """
+    Cached output of one model run on one image, keyed by the image content.
+    Lets identical uploads (and reprocessing with unchanged settings) reuse
+    earlier results instead of running inference again.
+    """
+    # SHA-256 over the content hash, model, model file hash and thresholds
+    cache_key = models.CharField(max_length=64, unique=True)
+    
+    # SHA-256 of the image file bytes
+    content_hash = models.CharField(max_length=64, db_index=True)
+    
+    # Model that produced the result and the hash of its weights file
+    detector_type = models.CharField(max_length=50)
+    model_name = models.CharField(max_length=100)
+    model_hash = models.CharField(max_length=64)
+    
+    # Parameters the result was produced with
+    confidence_threshold = models.FloatField()
+    iou_threshold = models.FloatField()
+    
+    # Detections and classifications in the process_image format and the summary text
+    detections = models.JSONField(default=list)
+    classifications = models.JSONField(default=list, blank=True)
+    summary = models.TextField(blank=True)
+    
+    # Annotated image rendered for this result
+    annotated_image = models.FileField(upload_to='detection_cache/', null=True, blank=True)
+    size_bytes = models.IntegerField(default=0)
+    
+    # Usage tracking for LRU eviction
+    hits = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    
+    class Meta:
+        ordering = ['-last_used_at']
+    
+    def __str__(self):
+        return f"{self.model_name} result for {self.content_hash[:12]}"
@@ -0,0 +1,6 @@
+from django.urls import re_path
+from . import consumers
+
+websocket_urlpatterns = [
+    re_path(r'ws/detection/markers/(?P<marker_id>\d+)/status/$', consumers.ProcessingStatusConsumer.as_asgi()),
+]
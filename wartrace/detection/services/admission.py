@@ -0,0 +1,155 @@
+import logging
+from datetime import timedelta
+from typing import Any, Dict, List, Tuple
+
+from django.conf import settings
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from ..models import DetectionJob
+from . import jobs
+from .workers import get_worker_settings
+
+logger = logging.getLogger(__name__)
+
+# Defaults for settings.DETECTION_ADMISSION
+ADMISSION_DEFAULTS = {
+    'defer_wait_seconds': 300,         # Estimated wait above which new requests are queued as background work
+    'max_wait_seconds': 1800,          # Estimated wait for the whole queue above which new requests are turned away
+    'max_queued_files': 5000,          # Files waiting in the whole queue above which new requests are turned away
+    'default_files_per_second': 0.5,   # Throughput per worker assumed until jobs have finished recently
+    'throughput_window_minutes': 60,   # Finished jobs used to measure the throughput
+    'min_retry_after': 15,             # Bounds of the Retry-After sent with rejections, in seconds
+    'max_retry_after': 600,
+}
+
+# Outcomes of `submit`
+OUTCOME_QUEUED = 'queued'          # A new job was queued
+OUTCOME_DEFERRED = 'deferred'      # A new job was queued at background priority because the queue is long
+OUTCOME_COALESCED = 'coalesced'    # Merged into the marker's queued job
+OUTCOME_FOLLOWUP = 'followup'      # Queued to run after the marker's running job
+
+
+class AdmissionRejected(Exception):
+    """Raised when a processing request is turned away because the queue is full"""
+
+    def __init__(self, message: str, retry_after: int, queue_position: int, estimated_wait: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.queue_position = queue_position
+        self.estimated_wait = estimated_wait
+
+
+def get_admission_settings() -> Dict[str, Any]:
+    """Return the admission settings merged over the defaults"""
+    admission_settings = dict(ADMISSION_DEFAULTS)
+    admission_settings.update(getattr(settings, 'DETECTION_ADMISSION', {}))
+    return admission_settings
+
+
+def files_per_second() -> float:
+    """
+    Estimate how many files per second the workers get through together
+
+    Measured on the jobs that finished within the throughput window, times
+    the configured worker concurrency.
+    """
+    admission_settings = get_admission_settings()
+    since = timezone.now() - timedelta(minutes=admission_settings['throughput_window_minutes'])
+
+    files, seconds = 0, 0.0
+    for files_done, started_at, finished_at in DetectionJob.objects.filter(
+        status=DetectionJob.STATUS_DONE,
+        finished_at__gte=since,
+        started_at__isnull=False
+    ).values_list('files_done', 'started_at', 'finished_at'):
+        files += files_done
+        seconds += (finished_at - started_at).total_seconds()
+
+    per_worker = files / seconds if files and seconds > 0 else admission_settings['default_files_per_second']
+    return per_worker * max(1, get_worker_settings()['concurrency'])
+
+
+def queue_ahead(priority: int) -> Tuple[int, int]:
+    """
+    Return the (jobs, files) a new job of this priority would wait for
+
+    Includes the queued jobs of this priority or higher and the files the
+    running jobs have left.
+    """
+    queued = DetectionJob.objects.filter(status=DetectionJob.STATUS_QUEUED, priority__gte=priority).aggregate(
+        jobs=Count('id'), files=Sum('files_total')
+    )
+    running = DetectionJob.objects.filter(status=DetectionJob.STATUS_RUNNING).aggregate(
+        total=Sum('files_total'), done=Sum('files_done')
+    )
+    remaining = max(0, (running['total'] or 0) - (running['done'] or 0))
+    return queued['jobs'], (queued['files'] or 0) + remaining
+
+
+def retry_after(estimated_wait: float) -> int:
+    """Return the Retry-After seconds for an estimated wait, within the configured bounds"""
+    admission_settings = get_admission_settings()
+    return int(min(admission_settings['max_retry_after'], max(admission_settings['min_retry_after'], estimated_wait)))
+
+
+def submit(marker, detector_types: List[str], user, incremental: bool = True) -> Dict[str, Any]:
+    """
+    Admit a request to process a marker
+
+    Repeated requests for a marker are coalesced into its active job. New
+    jobs are queued at their usual priority while the queue is short,
+    deferred to background priority when the estimated wait passes
+    `defer_wait_seconds`, and turned away when the whole queue holds more
+    than `max_queued_files` files or `max_wait_seconds` of work.
+
+    Args:
+        marker: Marker instance to process
+        detector_types: Detector types requested
+        user: User making the request
+        incremental: Only process missing or stale results; False reprocesses every file
+
+    Returns:
+        Dictionary with the `job`, the `outcome` (one of the OUTCOME_* values),
+        its `queue_position` and the `estimated_wait` in seconds
+
+    Raises:
+        AdmissionRejected: If the queue is full or the user's queue limit is reached
+    """
+    admission_settings = get_admission_settings()
+
+    active = jobs.get_active_job(marker.id)
+    if active:
+        outcome = jobs.coalesce_submission(active, detector_types, incremental, priority=jobs.default_priority(marker))
+        if outcome:
+            return {'job': active, 'outcome': outcome, 'queue_position': jobs.queue_position(active), 'estimated_wait': None}
+
+    rate = files_per_second()
+    total_jobs, total_files = queue_ahead(DetectionJob.PRIORITY_BACKGROUND)
+    total_wait = total_files / rate
+    if total_files > admission_settings['max_queued_files'] or total_wait > admission_settings['max_wait_seconds']:
+        logger.warning(f"Turned away processing of marker {marker.id}: {total_files} files queued, ~{total_wait:.0f}s of work")
+        raise AdmissionRejected(
+            'The processing queue is full, please try again later',
+            retry_after(total_wait), total_jobs + 1, total_wait
+        )
+
+    priority = jobs.default_priority(marker)
+    ahead_jobs, ahead_files = queue_ahead(priority)
+    estimated_wait = ahead_files / rate
+    outcome = OUTCOME_QUEUED
+    if estimated_wait > admission_settings['defer_wait_seconds'] and priority > DetectionJob.PRIORITY_BACKGROUND:
+        priority = DetectionJob.PRIORITY_BACKGROUND
+        estimated_wait = total_wait
+        outcome = OUTCOME_DEFERRED
+
+    try:
+        job, created = jobs.enqueue_job(marker, detector_types, user, incremental=incremental, priority=priority)
+    except jobs.QueueLimitExceeded as e:
+        raise AdmissionRejected(str(e), retry_after(estimated_wait), ahead_jobs + 1, estimated_wait)
+
+    if not created:
+        # Another request queued a job for the marker first
+        outcome = jobs.coalesce_submission(job, detector_types, incremental, priority=priority) or OUTCOME_COALESCED
+
+    return {'job': job, 'outcome': outcome, 'queue_position': jobs.queue_position(job), 'estimated_wait': estimated_wait}
@@ -0,0 +1,316 @@
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import time
+import traceback
+from datetime import date
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from django.db import close_old_connections, connections
+from django.db.models import Exists, OuterRef, Q
+
+from content.models import Marker, MarkerFile
+from ..models import Detection, DetectionJob
+from . import jobs, staleness
+
+logger = logging.getLogger(__name__)
+
+# Jobs of a reprocessing run queued or running at a time
+DEFAULT_MAX_ACTIVE_JOBS = 4
+
+# Seconds between two checks of a run's jobs
+DEFAULT_POLL_INTERVAL = 5.0
+
+# Seconds a run's jobs may wait while no job runs anywhere before the workers are taken to be down
+DEFAULT_WORKER_TIMEOUT = 120.0
+
+# Files handed to a local worker process at a time
+DEFAULT_CHUNK_SIZE = 32
+
+
+class WorkersUnavailable(Exception):
+    """Raised when no inference worker picks up the jobs of a reprocessing run"""
+
+
+def select_files(detector_types: List[str], date_from: Optional[date] = None, date_to: Optional[date] = None,
+                 categories: Iterable[str] = None, marker_ids: Iterable[int] = None,
+                 fingerprints: Iterable[str] = None, stale: bool = False, missing: bool = False):
+    """
+    Select the marker files a reprocessing run covers
+
+    Marker filters (dates, categories, IDs) narrow the archive; the result
+    filters (`fingerprints`, `stale`, `missing`) are combined with OR, and
+    when none is given every file of the selected markers is included.
+
+    Args:
+        detector_types: Detector types being reprocessed
+        date_from: Only markers dated on or after this day
+        date_to: Only markers dated on or before this day
+        categories: Only markers in these categories
+        marker_ids: Only these markers
+        fingerprints: Files with results computed with one of these fingerprints
+        stale: Files with results computed with other weights or parameters than the current ones
+        missing: Files without a result for at least one of the detector types
+
+    Returns:
+        MarkerFile QuerySet ordered by ID
+    """
+    files = MarkerFile.objects.all()
+    if date_from:
+        files = files.filter(marker__date__gte=date_from)
+    if date_to:
+        files = files.filter(marker__date__lte=date_to)
+    if categories:
+        files = files.filter(marker__category__in=list(categories))
+    if marker_ids:
+        files = files.filter(marker_id__in=list(marker_ids))
+
+    conditions = Q()
+    detections = Detection._default_manager.filter(detector_type__in=detector_types)
+    if fingerprints:
+        conditions |= Q(id__in=detections.filter(fingerprint__in=list(fingerprints)).values('marker_file_id'))
+    if stale:
+        conditions |= Q(id__in=staleness.stale_detections(detector_types).values('marker_file_id'))
+    if missing:
+        for detector_type in detector_types:
+            conditions |= ~Exists(Detection._default_manager.filter(
+                marker_file_id=OuterRef('pk'), detector_type=detector_type
+            ))
+
+    if conditions:
+        files = files.filter(conditions)
+    return files.order_by('id')
+
+
+class Checkpoint:
+    """
+    IDs of the files a reprocessing run has finished, saved to a JSON file
+
+    The file also stores a hash of the run's filters, so a resumed run can't
+    silently continue a different selection.
+    """
+
+    def __init__(self, path: str, filters: Dict[str, Any]):
+        self.path = path
+        self.filters_hash = hashlib.sha256(json.dumps(filters, sort_keys=True, default=str).encode()).hexdigest()
+        self.done: Set[int] = set()
+
+    def load(self) -> bool:
+        """
+        Read the finished file IDs of an interrupted run
+
+        Returns:
+            True if a checkpoint was loaded
+
+        Raises:
+            ValueError: If the checkpoint belongs to a run with other filters
+        """
+        if not os.path.exists(self.path):
+            return False
+
+        with open(self.path) as f:
+            data = json.load(f)
+        if data.get('filters_hash') != self.filters_hash:
+            raise ValueError(f"Checkpoint {self.path} was written by a run with other filters")
+
+        self.done = set(data.get('done', []))
+        return True
+
+    def add(self, file_ids: Iterable[int]):
+        """Record finished files and save the checkpoint"""
+        self.done.update(file_ids)
+
+        # Write to a temporary name first so an interruption never leaves a truncated checkpoint
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'filters_hash': self.filters_hash, 'done': sorted(self.done)}, f)
+        os.replace(tmp_path, self.path)
+
+    def remove(self):
+        """Delete the checkpoint once the run is complete"""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def run(file_ids: List[int], detector_types: List[str], force: bool = False,
+        max_active_jobs: int = DEFAULT_MAX_ACTIVE_JOBS, poll_interval: float = DEFAULT_POLL_INTERVAL,
+        worker_timeout: float = DEFAULT_WORKER_TIMEOUT, on_job: Callable[[List[int], List[int], int], None] = None):
+    """
+    Reprocess files through the detection job queue
+
+    The files are grouped by marker and queued as background jobs, so the
+    inference workers run them with their thread budget, interactive
+    requests keep going ahead, and a marker is never processed by two
+    workers at once. At most `max_active_jobs` jobs of the run are queued or
+    running at a time, so the backfill doesn't fill the queue. Markers that
+    already have an active job are queued again once it has finished.
+
+    If the run's jobs sit in the queue for `worker_timeout` seconds while no
+    job runs anywhere, no worker is taking them and the run gives up.
+
+    Args:
+        file_ids: IDs of the files to reprocess
+        detector_types: Detector types to run
+        force: Replace every result instead of only missing and stale ones
+        max_active_jobs: Jobs of the run queued or running at a time
+        poll_interval: Seconds between two checks of the run's jobs
+        worker_timeout: Seconds to wait for a worker before raising WorkersUnavailable
+        on_job: Called with (finished file IDs, failed file IDs, detections created)
+            for each job that ended
+
+    Raises:
+        KeyboardInterrupt: After cancelling the run's unfinished jobs
+        WorkersUnavailable: After cancelling the run's jobs, if no worker took them
+    """
+    file_ids_by_marker: Dict[int, List[int]] = {}
+    for file_id, marker_id in MarkerFile.objects.filter(id__in=file_ids).order_by('id').values_list('id', 'marker_id'):
+        file_ids_by_marker.setdefault(marker_id, []).append(file_id)
+
+    waiting = list(file_ids_by_marker.items())
+    active: Dict[int, Tuple[int, List[int]]] = {}
+    idle_since = None
+
+    try:
+        while waiting or active:
+            progressed = False
+            for job in DetectionJob.objects.filter(id__in=list(active), status__in=DetectionJob.FINISHED_STATUSES):
+                progressed = True
+                _, job_file_ids = active.pop(job.id)
+                finished, failed, detections = _job_outcome(job, job_file_ids, detector_types)
+                if on_job:
+                    on_job(finished, failed, detections)
+
+            busy = []
+            while waiting and len(active) < max_active_jobs:
+                marker_id, marker_file_ids = waiting.pop(0)
+                job, created = jobs.enqueue_job(
+                    Marker.objects.get(id=marker_id),
+                    detector_types,
+                    incremental=not force,
+                    priority=DetectionJob.PRIORITY_BACKGROUND,
+                    check_limit=False,
+                    file_ids=marker_file_ids
+                )
+                if created:
+                    active[job.id] = (marker_id, marker_file_ids)
+                else:
+                    logger.info(f"Marker {marker_id} already has an active job, queueing its files again later")
+                    busy.append((marker_id, marker_file_ids))
+            waiting.extend(busy)
+
+            if progressed or not active or DetectionJob.objects.filter(status=DetectionJob.STATUS_RUNNING).exists():
+                idle_since = None
+            elif idle_since is None:
+                idle_since = time.monotonic()
+            elif time.monotonic() - idle_since > worker_timeout:
+                raise WorkersUnavailable(f"No detection worker took the queued jobs for {worker_timeout:.0f}s")
+
+            if waiting or active:
+                time.sleep(poll_interval)
+    except (KeyboardInterrupt, WorkersUnavailable):
+        for job in DetectionJob.objects.filter(id__in=list(active)):
+            jobs.cancel_job(job)
+        raise
+
+
+def _job_outcome(job: DetectionJob, file_ids: List[int], detector_types: List[str]) -> Tuple[List[int], List[int], int]:
+    """
+    Split the files of a finished reprocessing job into finished and failed ones
+
+    Returns:
+        Tuple of (finished file IDs, failed file IDs, detections created)
+    """
+    if job.status != DetectionJob.STATUS_DONE:
+        return [], file_ids, 0
+
+    # Pairs that failed are still missing, or hold an error result
+    failed = set(staleness.stale_pairs(MarkerFile.objects.filter(id__in=file_ids), detector_types))
+    finished = [file_id for file_id in file_ids if file_id not in failed]
+    return finished, sorted(failed), (job.result or {}).get('detections', 0)
+
+
+def _init_worker(threads: int):
+    """Set up a local reprocessing process"""
+    from .workers import _configure_threads
+
+    _configure_threads(threads)
+    close_old_connections()
+
+
+def process_chunk(task: Tuple[List[int], List[str], bool]) -> Tuple[List[int], List[int], int]:
+    """
+    Reprocess one chunk of files in the current process
+
+    Args:
+        task: (file IDs, detector types, force). Without `force` only missing and
+            stale pairs are recomputed.
+
+    Returns:
+        Tuple of (finished file IDs, failed file IDs, detections created)
+    """
+    from .main import get_processable_path, process_marker_files_batched, process_stale_files
+
+    file_ids, detector_types, force = task
+    try:
+        marker_files = list(MarkerFile.objects.filter(id__in=file_ids))
+        if force:
+            created = process_marker_files_batched(marker_files, detector_types)
+            # Files whose results could not be saved are missing from `created`
+            failed = {
+                marker_file.id for marker_file in marker_files
+                if marker_file.id not in created and get_processable_path(marker_file) is not None
+            }
+        else:
+            created = process_stale_files(marker_files, detector_types)
+            # Pairs that failed are still missing, or hold an error result
+            failed = set(staleness.stale_pairs(marker_files, detector_types))
+    except Exception as e:
+        logger.error(f"Error reprocessing files {file_ids[0]}-{file_ids[-1]}: {str(e)}")
+        logger.error(traceback.format_exc())
+        return [], file_ids, 0
+
+    finished = [file_id for file_id in file_ids if file_id not in failed]
+    return finished, sorted(failed), sum(len(detections) for detections in created.values())
+
+
+def run_local(file_ids: List[int], detector_types: List[str], processes: int = 1,
+              chunk_size: int = DEFAULT_CHUNK_SIZE, force: bool = False,
+              on_job: Callable[[List[int], List[int], int], None] = None):
+    """
+    Reprocess files in local processes instead of through the job queue
+
+    For when no inference workers run, e.g. a one-off backfill on a machine
+    of its own. Each process loads the models once and keeps them for all
+    the chunks it gets.
+
+    Args:
+        file_ids: IDs of the files to reprocess
+        detector_types: Detector types to run
+        processes: Number of processes (1 runs in the calling process)
+        chunk_size: Files per chunk
+        force: Replace every result instead of only missing and stale ones
+        on_job: Called with (finished file IDs, failed file IDs, detections created) per chunk
+    """
+    chunks = [
+        (file_ids[offset:offset + chunk_size], detector_types, force)
+        for offset in range(0, len(file_ids), chunk_size)
+    ]
+
+    if processes <= 1:
+        for chunk in chunks:
+            result = process_chunk(chunk)
+            if on_job:
+                on_job(*result)
+        return
+
+    threads = max(1, (os.cpu_count() or 1) // processes)
+
+    # Forked processes must not share the parent's database connections
+    connections.close_all()
+
+    with multiprocessing.Pool(processes, initializer=_init_worker, initargs=(threads,)) as pool:
+        for result in pool.imap_unordered(process_chunk, chunks):
+            if on_job:
+                on_job(*result)
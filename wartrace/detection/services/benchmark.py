@@ -0,0 +1,369 @@
+import json
+import logging
+import os
+import platform
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.test import override_settings
+
+from content.models import Marker, MarkerFile
+from .timing import percentiles
+
+logger = logging.getLogger(__name__)
+
+# Image sizes (width, height) and objects per model input benchmarked by default
+DEFAULT_RESOLUTIONS = [(640, 480), (1920, 1080), (4000, 3000)]
+DEFAULT_DENSITIES = [0, 10, 100]
+
+# Timed runs per case, after one untimed warm-up run
+DEFAULT_REPEATS = 15
+
+# A case regresses when its median run slows down by more than this fraction and this many
+# milliseconds
+DEFAULT_TOLERANCE = 0.25
+MIN_REGRESSION_MS = 2.0
+
+# Bump when cases change meaning, so old baselines are not compared against
+BENCHMARK_VERSION = 1
+
+# Report metadata that must match for timings to be comparable at all
+COMPARABLE_META = ('version', 'models', 'machine', 'cpu_count')
+
+
+class _StubBoxes:
+    """The parts of ultralytics' Boxes the pipeline reads"""
+
+    def __init__(self, xyxy: np.ndarray, conf: np.ndarray, cls: np.ndarray):
+        self.xyxy = xyxy
+        self.conf = conf
+        self.cls = cls
+
+
+class _StubResult:
+    """The parts of an ultralytics result the pipeline reads"""
+
+    def __init__(self, boxes: _StubBoxes, names: Dict[int, str]):
+        self.boxes = boxes
+        self.names = names
+
+
+class StubDetector:
+    """
+    Stand-in for a YOLO model that returns a fixed number of boxes per input
+
+    Boxes are spread over the input deterministically, so runs are comparable
+    and the cost measured is the pipeline's own, not a model's.
+    """
+
+    def __init__(self, density: int, classes: List[str] = None):
+        self.density = density
+        self.names = dict(enumerate(classes or [f"class_{i}" for i in range(10)]))
+
+    def __call__(self, source: List[np.ndarray], **kwargs) -> List[_StubResult]:
+        rng = np.random.default_rng(self.density)
+        results = []
+        for array in source:
+            h, w = array.shape[:2]
+            x1 = rng.uniform(0, w * 0.9, self.density)
+            y1 = rng.uniform(0, h * 0.9, self.density)
+            xyxy = np.stack([x1, y1, x1 + w * 0.08, y1 + h * 0.08], axis=1).astype(np.float32)
+            boxes = _StubBoxes(
+                xyxy.reshape(-1, 4),
+                rng.uniform(0.4, 1.0, self.density).astype(np.float32),
+                rng.integers(0, len(self.names), self.density).astype(np.float32)
+            )
+            results.append(_StubResult(boxes, self.names))
+        return results
+
+
+class StubClassifier:
+    """Stand-in for a Keras classifier returning fixed probabilities"""
+
+    input_shape = (None, 224, 224, 3)
+
+    def __init__(self, labels: List[str]):
+        self.probabilities = np.linspace(1.0, 2.0, len(labels), dtype=np.float32)
+        self.probabilities /= self.probabilities.sum()
+
+    def predict(self, inputs: np.ndarray, batch_size: int = None, verbose: int = 0) -> np.ndarray:
+        return np.tile(self.probabilities, (len(inputs), 1))
+
+
+def synthetic_image(width: int, height: int, seed: int = 0) -> np.ndarray:
+    """
+    Draw a photo-like BGR test image
+
+    Smooth gradients with shapes and mild noise compress like real photos,
+    unlike pure noise, so JPEG encoding times are representative.
+    """
+    rng = np.random.default_rng(seed)
+    xs = np.linspace(0, 255, width, dtype=np.float32)
+    ys = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    img = np.empty((height, width, 3), dtype=np.uint8)
+    img[..., 0] = (xs * 0.6 + ys * 0.4).astype(np.uint8)
+    img[..., 1] = (255 - xs * 0.5 - ys * 0.3).clip(0, 255).astype(np.uint8)
+    img[..., 2] = (ys * 0.8).astype(np.uint8)
+
+    for _ in range(40):
+        x, y = int(rng.integers(0, width)), int(rng.integers(0, height))
+        size = int(rng.integers(min(width, height) // 40 + 1, min(width, height) // 8 + 2))
+        color = tuple(int(c) for c in rng.integers(0, 256, 3))
+        cv2.rectangle(img, (x, y), (x + size, y + size), color, -1)
+
+    noise = rng.integers(-8, 9, img.shape, dtype=np.int16)
+    return (img.astype(np.int16) + noise).clip(0, 255).astype(np.uint8)
+
+
+def synthetic_detections(width: int, height: int, density: int, labels: List[str]) -> List[Dict[str, Any]]:
+    """Return `density` detections in the pipeline's result format spread over an image"""
+    rng = np.random.default_rng(density)
+    detections = []
+    for index in range(density):
+        x1, y1 = float(rng.uniform(0, width * 0.9)), float(rng.uniform(0, height * 0.9))
+        detections.append({
+            'label': labels[index % len(labels)],
+            'confidence': float(rng.uniform(0.4, 1.0)),
+            'bbox': [x1, y1, x1 + width * 0.08, y1 + height * 0.08]
+        })
+    return detections
+
+
+def measure(fn: Callable[[], Any], repeats: int = DEFAULT_REPEATS) -> Dict[str, float]:
+    """
+    Time a callable
+
+    Returns:
+        p50/p95/p99, mean and min in milliseconds, and the number of timed runs
+    """
+    fn()  # Warm-up: lazy imports, letterbox buffers, model caches
+
+    durations = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - start)
+
+    stats = percentiles(durations)
+    stats['mean'] = round(float(np.mean(durations)) * 1000, 2)
+    stats['min'] = round(float(np.min(durations)) * 1000, 2)
+    stats['runs'] = repeats
+    return stats
+
+
+def available_real_models(detector_types: List[str]) -> List[str]:
+    """Return the detector types whose weights are on disk and load"""
+    from .main import model_service
+
+    available = []
+    for detector_type in detector_types:
+        model_name, config = model_service.resolve_model(detector_type)
+        if model_name is None or not os.path.exists(config['model_path']):
+            continue
+        if model_service.get_model(detector_type, model_name):
+            available.append(detector_type)
+    return available
+
+
+@contextmanager
+def stub_models(detector_types: List[str], density: int):
+    """
+    Serve stub models for the detector types from the model service
+
+    Models the service had loaded before are put back afterwards.
+    """
+    from .main import model_service, _is_classifier
+
+    replaced = {}
+    for detector_type in detector_types:
+        model_name, config = model_service.resolve_model(detector_type)
+        if model_name is None:
+            continue
+        model_key = f"{detector_type}_{model_name}"
+        model = StubClassifier(config['labels']) if _is_classifier(config) else StubDetector(density, config.get('classes'))
+        replaced[model_key] = model_service.loaded_models.get(model_key)
+        model_service.loaded_models[model_key] = {'model': model, 'config': config}
+
+    try:
+        yield
+    finally:
+        for model_key, previous in replaced.items():
+            if previous is None:
+                model_service.loaded_models.pop(model_key, None)
+            else:
+                model_service.loaded_models[model_key] = previous
+
+
+@contextmanager
+def scratch_marker_file(path: str):
+    """
+    Provide a MarkerFile for an image, rolled back with everything saved for it
+
+    Only meant for timing persistence: the rows never commit and the copied
+    upload is deleted afterwards.
+    """
+    with transaction.atomic():
+        user = User.objects.create(username=f"benchmark-{os.getpid()}-{time.time_ns()}")
+        marker = Marker.objects.create(user=user, title='Benchmark', description='Detection benchmark')
+        marker_file = MarkerFile(marker=marker)
+        with open(path, 'rb') as f:
+            marker_file.file.save(os.path.basename(path), ContentFile(f.read()), save=True)
+        try:
+            yield marker_file
+        finally:
+            marker_file.file.delete(save=False)
+            transaction.set_rollback(True)
+
+
+def run(detector_types: List[str], resolutions: List[Tuple[int, int]] = None, densities: List[int] = None,
+        repeats: int = DEFAULT_REPEATS, real_models: bool = False,
+        on_case: Callable[[str, Dict[str, float]], None] = None) -> Dict[str, Any]:
+    """
+    Benchmark the detection hot path on synthetic images
+
+    Cases, per resolution (and per density where it matters):
+
+    - `process_image/<detector>`: decode, inference and result building with
+      the result cache off
+    - `annotate`: `_draw_modern_annotations` with `density` boxes
+    - `encode`: JPEG encoding of the annotated image
+    - `persist`: `process_marker_file` including the database writes, rolled back
+
+    With stub models the density is the number of boxes each model input
+    returns; real models find whatever is in the synthetic image, so density
+    only applies to the annotation cases.
+
+    Args:
+        detector_types: Detector types to benchmark
+        resolutions: (width, height) pairs
+        densities: Objects per image
+        repeats: Timed runs per case
+        real_models: Use the configured weights (detector types without weights are skipped)
+        on_case: Called with (case name, stats) as each case finishes
+
+    Returns:
+        Report with the environment in `meta` and stats per case name in `cases`
+    """
+    from .main import model_service, process_marker_file
+
+    resolutions = resolutions or DEFAULT_RESOLUTIONS
+    densities = densities if densities is not None else DEFAULT_DENSITIES
+    if real_models:
+        detector_types = available_real_models(detector_types)
+        densities_for_models = [None] if detector_types else []
+    else:
+        densities_for_models = densities
+
+    report = {
+        'meta': {
+            'version': BENCHMARK_VERSION,
+            'models': 'real' if real_models else 'stub',
+            'detector_types': detector_types,
+            'repeats': repeats,
+            'python': platform.python_version(),
+            'opencv': cv2.__version__,
+            'machine': platform.machine(),
+            'cpu_count': os.cpu_count(),
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'cases': {}
+    }
+
+    def record(name: str, fn: Callable[[], Any]):
+        stats = measure(fn, repeats)
+        report['cases'][name] = stats
+        if on_case:
+            on_case(name, stats)
+
+    workdir = tempfile.mkdtemp(prefix='detection-benchmark-')
+    try:
+        # Fresh results on every run, and no stored overlays except where timed explicitly
+        with override_settings(DETECTION_RESULT_CACHE={'enabled': False}, DETECTION_RENDERING={'eager': False}):
+            for width, height in resolutions:
+                size = f"{width}x{height}"
+                img = synthetic_image(width, height)
+                path = os.path.join(workdir, f"{size}.jpg")
+                cv2.imwrite(path, img)
+
+                for density in densities:
+                    detections = synthetic_detections(width, height, density, ['person', 'car', 'military_vehicle'])
+                    annotated = model_service._draw_modern_annotations(img, detections, 'object_detection')
+                    record(f"annotate/{size}/d{density}",
+                           lambda: model_service._draw_modern_annotations(img, detections, 'object_detection'))
+                    record(f"encode/{size}/d{density}", lambda: cv2.imencode('.jpg', annotated))
+
+                for density in densities_for_models:
+                    suffix = f"/d{density}" if density is not None else ''
+                    with stub_models(detector_types, density) if not real_models else nullcontext():
+                        for detector_type in detector_types:
+                            record(f"process_image/{detector_type}/{size}{suffix}",
+                                   lambda: model_service.process_image(path, [detector_type]))
+
+                        with scratch_marker_file(path) as marker_file:
+                            record(f"persist/{size}{suffix}", lambda: process_marker_file(marker_file, detector_types))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return report
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float = DEFAULT_TOLERANCE,
+            min_delta_ms: float = MIN_REGRESSION_MS) -> List[Dict[str, Any]]:
+    """
+    Find the cases that got slower than the baseline
+
+    Args:
+        report: Result of `run`
+        baseline: A report saved earlier
+        tolerance: Allowed growth of the median run as a fraction of the baseline
+        min_delta_ms: Growth below this many milliseconds is treated as noise
+
+    Returns:
+        One entry per regressed case with both medians and the ratio
+
+    Raises:
+        ValueError: If the baseline was recorded with another benchmark version or model kind,
+            or on another kind of machine
+    """
+    for key in COMPARABLE_META:
+        if report['meta'].get(key) != baseline.get('meta', {}).get(key):
+            raise ValueError(
+                f"Baseline {key} {baseline.get('meta', {}).get(key)!r} does not match {report['meta'].get(key)!r}"
+            )
+
+    regressions = []
+    for name, stats in sorted(report['cases'].items()):
+        previous = baseline['cases'].get(name)
+        if not previous:
+            continue
+        delta = stats['p50'] - previous['p50']
+        if delta > min_delta_ms and stats['p50'] > previous['p50'] * (1 + tolerance):
+            regressions.append({
+                'case': name,
+                'baseline_p50': previous['p50'],
+                'p50': stats['p50'],
+                'ratio': round(stats['p50'] / previous['p50'], 2) if previous['p50'] else None,
+            })
+    return regressions
+
+
+def load_report(path: str) -> Optional[Dict[str, Any]]:
+    """Read a saved report, None if the file does not exist"""
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_report(report: Dict[str, Any], path: str):
+    """Write a report as indented JSON"""
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
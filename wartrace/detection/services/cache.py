@@ -0,0 +1,195 @@
+import hashlib
+import json
+import logging
+import os
+import traceback
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import IntegrityError
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from ..models import DetectionCacheEntry
+from .images import hash_file
+
+logger = logging.getLogger(__name__)
+
+# Defaults for settings.DETECTION_RESULT_CACHE
+CACHE_DEFAULTS = {
+    'enabled': True,
+    'max_entries': 10000,   # Evict least recently used entries above this count
+    'max_size_mb': 2048,    # ... or above this total size of stored images
+}
+
+
+def get_cache_settings() -> Dict[str, Any]:
+    """Return the result cache settings merged over the defaults"""
+    cache_settings = dict(CACHE_DEFAULTS)
+    cache_settings.update(getattr(settings, 'DETECTION_RESULT_CACHE', {}))
+    return cache_settings
+
+
+def get_model_hash(model_name: str, config: Dict) -> str:
+    """
+    Return a hash identifying the weights a model was loaded from
+
+    Falls back to the model name when the weights are not on disk
+    (ultralytics downloads them by name in that case).
+    """
+    model_path = config.get('model_path')
+    if model_path and os.path.exists(model_path):
+        return hash_file(model_path)
+    return hashlib.sha256(model_name.encode()).hexdigest()
+
+
+def _params_parts(model_name: str, config: Dict) -> list:
+    """The model and parameters that determine a result, as strings"""
+    return [
+        model_name,
+        get_model_hash(model_name, config),
+        f"{config.get('threshold', 0.30):.4f}",
+        f"{config.get('iou', 0.45):.4f}",
+        str(config.get('imgsz', '')),
+        json.dumps(config.get('tiling') or {}, sort_keys=True),
+        json.dumps(config.get('crops') or {}, sort_keys=True),
+    ]
+
+
+def make_cache_key(content_hash: str, detector_type: str, model_name: str, config: Dict) -> str:
+    """Build the cache key for an image/model/parameters combination"""
+    parts = [content_hash, detector_type] + _params_parts(model_name, config)
+    return hashlib.sha256('|'.join(parts).encode()).hexdigest()
+
+
+def params_key(model_name: str, config: Dict) -> str:
+    """
+    Return a hash of the model weights and every parameter affecting its results
+
+    Stored with each Detection, so results computed with other weights or
+    thresholds can be found later.
+    """
+    return hashlib.sha256('|'.join(_params_parts(model_name, config)).encode()).hexdigest()
+
+
+def lookup(content_hash: str, detector_type: str, model_name: str, config: Dict, output_filename: str) -> Optional[Dict]:
+    """
+    Return a cached result in the `process_image` result format, or None on a miss
+
+    Args:
+        content_hash: SHA-256 of the image file
+        detector_type: Detector type the result is for
+        model_name: Model that would process the image
+        config: Model configuration (thresholds, weights path)
+        output_filename: File name to give the annotated image for this file
+    """
+    if not get_cache_settings()['enabled']:
+        return None
+
+    cache_key = make_cache_key(content_hash, detector_type, model_name, config)
+    entry = DetectionCacheEntry.objects.filter(cache_key=cache_key).first()
+    if entry is None:
+        return None
+
+    annotated_image_content = None
+    if entry.annotated_image:
+        try:
+            with entry.annotated_image.open('rb') as f:
+                annotated_image_content = ContentFile(f.read(), name=output_filename)
+        except (FileNotFoundError, OSError):
+            # The stored image is gone, treat the entry as a miss and drop it
+            logger.warning(f"Cached image missing for entry {entry.id}, discarding it")
+            entry.delete()
+            return None
+
+    DetectionCacheEntry.objects.filter(id=entry.id).update(hits=F('hits') + 1, last_used_at=timezone.now())
+    logger.info(f"Result cache hit for {detector_type} on {content_hash[:12]}")
+
+    return {
+        'detections': entry.detections,
+        'classifications': entry.classifications,
+        'relative_path': f"detection_results/{detector_type}/{output_filename}",
+        'summary': entry.summary,
+        'inference_time': 0.0,
+        'annotated_image_content': annotated_image_content,
+        'output_filename': output_filename,
+        'cached': True
+    }
+
+
+def store(content_hash: str, detector_type: str, model_name: str, config: Dict, result: Dict):
+    """
+    Save a fresh model result in the cache and evict old entries if over the bounds
+
+    Error results are never cached.
+    """
+    if not get_cache_settings()['enabled'] or result.get('error'):
+        return
+
+    cache_key = make_cache_key(content_hash, detector_type, model_name, config)
+    entry = DetectionCacheEntry(
+        cache_key=cache_key,
+        content_hash=content_hash,
+        detector_type=detector_type,
+        model_name=model_name,
+        model_hash=get_model_hash(model_name, config),
+        confidence_threshold=config.get('threshold', 0.30),
+        iou_threshold=config.get('iou', 0.45),
+        detections=result.get('detections', []),
+        classifications=result.get('classifications', []),
+        summary=result.get('summary', '')
+    )
+
+    try:
+        annotated_image_content = result.get('annotated_image_content')
+        if annotated_image_content is not None:
+            annotated_image_content.seek(0)
+            image_bytes = annotated_image_content.read()
+            annotated_image_content.seek(0)
+            entry.size_bytes = len(image_bytes)
+            entry.annotated_image.save(f"{cache_key}.jpg", ContentFile(image_bytes), save=False)
+
+        entry.save()
+    except IntegrityError:
+        # Another worker cached the same result first
+        if entry.annotated_image:
+            entry.annotated_image.delete(save=False)
+        return
+    except Exception as e:
+        logger.error(f"Error storing result in cache: {str(e)}")
+        logger.error(traceback.format_exc())
+        return
+
+    evict()
+
+
+def evict() -> int:
+    """
+    Delete least recently used entries until the cache is within its bounds
+
+    Returns:
+        Number of entries evicted
+    """
+    cache_settings = get_cache_settings()
+    max_entries = cache_settings['max_entries']
+    max_bytes = cache_settings['max_size_mb'] * 1024 * 1024
+
+    count = DetectionCacheEntry.objects.count()
+    total_bytes = DetectionCacheEntry.objects.aggregate(total=Sum('size_bytes'))['total'] or 0
+    if count <= max_entries and total_bytes <= max_bytes:
+        return 0
+
+    evicted = 0
+    for entry in DetectionCacheEntry.objects.order_by('last_used_at').iterator():
+        if count <= max_entries and total_bytes <= max_bytes:
+            break
+        if entry.annotated_image:
+            entry.annotated_image.delete(save=False)
+        entry.delete()
+        count -= 1
+        total_bytes -= entry.size_bytes
+        evicted += 1
+
+    logger.info(f"Evicted {evicted} result cache entries")
+    return evicted
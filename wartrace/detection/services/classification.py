@@ -0,0 +1,138 @@
+import logging
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from . import tiling
+
+logger = logging.getLogger(__name__)
+
+# Defaults for the per-detector 'crops' configuration of classifiers
+CROP_DEFAULTS = {
+    'source': 'image',   # 'image' (whole frame), 'tiles' (grid of patches) or a detector type whose boxes are classified
+    'labels': [],        # With a detector source, only classify boxes with these labels (empty = all)
+    'tile_size': 256,    # With 'tiles', side of each patch in original image pixels
+    'overlap': 0.0,      # With 'tiles', fraction of a patch shared with its neighbours
+    'padding': 0.1,      # Context added around detector boxes, as a fraction of the box size
+    'min_size': 8,       # Skip boxes smaller than this many pixels on a side
+}
+
+# Per-channel normalisation applied after scaling pixels to 0-1 (RGB order)
+IMAGENET_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+IMAGENET_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+
+
+def get_crop_settings(config: Dict) -> Dict:
+    """Return a classifier's crop configuration merged over the defaults"""
+    crops = dict(CROP_DEFAULTS)
+    crops.update(config.get('crops') or {})
+    return crops
+
+
+def crop_boxes(image_shape: Tuple[int, ...], crops: Dict, source_detections: Optional[List[Dict]] = None) -> np.ndarray:
+    """
+    Compute the regions of an image to classify
+
+    Args:
+        image_shape: Shape of the decoded image
+        crops: Crop settings from `get_crop_settings`
+        source_detections: Detections of the source detector, when crops come from boxes.
+            If the source detector didn't run on this image, the whole image is used.
+
+    Returns:
+        Nx4 int array of (x1, y1, x2, y2) regions
+    """
+    height, width = image_shape[:2]
+    whole_image = np.array([[0, 0, width, height]])
+
+    if crops['source'] == 'image':
+        return whole_image
+
+    if crops['source'] == 'tiles':
+        return tiling.tile_grid(height, width, int(crops['tile_size']), crops['overlap'])
+
+    if source_detections is None:
+        logger.info(f"No {crops['source']} results for this image, classifying the whole image")
+        return whole_image
+
+    labels = {label.lower() for label in crops['labels']}
+    boxes = np.array(
+        [det['bbox'] for det in source_detections if not labels or det['label'].lower() in labels],
+        dtype=np.float64
+    ).reshape(-1, 4)
+
+    # Grow boxes by the padding so the classifier sees some context
+    pad = (boxes[:, 2:] - boxes[:, :2]) * crops['padding']
+    boxes[:, :2] -= pad
+    boxes[:, 2:] += pad
+    boxes = np.round(boxes).astype(int)
+    boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, width)
+    boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, height)
+
+    sizes = boxes[:, 2:] - boxes[:, :2]
+    return boxes[(sizes >= crops['min_size']).all(axis=1)]
+
+
+def source_detector(crops: Dict) -> Optional[str]:
+    """Return the detector type whose boxes are classified, if crops come from a detector"""
+    return None if crops['source'] in ('image', 'tiles') else crops['source']
+
+
+def fill_batch(regions: List[Tuple[np.ndarray, np.ndarray]], batch: np.ndarray):
+    """
+    Resize image regions into the rows of a preallocated uint8 batch
+
+    Args:
+        regions: (HxWx3 BGR image, (x1, y1, x2, y2)) pairs, at most len(batch)
+        batch: B x h x w x 3 uint8 buffer, written in place
+    """
+    input_h, input_w = batch.shape[1:3]
+    for index, (array, (x1, y1, x2, y2)) in enumerate(regions):
+        crop = array[y1:y2, x1:x2]
+        interpolation = cv2.INTER_AREA if crop.shape[0] > input_h else cv2.INTER_LINEAR
+        cv2.resize(crop, (input_w, input_h), dst=batch[index], interpolation=interpolation)
+
+
+def preprocess(batch: np.ndarray, mode: str = 'rescale') -> np.ndarray:
+    """
+    Convert a uint8 BGR batch into the classifier input in one vectorized step
+
+    Args:
+        batch: NxHxWx3 uint8 BGR crops
+        mode: 'rescale' (RGB scaled to 0-1), 'imagenet' (0-1 then mean/std
+            normalised) or 'none' (RGB as float 0-255)
+
+    Returns:
+        NxHxWx3 float32 RGB array
+    """
+    inputs = batch[..., ::-1].astype(np.float32)
+    if mode == 'none':
+        return inputs
+
+    inputs *= 1.0 / 255
+    if mode == 'imagenet':
+        inputs -= IMAGENET_MEAN
+        inputs /= IMAGENET_STD
+    return inputs
+
+
+def summarize(probabilities: np.ndarray, labels: List[str]) -> List[Dict]:
+    """
+    Aggregate per-crop class probabilities into image-level classifications
+
+    Returns:
+        One entry per label with the mean probability over all crops and the
+        number of crops whose top class it is, highest mean first
+    """
+    if not len(probabilities):
+        return []
+
+    mean = probabilities.mean(axis=0)
+    top_counts = np.bincount(probabilities.argmax(axis=1), minlength=len(labels))
+
+    classifications = [
+        {'label': label, 'confidence': float(mean[index]), 'crops': int(top_counts[index])}
+        for index, label in enumerate(labels)
+    ]
+    return sorted(classifications, key=lambda c: -c['confidence'])
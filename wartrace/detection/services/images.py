@@ -0,0 +1,236 @@
+import hashlib
+import logging
+import os
+import struct
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Padding colour used by ultralytics for letterboxing
+LETTERBOX_COLOR = (114, 114, 114)
+
+# Size of the chunks read while hashing files
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Hashes of files already read in this process, keyed by (path, size, mtime)
+_file_hashes: Dict[tuple, str] = {}
+_MAX_MEMOIZED_HASHES = 4096
+
+
+def hash_file(file_path: str) -> str:
+    """
+    Return the SHA-256 of a file's contents
+
+    Hashes are memoized per (path, size, mtime), so a file is read at most
+    once per process unless it changes.
+    """
+    stat = os.stat(file_path)
+    memo_key = (file_path, stat.st_size, stat.st_mtime_ns)
+    if memo_key in _file_hashes:
+        return _file_hashes[memo_key]
+
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+
+    if len(_file_hashes) >= _MAX_MEMOIZED_HASHES:
+        _file_hashes.clear()
+    _file_hashes[memo_key] = digest.hexdigest()
+    return _file_hashes[memo_key]
+
+
+def read_image_size(file_path: str) -> Optional[Tuple[int, int]]:
+    """
+    Read the (width, height) of an image from its header without decoding it
+
+    Supports JPEG, PNG, BMP, WebP and TIFF.
+
+    Returns:
+        The size, or None if the format is not recognised or the header is damaged
+    """
+    try:
+        with open(file_path, 'rb') as f:
+            head = f.read(32)
+            if head.startswith(b'\x89PNG\r\n\x1a\n'):
+                return struct.unpack('>II', head[16:24])
+            if head.startswith(b'BM'):
+                width, height = struct.unpack('<ii', head[18:26])
+                return width, abs(height)
+            if head.startswith(b'RIFF') and head[8:12] == b'WEBP':
+                chunk = head[12:16]
+                if chunk == b'VP8X':
+                    return (int.from_bytes(head[24:27], 'little') + 1,
+                            int.from_bytes(f.read(3), 'little') + 1)
+                if chunk == b'VP8L':
+                    bits = int.from_bytes(head[21:25], 'little')
+                    return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+                if chunk == b'VP8 ':
+                    data = head + f.read(2)
+                    width, height = struct.unpack('<HH', data[26:30])
+                    return width & 0x3FFF, height & 0x3FFF
+                return None
+            if head[:4] in (b'II*\x00', b'MM\x00*'):
+                return _read_tiff_size(f, '<' if head[:2] == b'II' else '>', head)
+            if head.startswith(b'\xff\xd8'):
+                return _read_jpeg_size(f)
+    except (OSError, struct.error, ValueError):
+        return None
+    return None
+
+
+def _read_tiff_size(f, order: str, head: bytes) -> Optional[Tuple[int, int]]:
+    """Read ImageWidth and ImageLength from a TIFF's first directory"""
+    f.seek(struct.unpack(order + 'I', head[4:8])[0])
+    size = {}
+    for _ in range(struct.unpack(order + 'H', f.read(2))[0]):
+        tag, kind, _, value = struct.unpack(order + 'HHI4s', f.read(12))
+        if tag in (256, 257):
+            size[tag] = struct.unpack(order + ('H' if kind == 3 else 'I'), value[:2 if kind == 3 else 4])[0]
+    return (size[256], size[257]) if len(size) == 2 else None
+
+
+def _read_jpeg_size(f) -> Optional[Tuple[int, int]]:
+    """Find the frame header of a JPEG and read its size"""
+    f.seek(2)
+    while True:
+        marker = f.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            return None
+        # Start of frame markers, except DHT (C4), JPG (C8) and DAC (CC)
+        if 0xC0 <= marker[1] <= 0xCF and marker[1] not in (0xC4, 0xC8, 0xCC):
+            _, _, height, width = struct.unpack('>HBHH', f.read(7))
+            return width, height
+        length = struct.unpack('>H', f.read(2))[0]
+        f.seek(length - 2, os.SEEK_CUR)
+
+
+def decode_image(file_path: str) -> np.ndarray:
+    """
+    Decode an image file into a BGR NumPy array
+
+    Reads the raw bytes with NumPy so that paths with non-ASCII characters
+    (common in uploaded file names) decode the same way on every platform.
+
+    Args:
+        file_path: Path to the image file
+
+    Returns:
+        HxWx3 uint8 array in BGR order
+    """
+    data = np.fromfile(file_path, dtype=np.uint8)
+    img = cv2.imdecode(data, cv2.IMREAD_COLOR)
+    if img is None:
+        logger.error(f"Failed to read image: {file_path}")
+        raise ValueError(f"Could not read image file: {file_path}")
+    return img
+
+
+class DecodedImage:
+    """
+    An image decoded once and shared by every detector and the annotator
+
+    Letterboxed copies are cached per target size, so detectors that share an
+    input size also share the resize work. Detectors running in parallel
+    threads can share an instance: the image is decoded and letterboxed once.
+    """
+
+    def __init__(self, file_path: str, array: np.ndarray = None):
+        self.file_path = file_path
+        self._array = array
+        self._content_hash: Optional[str] = None
+        self._letterboxed: Dict[int, Tuple[np.ndarray, float, Tuple[int, int]]] = {}
+        self._lock = threading.RLock()
+        # Time spent reading and decoding the file, and its size once decoded
+        self.decode_seconds = 0.0
+        self.size: Optional[Tuple[int, int]] = tuple(array.shape[1::-1]) if array is not None else None
+
+    @property
+    def array(self) -> np.ndarray:
+        """The full-resolution BGR pixels, decoded on first access"""
+        if self._array is None:
+            with self._lock:
+                if self._array is None:
+                    start = time.perf_counter()
+                    array = decode_image(self.file_path)
+                    self.decode_seconds += time.perf_counter() - start
+                    self.size = (array.shape[1], array.shape[0])
+                    self._array = array
+        return self._array
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        return self.array.shape
+
+    @property
+    def content_hash(self) -> str:
+        """SHA-256 of the file bytes, computed on first access"""
+        if self._content_hash is None:
+            with self._lock:
+                if self._content_hash is None:
+                    self._content_hash = hash_file(self.file_path)
+        return self._content_hash
+
+    def letterbox(self, target_size: int) -> Tuple[np.ndarray, float, Tuple[int, int]]:
+        """
+        Resize keeping the aspect ratio and pad to a square of `target_size`
+
+        Args:
+            target_size: Side of the square model input in pixels
+
+        Returns:
+            Tuple of (letterboxed array, scale factor, (pad_x, pad_y))
+        """
+        with self._lock:
+            if target_size not in self._letterboxed:
+                h, w = self.array.shape[:2]
+                scale = min(target_size / h, target_size / w)
+                new_w, new_h = int(round(w * scale)), int(round(h * scale))
+
+                # INTER_AREA gives the best quality when shrinking large photos
+                interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR
+                resized = cv2.resize(self.array, (new_w, new_h), interpolation=interpolation)
+
+                pad_x = (target_size - new_w) // 2
+                pad_y = (target_size - new_h) // 2
+                boxed = cv2.copyMakeBorder(
+                    resized,
+                    pad_y, target_size - new_h - pad_y,
+                    pad_x, target_size - new_w - pad_x,
+                    cv2.BORDER_CONSTANT,
+                    value=LETTERBOX_COLOR
+                )
+                self._letterboxed[target_size] = (boxed, scale, (pad_x, pad_y))
+
+        return self._letterboxed[target_size]
+
+    def unletterbox_boxes(self, boxes: np.ndarray, target_size: int) -> np.ndarray:
+        """
+        Map xyxy boxes from letterboxed coordinates back to the original image
+
+        Args:
+            boxes: Nx4 array of boxes on the letterboxed input
+            target_size: Size the boxes were predicted at
+
+        Returns:
+            Nx4 float array of boxes in original image pixels
+        """
+        _, scale, (pad_x, pad_y) = self.letterbox(target_size)
+        h, w = self.array.shape[:2]
+
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4).copy()
+        boxes[:, [0, 2]] = (boxes[:, [0, 2]] - pad_x) / scale
+        boxes[:, [1, 3]] = (boxes[:, [1, 3]] - pad_y) / scale
+        boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, w)
+        boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, h)
+        return boxes
+
+    def release(self):
+        """Drop the decoded pixels and cached resizes"""
+        self._array = None
+        self._letterboxed.clear()
@@ -0,0 +1,689 @@
+import logging
+from datetime import timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max, Min, Q, Sum, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from ..models import Detection, DetectionJob
+from .progress import ProcessingAborted
+
+logger = logging.getLogger(__name__)
+
+# Defaults for settings.DETECTION_JOBS
+JOB_DEFAULTS = {
+    'lease_seconds': 600,        # How long a claimed job stays owned without a progress update, at least the batch budget
+    'max_attempts': 3,           # Claims allowed before a job whose worker keeps dying is failed
+    'poll_interval': 1.0,        # Seconds an idle worker waits before looking for new jobs
+    'ttl_hours': 24 * 7,         # How long finished jobs are kept for status lookups
+    'max_queued_files_per_user': 1000,  # Files one user may have waiting in queued jobs (0 = no limit)
+    'max_job_seconds': 3600,     # Time budget of one attempt at a job, checked between batches
+    'max_file_seconds': 120,     # Time budget per file of the batch in progress, enforced by the watchdog
+    'watchdog_grace_seconds': 30,  # Extra time the watchdog allows past the job budget before killing the worker
+}
+
+# Queue wait percentiles reported by `queue_metrics`
+WAIT_PERCENTILES = [50, 95, 99]
+
+# Bounds of the `poll_after` hint sent to the front-end, in seconds
+POLL_QUEUED = 5
+POLL_MIN = 1
+POLL_MAX = 10
+
+
+class JobLeaseLost(ProcessingAborted):
+    """Raised when a worker no longer owns the job it is running"""
+
+
+class JobCancelled(ProcessingAborted):
+    """Raised when a user cancelled the job the worker is running"""
+
+
+class JobDeadlineExceeded(ProcessingAborted):
+    """Raised when a job runs past its time budget"""
+
+
+class QueueLimitExceeded(Exception):
+    """Raised when a user already has as many files queued as they are allowed"""
+
+
+def get_job_settings() -> Dict[str, Any]:
+    """Return the job settings merged over the defaults"""
+    job_settings = dict(JOB_DEFAULTS)
+    job_settings.update(getattr(settings, 'DETECTION_JOBS', {}))
+    return job_settings
+
+
+def default_priority(marker) -> int:
+    """
+    Return the priority class of a user's request to process a marker
+
+    Markers without any results yet were just created and someone is
+    waiting for them; the others are being reprocessed.
+    """
+    if Detection._default_manager.filter(marker_file__marker=marker).exists():
+        return DetectionJob.PRIORITY_REPROCESS
+    return DetectionJob.PRIORITY_INTERACTIVE
+
+
+def enqueue_job(marker, detector_types: List[str], user=None, incremental: bool = True,
+                priority: int = DetectionJob.PRIORITY_INTERACTIVE, check_limit: bool = True,
+                file_ids: List[int] = None) -> Tuple[DetectionJob, bool]:
+    """
+    Queue a marker for processing unless it already has an active job
+
+    Args:
+        marker: Marker instance to process
+        detector_types: List of detector types requested
+        user: User who requested the processing
+        incremental: Only process files whose results are missing or stale
+        priority: Queued jobs with a higher priority are claimed first, see DetectionJob.PRIORITY_CHOICES
+        check_limit: Enforce the user's queued file limit
+        file_ids: Only process these files of the marker instead of all of them
+
+    Returns:
+        Tuple of (job, created). `created` is False when an active job already existed.
+
+    Raises:
+        QueueLimitExceeded: If the user's queued jobs would hold more than `max_queued_files_per_user` files
+    """
+    existing = get_active_job(marker.id)
+    if existing:
+        return existing, False
+
+    files_total = len(file_ids) if file_ids else marker.files.count()
+    if check_limit and user is not None and user.is_authenticated:
+        check_queue_limit(user, files_total)
+
+    try:
+        # The partial unique constraint guarantees one active job per marker even if
+        # two web processes race past the check above
+        with transaction.atomic():
+            job = DetectionJob.objects.create(
+                marker=marker,
+                user=user if user is not None and user.is_authenticated else None,
+                detector_types=detector_types,
+                incremental=incremental,
+                priority=priority,
+                file_ids=list(file_ids or []),
+                files_total=files_total
+            )
+    except IntegrityError:
+        return get_active_job(marker.id), False
+
+    logger.info(f"Queued detection job {job.id} for marker {marker.id} with {detector_types}")
+    return job, True
+
+
+def check_queue_limit(user, files: int):
+    """
+    Make sure a user may queue a job with `files` more files
+
+    A user with nothing queued can always queue one job, however large, so
+    markers with more files than the limit still get processed.
+
+    Raises:
+        QueueLimitExceeded: If the limit would be exceeded
+    """
+    limit = get_job_settings()['max_queued_files_per_user']
+    if not limit:
+        return
+
+    queued_files = DetectionJob.objects.filter(
+        user=user,
+        status=DetectionJob.STATUS_QUEUED
+    ).aggregate(total=Sum('files_total'))['total'] or 0
+    if queued_files and queued_files + files > limit:
+        raise QueueLimitExceeded(
+            f"You already have {queued_files} files waiting for processing (limit {limit}), "
+            f"try again when some of them are done"
+        )
+
+
+def get_active_job(marker_id: int) -> Optional[DetectionJob]:
+    """Return the queued or running job for a marker, if any"""
+    return DetectionJob.objects.filter(
+        marker_id=marker_id,
+        status__in=DetectionJob.ACTIVE_STATUSES
+    ).first()
+
+
+def coalesce_submission(job: DetectionJob, detector_types: List[str], incremental: bool = True,
+                        priority: int = None, file_ids: List[int] = None) -> Optional[str]:
+    """
+    Fold a repeated processing request for a marker into its active job
+
+    A queued job takes over the new detector types and file count, so it
+    processes the marker as it is now, and is raised to the request's
+    priority so a user's save doesn't wait behind background work. A job
+    queued for some of the marker's files is only widened to the whole
+    marker when the request is for the whole marker; otherwise the file
+    sets and detector types are merged. A running job records the request
+    and queues one incremental follow-up job when it finishes (see
+    `queue_followup`), however many requests arrive in the meantime.
+
+    Args:
+        job: The marker's active job
+        detector_types: Detector types of the new request
+        incremental: False turns a queued job into a full reprocess; follow-ups
+            are always incremental
+        priority: Priority of the new request, see DetectionJob.PRIORITY_CHOICES
+        file_ids: Files of the new request (None = the whole marker)
+
+    Returns:
+        'coalesced' or 'followup', or None if the job finished in the meantime
+    """
+    now = timezone.now()
+    fields = {
+        'detector_types': detector_types,
+        'files_total': job.marker.files.count(),
+        'file_ids': [],
+        'incremental': job.incremental and incremental,
+        'updated_at': now,
+    }
+    if file_ids and job.file_ids:
+        from .main import MODEL_CONFIG
+
+        merged_types = set(job.detector_types) | set(detector_types)
+        fields['detector_types'] = [dt for dt in MODEL_CONFIG if dt in merged_types]
+        fields['file_ids'] = sorted(set(job.file_ids) | set(file_ids))
+        fields['files_total'] = len(fields['file_ids'])
+    if priority is not None:
+        fields['priority'] = Greatest('priority', Value(priority))
+
+    if DetectionJob.objects.filter(id=job.id, status=DetectionJob.STATUS_QUEUED).update(**fields):
+        logger.info(f"Coalesced a processing request for marker {job.marker_id} into queued job {job.id}")
+        return 'coalesced'
+
+    if DetectionJob.objects.filter(id=job.id, status=DetectionJob.STATUS_RUNNING).update(
+        followup_detector_types=detector_types,
+        updated_at=now
+    ):
+        logger.info(f"Recorded a follow-up processing request for marker {job.marker_id} on running job {job.id}")
+        return 'followup'
+
+    return None
+
+
+def queue_followup(job: DetectionJob) -> Optional[DetectionJob]:
+    """
+    Queue the follow-up recorded on a finished job by `coalesce_submission`
+
+    The follow-up is incremental, so it only processes files added or
+    replaced while the job was running, and it is not subject to the
+    user's queue limit since the request was already accepted.
+
+    Returns:
+        The queued job, or None if there was no follow-up
+    """
+    detector_types = DetectionJob.objects.filter(id=job.id).values_list('followup_detector_types', flat=True).first()
+    if not detector_types:
+        return None
+
+    DetectionJob.objects.filter(id=job.id).update(followup_detector_types=[])
+    followup, _ = enqueue_job(
+        job.marker, detector_types, job.user, incremental=True, priority=job.priority, check_limit=False
+    )
+    return followup
+
+
+def queue_position(job: DetectionJob) -> Optional[int]:
+    """
+    Return the 1-based position of a queued job, None once it has started
+
+    Counts the queued jobs of a higher priority and the older ones of the
+    same priority. It is an estimate: users take turns within a priority
+    (see `claim_order`), so the real position can be better when older jobs
+    belong to users with many queued jobs, and worse when newer jobs of
+    other users are served first.
+    """
+    if job.status != DetectionJob.STATUS_QUEUED:
+        return None
+    return DetectionJob.objects.filter(status=DetectionJob.STATUS_QUEUED).filter(
+        Q(priority__gt=job.priority) | Q(priority=job.priority, created_at__lt=job.created_at)
+    ).count() + 1
+
+
+def get_latest_job(marker_id: int) -> Optional[DetectionJob]:
+    """Return the most recently created job for a marker, if any"""
+    return DetectionJob.objects.filter(marker_id=marker_id).order_by('-created_at').first()
+
+
+def claim_order(limit: int = 10) -> List[int]:
+    """
+    Return the IDs of the queued jobs a worker should try to claim next, best first
+
+    Only jobs of the highest queued priority are considered. Within it users
+    take turns: users with fewer running jobs come first, then the user
+    served least recently, and each user's oldest job is taken. Jobs without
+    a user (backfills) are treated as one more user.
+
+    Args:
+        limit: Maximum number of job IDs returned
+    """
+    queued = DetectionJob.objects.filter(status=DetectionJob.STATUS_QUEUED)
+    top_priority = queued.aggregate(top=Max('priority'))['top']
+    if top_priority is None:
+        return []
+    queued = queued.filter(priority=top_priority)
+
+    oldest_by_user = dict(
+        queued.order_by().values('user_id').annotate(oldest=Min('created_at')).values_list('user_id', 'oldest')
+    )
+    running_by_user = dict(
+        DetectionJob.objects.filter(status=DetectionJob.STATUS_RUNNING)
+        .order_by().values('user_id').annotate(running=Count('id')).values_list('user_id', 'running')
+    )
+    last_started_by_user = dict(
+        DetectionJob.objects.filter(started_at__isnull=False, user_id__in=[u for u in oldest_by_user if u is not None])
+        .order_by().values('user_id').annotate(last=Max('started_at')).values_list('user_id', 'last')
+    )
+    last_started_by_user[None] = DetectionJob.objects.filter(
+        started_at__isnull=False, user__isnull=True
+    ).aggregate(last=Max('started_at'))['last']
+
+    def turn(user_id):
+        last_started = last_started_by_user.get(user_id)
+        return (
+            running_by_user.get(user_id, 0),
+            last_started.timestamp() if last_started else 0.0,
+            oldest_by_user[user_id].timestamp()
+        )
+
+    job_ids = []
+    for user_id in sorted(oldest_by_user, key=turn)[:limit]:
+        user_jobs = queued.filter(user__isnull=True) if user_id is None else queued.filter(user_id=user_id)
+        job_ids.append(user_jobs.order_by('created_at').values_list('id', flat=True).first())
+    return [job_id for job_id in job_ids if job_id is not None]
+
+
+def claim_next_job(worker_id: str) -> Optional[DetectionJob]:
+    """
+    Atomically take the next queued job in `claim_order` and lease it to a worker
+
+    The claim is a conditional UPDATE on the job's status, so when several
+    workers race for the same job exactly one of them wins.
+
+    Args:
+        worker_id: Identifier of the claiming worker
+
+    Returns:
+        The claimed job, or None if the queue is empty
+    """
+    requeue_expired_jobs()
+
+    job_settings = get_job_settings()
+    for job_id in claim_order():
+        now = timezone.now()
+        claimed = DetectionJob.objects.filter(
+            id=job_id,
+            status=DetectionJob.STATUS_QUEUED
+        ).update(
+            status=DetectionJob.STATUS_RUNNING,
+            worker_id=worker_id,
+            lease_expires_at=now + timedelta(seconds=job_settings['lease_seconds']),
+            deadline_at=now + timedelta(seconds=job_settings['max_job_seconds']),
+            started_at=now,
+            attempts=F('attempts') + 1,
+            updated_at=now
+        )
+        if claimed:
+            logger.info(f"Worker {worker_id} claimed detection job {job_id}")
+            return DetectionJob.objects.get(id=job_id)
+
+    return None
+
+
+def update_progress(job: DetectionJob, progress: Dict[str, Any]):
+    """
+    Record a progress snapshot and extend the worker's lease
+
+    Args:
+        job: The job held by the calling worker
+        progress: Snapshot from ProgressTracker.snapshot()
+
+    Raises:
+        JobLeaseLost: If the lease expired and the job was reclaimed or finished elsewhere
+        JobCancelled: If the job was cancelled
+        JobDeadlineExceeded: If the job ran past its time budget
+    """
+    now = timezone.now()
+    if job.deadline_at and now > job.deadline_at:
+        raise JobDeadlineExceeded(
+            f"Detection job {job.id} exceeded its time budget of {get_job_settings()['max_job_seconds']}s"
+        )
+
+    fields = {
+        'files_done': progress['files_done'],
+        'files_total': progress['files_total'],
+        'units_done': progress['units_done'],
+        'units_total': progress['units_total'],
+        'progress_detail': {
+            key: progress.get(key)
+            for key in ('detectors', 'elapsed_seconds', 'throughput', 'eta_seconds', 'recent_file_ids')
+        },
+    }
+    updated = DetectionJob.objects.filter(
+        id=job.id,
+        worker_id=job.worker_id,
+        status=DetectionJob.STATUS_RUNNING,
+        cancel_requested=False
+    ).update(
+        **fields,
+        # Never shortens a lease `extend_lease` stretched over a long batch
+        lease_expires_at=Greatest(
+            'lease_expires_at', Value(now + timedelta(seconds=get_job_settings()['lease_seconds']))
+        ),
+        updated_at=now
+    )
+    if not updated:
+        _raise_not_held(job)
+
+    for field, value in fields.items():
+        setattr(job, field, value)
+
+
+def extend_lease(job: DetectionJob, batch_files: int):
+    """
+    Extend the worker's lease to cover the batch it is about to run
+
+    The lease lasts at least the batch's watchdog budget (`max_file_seconds`
+    per file plus the grace period), so a slow batch that the watchdog lets
+    run is never requeued to another worker. Called before each batch and
+    after each detector, which also makes a cancel take effect after the
+    detector in progress.
+
+    Args:
+        job: The job held by the calling worker
+        batch_files: Files in the current batch
+
+    Raises:
+        JobLeaseLost: If the lease expired and the job was reclaimed or finished elsewhere
+        JobCancelled: If the job was cancelled
+    """
+    job_settings = get_job_settings()
+    seconds = max(
+        job_settings['lease_seconds'],
+        job_settings['max_file_seconds'] * batch_files + job_settings['watchdog_grace_seconds']
+    )
+    now = timezone.now()
+    updated = DetectionJob.objects.filter(
+        id=job.id,
+        worker_id=job.worker_id,
+        status=DetectionJob.STATUS_RUNNING,
+        cancel_requested=False
+    ).update(
+        lease_expires_at=now + timedelta(seconds=seconds),
+        updated_at=now
+    )
+    if not updated:
+        _raise_not_held(job)
+
+
+def _raise_not_held(job: DetectionJob):
+    """Raise JobCancelled or JobLeaseLost for a job the worker can no longer update"""
+    if DetectionJob.objects.filter(
+        id=job.id, worker_id=job.worker_id, status=DetectionJob.STATUS_RUNNING, cancel_requested=True
+    ).exists():
+        raise JobCancelled(f"Detection job {job.id} was cancelled")
+    raise JobLeaseLost(f"Worker {job.worker_id} lost the lease on detection job {job.id}")
+
+
+def finish_job(job: DetectionJob, status: str, result: Dict[str, Any] = None, error: str = '') -> bool:
+    """
+    Mark a running job as finished
+
+    Args:
+        job: The job held by the calling worker
+        status: One of DetectionJob.FINISHED_STATUSES
+        result: Summary to store with the job
+        error: Error message for failed jobs
+
+    Returns:
+        True if the worker still held the job and the status was recorded
+    """
+    now = timezone.now()
+    updated = DetectionJob.objects.filter(
+        id=job.id,
+        worker_id=job.worker_id,
+        status=DetectionJob.STATUS_RUNNING
+    ).update(
+        status=status,
+        result=result,
+        error=error,
+        lease_expires_at=None,
+        finished_at=now,
+        updated_at=now
+    )
+    if not updated:
+        logger.warning(f"Detection job {job.id} was no longer held by worker {job.worker_id}, result discarded")
+        return False
+
+    job.status = status
+    job.result = result
+    job.error = error
+    job.finished_at = now
+    return True
+
+
+def cancel_job(job: DetectionJob) -> Optional[str]:
+    """
+    Cancel a queued or running job
+
+    A queued job is cancelled right away. A running job is flagged, and its
+    worker stops after the detector in progress and marks it cancelled (see
+    `workers.run_job`). Each file's results are replaced in one transaction,
+    so the files the job finished keep their new results and the others
+    their previous ones. If the worker dies first, the job is cancelled
+    when its lease expires instead of being requeued.
+
+    Returns:
+        'cancelled', 'cancelling', or None if the job had already finished
+    """
+    now = timezone.now()
+    if DetectionJob.objects.filter(id=job.id, status=DetectionJob.STATUS_QUEUED).update(
+        status=DetectionJob.STATUS_CANCELLED,
+        followup_detector_types=[],
+        finished_at=now,
+        updated_at=now
+    ):
+        logger.info(f"Cancelled queued detection job {job.id}")
+        job.refresh_from_db()
+        return 'cancelled'
+
+    if DetectionJob.objects.filter(id=job.id, status=DetectionJob.STATUS_RUNNING).update(
+        cancel_requested=True,
+        followup_detector_types=[],
+        updated_at=now
+    ):
+        logger.info(f"Requested cancellation of running detection job {job.id}")
+        job.refresh_from_db()
+        return 'cancelling'
+
+    return None
+
+
+def fail_worker_jobs(worker_id: str, error: str) -> List[DetectionJob]:
+    """
+    Fail the jobs held by a worker that was killed or crashed
+
+    Jobs that were being cancelled are marked cancelled instead. The
+    follow-ups recorded on the jobs are queued.
+
+    Returns:
+        The finished jobs
+    """
+    finished = []
+    for job in DetectionJob.objects.filter(worker_id=worker_id, status=DetectionJob.STATUS_RUNNING):
+        if job.cancel_requested:
+            finish_job(job, DetectionJob.STATUS_CANCELLED)
+        elif not finish_job(job, DetectionJob.STATUS_FAILED, error=error):
+            continue
+        logger.warning(f"Detection job {job.id} of killed worker {worker_id} finished as {job.status}")
+        queue_followup(job)
+        finished.append(job)
+    return finished
+
+
+def requeue_expired_jobs() -> int:
+    """
+    Return running jobs whose lease expired to the queue, or fail them after too many attempts
+
+    Jobs cancelled while running are marked cancelled instead, so a cancel
+    isn't lost with the worker that should have acted on it.
+
+    Returns:
+        Number of jobs released
+    """
+    job_settings = get_job_settings()
+    now = timezone.now()
+    expired = DetectionJob.objects.filter(
+        status=DetectionJob.STATUS_RUNNING,
+        lease_expires_at__lt=now
+    )
+
+    cancelled = expired.filter(cancel_requested=True).update(
+        status=DetectionJob.STATUS_CANCELLED,
+        lease_expires_at=None,
+        finished_at=now,
+        updated_at=now
+    )
+    expired = expired.filter(cancel_requested=False)
+
+    failed = expired.filter(attempts__gte=job_settings['max_attempts']).update(
+        status=DetectionJob.STATUS_FAILED,
+        error='Worker stopped responding too many times',
+        lease_expires_at=None,
+        finished_at=now,
+        updated_at=now
+    )
+    requeued = expired.filter(attempts__lt=job_settings['max_attempts']).update(
+        status=DetectionJob.STATUS_QUEUED,
+        worker_id='',
+        lease_expires_at=None,
+        updated_at=now
+    )
+
+    if failed or requeued or cancelled:
+        logger.warning(f"Released expired detection jobs: {requeued} requeued, {failed} failed, {cancelled} cancelled")
+    return failed + requeued + cancelled
+
+
+def cleanup_finished_jobs() -> int:
+    """
+    Delete finished jobs older than the configured TTL
+
+    Returns:
+        Number of jobs deleted
+    """
+    cutoff = timezone.now() - timedelta(hours=get_job_settings()['ttl_hours'])
+    deleted, _ = DetectionJob.objects.filter(
+        status__in=DetectionJob.FINISHED_STATUSES,
+        finished_at__lt=cutoff
+    ).delete()
+    if deleted:
+        logger.info(f"Deleted {deleted} finished detection jobs older than {cutoff}")
+    return deleted
+
+
+def queue_metrics(hours: int = 24) -> List[Dict[str, Any]]:
+    """
+    Summarize the queue per priority class
+
+    Args:
+        hours: Window for the wait times of jobs that started
+
+    Returns:
+        One entry per priority class with the jobs and files queued now, the
+        age of the oldest queued job, and the p50/p95/p99 of how long the jobs
+        started in the window waited for a worker, in seconds
+    """
+    now = timezone.now()
+    since = now - timedelta(hours=hours)
+
+    metrics = []
+    for priority, label in DetectionJob.PRIORITY_CHOICES:
+        queued = DetectionJob.objects.filter(status=DetectionJob.STATUS_QUEUED, priority=priority).aggregate(
+            jobs=Count('id'), files=Sum('files_total'), users=Count('user', distinct=True), oldest=Min('created_at')
+        )
+        waits = [
+            (started_at - created_at).total_seconds()
+            for created_at, started_at in DetectionJob.objects.filter(
+                priority=priority, started_at__gte=since
+            ).values_list('created_at', 'started_at')
+        ]
+
+        entry = {
+            'priority': priority,
+            'class': label,
+            'queued_jobs': queued['jobs'],
+            'queued_files': queued['files'] or 0,
+            'queued_users': queued['users'],
+            'oldest_queued_seconds': round((now - queued['oldest']).total_seconds(), 1) if queued['oldest'] else None,
+            'started_jobs': len(waits),
+        }
+        points = np.percentile(waits, WAIT_PERCENTILES) if waits else [None] * len(WAIT_PERCENTILES)
+        for q, value in zip(WAIT_PERCENTILES, points):
+            entry[f"wait_p{q}"] = round(float(value), 1) if value is not None else None
+        metrics.append(entry)
+
+    return metrics
+
+
+def job_status_payload(job: Optional[DetectionJob]) -> Dict[str, Any]:
+    """
+    Build the JSON payload reported by `marker_processing_status`
+
+    The `status` field is one of idle, processing (queued or running),
+    completed, error or cancelled; the raw job state is in `job_status`.
+    `poll_after` tells the client how many seconds to wait before asking again
+    (None once the job is finished).
+    """
+    if job is None:
+        return {'status': 'idle'}
+
+    status = {
+        DetectionJob.STATUS_QUEUED: 'processing',
+        DetectionJob.STATUS_RUNNING: 'processing',
+        DetectionJob.STATUS_DONE: 'completed',
+        DetectionJob.STATUS_FAILED: 'error',
+        DetectionJob.STATUS_CANCELLED: 'cancelled',
+    }[job.status]
+
+    result = job.result
+    if job.status == DetectionJob.STATUS_FAILED:
+        result = {'success': False, 'message': f'Error during processing: {job.error}'}
+
+    detail = job.progress_detail or {}
+    eta_seconds = detail.get('eta_seconds') if job.status == DetectionJob.STATUS_RUNNING else None
+
+    if job.status == DetectionJob.STATUS_QUEUED:
+        poll_after = POLL_QUEUED
+    elif job.status == DetectionJob.STATUS_RUNNING:
+        # Poll more often as the job gets close to done
+        poll_after = POLL_MAX if eta_seconds is None else min(POLL_MAX, max(POLL_MIN, eta_seconds / 20))
+    else:
+        poll_after = None
+
+    return {
+        'status': status,
+        'job_status': job.status,
+        'job_id': job.id,
+        'progress': job.progress,
+        'files_done': job.files_done,
+        'files_total': job.files_total,
+        'units_done': job.units_done,
+        'units_total': job.units_total,
+        'detectors': detail.get('detectors', {}),
+        'throughput': detail.get('throughput'),
+        'eta_seconds': eta_seconds,
+        'queue_wait_seconds': job.queue_wait,
+        'queue_position': queue_position(job),
+        'poll_after': poll_after,
+        'detector_types': job.detector_types,
+        'result': result
+    }
@@ -1,19 +1,36 @@
 import os
+import gc
 import json
 import numpy as np
 import cv2
 from pathlib import Path
-from typing import Dict, List, Tuple, Any, Union, Optional
+from typing import Dict, List, Tuple, Any, Union, Optional, Callable
 import logging
 import traceback
 import random
+import threading
 import time
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import lru_cache
 
 from django.core.files.storage import default_storage
 from django.conf import settings
 from django.core.files.base import ContentFile
+from django.db import connections, transaction
 
-from ..models import Detection, ObjectDetection
+from ..models import Detection, ObjectDetection, ClassificationResult
+from .images import DecodedImage, read_image_size
+from . import cache as result_cache
+from . import tiling
+from . import rendering
+from . import classification
+from . import onnx_backend
+from . import policy
+from . import staleness
+from .registry import ModelRegistry
+from .progress import ProgressTracker, ProcessingAborted
+from .timing import StageTimer
 
 logger = logging.getLogger(__name__)
 
@@ -25,6 +42,34 @@ RESULTS_ROOT = os.path.join(settings.MEDIA_ROOT, 'detection_results')
 os.makedirs(MODELS_ROOT, exist_ok=True)
 os.makedirs(RESULTS_ROOT, exist_ok=True)
 
+# Number of images sent to a model in one forward pass when a detector doesn't set its own
+DEFAULT_BATCH_SIZE = 8
+
+# Square input size images are letterboxed to when a detector doesn't set its own
+DEFAULT_IMAGE_SIZE = 640
+
+# Crops classified in one `predict` call when a classifier doesn't set its own
+DEFAULT_CROP_BATCH_SIZE = 128
+
+# Defaults for settings.DETECTION_MODELS
+MODEL_CACHE_DEFAULTS = {
+    'preload': [],             # Detector types loaded and warmed up when a worker starts
+    'warm_up': True,           # Run one inference on a blank input right after loading
+    'memory_budget_mb': None,  # Evict least recently used models above this size (None = unlimited)
+    'backend': 'native',       # 'native', 'onnx' or 'onnx_int8' (exports made by `export_onnx_models`)
+    'concurrent_detectors': 1, # Independent detectors run at once on a batch in threads (1 = one after another)
+    'batch_memory_mb': 512,    # Decoded full-resolution frames one batch of files may hold at once
+}
+
+# Decoded size assumed per byte of a file whose header can't be read (generous for JPEG)
+DECODED_BYTES_PER_FILE_BYTE = 10
+
+# Rows per INSERT statement when saving detected objects
+BULK_INSERT_BATCH_SIZE = 500
+
+# File extensions the detectors can read
+PROCESSABLE_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff', '.webp']
+
 # Updated Model configuration dictionary with our specific models
 MODEL_CONFIG = {
     'object_detection': {
@@ -33,6 +78,9 @@ MODEL_CONFIG = {
             'type': 'ultralytics',
             'threshold': 0.4,  # Increased confidence threshold
             'iou': 0.7,  # Added IoU threshold for NMS
+            'batch_size': 8,  # Images per forward pass in batched mode
+            'imgsz': 640,  # Letterboxed input size
+            'tiling': {'enabled': False},  # Whole-image inference is enough for general photos
             'description': 'General object recognition (COCO dataset - 80 classes)'
         }
     },
@@ -42,6 +90,10 @@ MODEL_CONFIG = {
             'type': 'ultralytics',
             'threshold': 0.4,  # Higher confidence for more precise military detections
             'iou': 0.4,  # IoU threshold for NMS
+            'batch_size': 16,  # Smaller model, so larger batches fit in memory
+            'imgsz': 640,  # Letterboxed input size
+            # Small targets (vehicles, trenches) vanish when large satellite/drone frames are downscaled
+            'tiling': {'enabled': True, 'tile_size': 640, 'overlap': 0.2, 'min_image_size': 2000},
             'description': 'Military objects detection (specialized model)',
             'classes': [
                 'camouflage_soldier', 'weapon', 'military_tank', 'military_truck', 
@@ -55,6 +107,12 @@ MODEL_CONFIG = {
             'model_path': os.path.join(MODELS_ROOT, 'xbd_damage_classifier.h5'),
             'type': 'keras',
             'labels': ['no_damage', 'minor_damage', 'major_damage', 'destroyed'],
+            'negative_label': 'no_damage',  # Regions classified as this are not stored as objects
+            'preprocessing': 'rescale',  # RGB scaled to 0-1
+            'batch_size': 8,  # Images per batch in batched mode
+            'crop_batch_size': 128,  # Crops classified in one predict call
+            # Satellite frames are classified patch by patch
+            'crops': {'source': 'tiles', 'tile_size': 256, 'overlap': 0.0},
             'description': 'Building damage assessment from satellite imagery'
         }
     },
@@ -63,6 +121,11 @@ MODEL_CONFIG = {
             'model_path': os.path.join(MODELS_ROOT, 'emergency_net.h5'),
             'type': 'keras',
             'labels': ['normal', 'fire', 'flood', 'explosion', 'collapse', 'other_emergency'],
+            'negative_label': 'normal',  # Regions classified as this are not stored as objects
+            'preprocessing': 'rescale',  # RGB scaled to 0-1
+            'batch_size': 8,  # Images per batch in batched mode
+            'crop_batch_size': 128,  # Crops classified in one predict call
+            'crops': {'source': 'image'},  # The whole scene is classified
             'description': 'Emergency situation recognition'
         }
     }
@@ -125,34 +188,102 @@ class ModelService:
     """Service for handling ML model operations"""
     
     def __init__(self):
-        self.loaded_models = {}
+        # Ordered from least to most recently used
+        self.loaded_models = OrderedDict()
+        # Load time, resident size and usage per model key
+        self.model_stats = {}
+        # Detector settings from MODEL_CONFIG with DetectionConfig overrides
+        self.registry = ModelRegistry(MODEL_CONFIG)
+        # Detectors running in parallel threads load and evict models one at a time
+        self._model_lock = threading.RLock()
         logger.info("Model service initialized")
     
+    @property
+    def cache_settings(self) -> Dict[str, Any]:
+        """Return the model cache settings merged over the defaults"""
+        cache_settings = dict(MODEL_CACHE_DEFAULTS)
+        cache_settings.update(getattr(settings, 'DETECTION_MODELS', {}))
+        return cache_settings
+    
+    def resolve_model(self, detector_type: str) -> Tuple[Optional[str], Optional[Dict]]:
+        """
+        Return the model name and effective configuration a detector type runs with
+        
+        Settings come from the registry (MODEL_CONFIG with the DetectionConfig
+        overrides) and are switched to the exported model if an ONNX backend is selected.
+        
+        Returns:
+            Tuple of (model name, configuration), or (None, None) if the detector is unknown or disabled
+        """
+        model_name, config = self.registry.resolve(detector_type)
+        if config is None:
+            return None, None
+        return model_name, onnx_backend.apply_backend(config, self.cache_settings['backend'])
+    
+    def has_weights(self, detector_type: str) -> bool:
+        """Whether the weights file of the model a detector type runs with is on disk"""
+        model_name, config = self.resolve_model(detector_type)
+        return model_name is not None and os.path.exists(config['model_path'])
+    
+    @property
+    def concurrent_detectors(self) -> int:
+        """Number of independent detectors run at the same time on a batch"""
+        return max(1, int(self.cache_settings['concurrent_detectors'] or 1))
+    
+    def detector_threads(self) -> Optional[int]:
+        """Intra-op threads per model, sharing the worker's thread budget between concurrent detectors"""
+        threads = int(os.environ.get('OMP_NUM_THREADS', 0))
+        if not threads:
+            return None
+        return max(1, threads // self.concurrent_detectors)
+    
     def get_model(self, detector_type: str, model_name: str = None) -> Any:
         """Load and cache a model based on detector type and model name"""
-        # Use first available model if model_name not specified
+        with self._model_lock:
+            return self._get_model(detector_type, model_name)
+    
+    def _get_model(self, detector_type: str, model_name: str = None) -> Any:
+        """Return the cached model or load it; callers hold `_model_lock`"""
+        # Get model config, switched to the exported model if an ONNX backend is selected
+        resolved_name, model_config = self.resolve_model(detector_type)
         if model_name is None:
-            model_name = list(MODEL_CONFIG.get(detector_type, {}).keys())[0]
+            model_name = resolved_name
+        elif model_name != resolved_name:
+            try:
+                model_config = onnx_backend.apply_backend(MODEL_CONFIG[detector_type][model_name], self.cache_settings['backend'])
+            except KeyError:
+                model_config = None
+        
+        if model_config is None:
+            logger.error(f"Model not found or disabled: {detector_type}/{model_name}")
+            return None
         
         model_key = f"{detector_type}_{model_name}"
         logger.info(f"Requesting model: {model_key}")
         
         # Return cached model if already loaded
         if (model_key in self.loaded_models):
-            logger.info(f"Using cached model: {model_key}")
-            return self.loaded_models[model_key]
-        
-        # Get model config
-        try:
-            model_config = MODEL_CONFIG[detector_type][model_name]
-        except KeyError:
-            logger.error(f"Model not found: {detector_type}/{model_name}")
-            return None
+            cached = self.loaded_models[model_key]
+            if cached['config'].get('model_path') == model_config.get('model_path'):
+                logger.info(f"Using cached model: {model_key}")
+                # Pick up parameter changes (thresholds, batch size) without reloading the weights
+                cached['config'] = model_config
+                self.loaded_models.move_to_end(model_key)
+                if model_key in self.model_stats:
+                    self.model_stats[model_key]['hits'] += 1
+                    self.model_stats[model_key]['last_used'] = time.time()
+                return cached
+            
+            logger.info(f"Weights for {model_key} changed to {model_config.get('model_path')}, reloading")
+            self.unload_model(model_key)
         
         # Load model based on type
         model_path = model_config['model_path']
         model_type = model_config['type']
         
+        load_start = time.time()
+        rss_before = _process_rss()
+        
         try:
             if model_type == 'ultralytics':
                 try:
@@ -190,6 +321,17 @@ class ModelService:
                     logger.error(f"Error loading Keras model: {str(e)}")
                     logger.error(traceback.format_exc())
                     return None
+            elif model_type == 'onnx':
+                try:
+                    model = onnx_backend.load_onnx_model(model_config, threads=self.detector_threads())
+                    logger.info(f"Loaded ONNX model from {model_path}")
+                except ImportError:
+                    logger.error("ONNX Runtime not installed, please install with: pip install onnxruntime")
+                    return None
+                except Exception as e:
+                    logger.error(f"Error loading ONNX model: {str(e)}")
+                    logger.error(traceback.format_exc())
+                    return None
             else:
                 logger.error(f"Unsupported model type: {model_type}")
                 return None
@@ -199,6 +341,21 @@ class ModelService:
                 'model': model,
                 'config': model_config
             }
+            self.model_stats[model_key] = {
+                'load_time': time.time() - load_start,
+                'size_mb': _estimate_model_size(model, rss_before) / (1024 * 1024),
+                'warm_up_time': None,
+                'loaded_at': time.time(),
+                'last_used': time.time(),
+                'hits': 0
+            }
+            logger.info(f"Model {model_key} loaded in {self.model_stats[model_key]['load_time']:.2f}s, "
+                        f"~{self.model_stats[model_key]['size_mb']:.0f} MB resident")
+            
+            if self.cache_settings['warm_up']:
+                self.warm_up(model_key)
+            
+            self._enforce_memory_budget(keep=model_key)
             
             return self.loaded_models[model_key]
         except Exception as e:
@@ -206,6 +363,88 @@ class ModelService:
             logger.error(traceback.format_exc())
             return None
     
+    def warm_up(self, model_key: str):
+        """
+        Run one inference on a blank input so the first real request doesn't pay
+        for lazy initialisation (graph tracing, memory allocation, kernel selection)
+        """
+        model_data = self.loaded_models.get(model_key)
+        if not model_data:
+            return
+        
+        model = model_data['model']
+        config = model_data['config']
+        start_time = time.time()
+        
+        try:
+            if _is_yolo(config):
+                imgsz = int(config.get('imgsz', DEFAULT_IMAGE_SIZE))
+                model(np.zeros((imgsz, imgsz, 3), dtype=np.uint8), imgsz=imgsz, verbose=False)
+            elif _is_classifier(config):
+                input_shape = tuple(dim or 1 for dim in model.input_shape[1:])
+                model.predict(np.zeros((1,) + input_shape, dtype=np.float32), verbose=0)
+            else:
+                return
+        except Exception as e:
+            logger.warning(f"Warm-up failed for {model_key}: {str(e)}")
+            return
+        
+        warm_up_time = time.time() - start_time
+        if model_key in self.model_stats:
+            self.model_stats[model_key]['warm_up_time'] = warm_up_time
+        logger.info(f"Warmed up {model_key} in {warm_up_time:.2f}s")
+    
+    def preload_models(self, detector_types: List[str] = None):
+        """
+        Load (and warm up) the first model of each detector type ahead of requests
+        
+        Args:
+            detector_types: Detector types to preload, defaults to the configured preload list
+        """
+        if detector_types is None:
+            detector_types = self.cache_settings['preload']
+        
+        for detector_type in detector_types:
+            if detector_type not in MODEL_CONFIG:
+                logger.warning(f"Cannot preload unknown detector type: {detector_type}")
+                continue
+            self.get_model(detector_type)
+        
+        logger.info(f"Preloaded models: {self.get_stats()}")
+    
+    def unload_model(self, model_key: str):
+        """Drop a model from the cache and release its memory"""
+        if self.loaded_models.pop(model_key, None) is None:
+            return
+        
+        stats = self.model_stats.pop(model_key, {})
+        gc.collect()
+        logger.info(f"Unloaded model {model_key} (~{stats.get('size_mb', 0):.0f} MB)")
+    
+    def _enforce_memory_budget(self, keep: str = None):
+        """Evict least recently used models until the cache fits the memory budget"""
+        budget_mb = self.cache_settings['memory_budget_mb']
+        if budget_mb is None:
+            return
+        
+        for model_key in list(self.loaded_models.keys()):
+            total_mb = sum(stats['size_mb'] for stats in self.model_stats.values())
+            if total_mb <= budget_mb:
+                break
+            # Never evict the model that was just requested
+            if model_key == keep:
+                continue
+            logger.info(f"Model cache at {total_mb:.0f} MB exceeds budget of {budget_mb} MB, evicting {model_key}")
+            self.unload_model(model_key)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Return load-time, resident-size and usage stats for the cached models"""
+        return {
+            'memory_budget_mb': self.cache_settings['memory_budget_mb'],
+            'total_size_mb': sum(stats['size_mb'] for stats in self.model_stats.values()),
+            'models': {model_key: dict(self.model_stats.get(model_key, {})) for model_key in self.loaded_models}
+        }
+    
     def process_image(self, file_path: str, detector_types: List[str]) -> Dict[str, Any]:
         """
         Process an image with multiple detector types
@@ -217,174 +456,644 @@ class ModelService:
         Returns:
             Dictionary of results per detector type
         """
-        logger.info(f"Processing image {file_path} with detector types: {detector_types}")
-        results = {}
+        return self.process_batch([file_path], detector_types).get(file_path, {})
+    
+    def process_batch(self, file_paths: List[str], detector_types: List[str], 
+                      progress: ProgressTracker = None) -> Dict[str, Dict[str, Any]]:
+        """
+        Process several images with multiple detector types, batching model calls
         
-        # Process each detector type
-        for detector_type in detector_types:
-            if detector_type not in MODEL_CONFIG:
-                logger.warning(f"Unknown detector type: {detector_type}")
-                continue
-                
-            # Get the first model for this detector type
-            model_name = list(MODEL_CONFIG[detector_type].keys())[0]
-            model_data = self.get_model(detector_type, model_name)
+        Images are grouped into chunks of the detector's configured `batch_size`
+        so that each model sees one forward pass per chunk instead of one per file.
+        Each file is decoded once and the decoded pixels are shared by every
+        detector and by the annotator.
+        
+        With `concurrent_detectors` above 1, detectors that don't depend on each
+        other run at the same time in threads (inference releases the GIL); a
+        classifier cropping another detector's boxes waits for that detector.
+        
+        Args:
+            file_paths: Paths to the image files
+            detector_types: List of detector types to use
+            progress: Tracker told about each detector finishing the batch
             
-            if not model_data:
-                logger.warning(f"No model loaded for {detector_type}, skipping")
-                continue
+        Returns:
+            Dictionary keyed by file path, each value in the `process_image` format
+        """
+        logger.info(f"Processing batch of {len(file_paths)} images with detector types: {detector_types}")
+        results = {file_path: {} for file_path in file_paths}
+        images = [DecodedImage(file_path) for file_path in file_paths]
+        
+        try:
+            if self.concurrent_detectors > 1 and len(detector_types) > 1:
+                self._run_detectors_concurrently(images, detector_types, results, progress)
+            else:
+                # Process each detector type
+                for detector_type in detector_types:
+                    self._run_detector(images, detector_type, results)
+                    if progress:
+                        progress.detector_done(detector_type, len(images))
+        finally:
+            for image in images:
+                image.release()
+        
+        # Keep the requested detector order whatever order the threads finished in
+        for file_path, file_results in results.items():
+            results[file_path] = {
+                detector_type: file_results[detector_type]
+                for detector_type in detector_types if detector_type in file_results
+            }
+        
+        return results
+    
+    def _detector_dependency(self, detector_type: str, detector_types: List[str]) -> Optional[str]:
+        """Return the detector among `detector_types` whose results this detector needs, if any"""
+        _, config = self.resolve_model(detector_type)
+        if config is None or not _is_classifier(config):
+            return None
+        source = classification.source_detector(classification.get_crop_settings(config))
+        return source if source in detector_types and source != detector_type else None
+    
+    def _run_detectors_concurrently(self, images: List[DecodedImage], detector_types: List[str],
+                                    results: Dict[str, Dict[str, Any]], progress: ProgressTracker = None):
+        """
+        Run independent detectors over the same decoded images in parallel threads
+        
+        A detector is started once the detector it depends on has finished.
+        Progress is reported from the calling thread, so a progress callback
+        that raises ProcessingAborted stops the batch as usual.
+        """
+        dependencies = {
+            detector_type: self._detector_dependency(detector_type, detector_types)
+            for detector_type in detector_types
+        }
+        waiting = list(detector_types)
+        running = {}
+        
+        def run(detector_type):
+            try:
+                self._run_detector(images, detector_type, results)
+            finally:
+                # Result cache lookups open a connection per thread
+                connections.close_all()
+        
+        executor = ThreadPoolExecutor(max_workers=self.concurrent_detectors, thread_name_prefix='detector')
+        try:
+            while waiting or running:
+                for detector_type in list(waiting):
+                    if dependencies[detector_type] not in waiting and dependencies[detector_type] not in running.values():
+                        waiting.remove(detector_type)
+                        running[executor.submit(run, detector_type)] = detector_type
                 
-            model = model_data['model']
-            config = model_data['config']
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    detector_type = running.pop(future)
+                    future.result()
+                    if progress:
+                        progress.detector_done(detector_type, len(images))
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+    
+    def _run_detector(self, images: List[DecodedImage], detector_type: str, results: Dict[str, Dict[str, Any]]):
+        """
+        Run one detector type over decoded images, adding its results to `results`
+        
+        Args:
+            images: Decoded images of the batch
+            detector_type: Detector type to run
+            results: Results keyed by file path, updated in place. Results of
+                detectors that already ran are used by classifiers cropping their boxes.
+        """
+        # Get the model and parameters currently configured for this detector type
+        model_name, config = self.resolve_model(detector_type)
+        if model_name is None:
+            logger.warning(f"Unknown or disabled detector type: {detector_type}")
+            return
+        
+        # Classifiers cropping another detector's boxes depend on that detector's output, so they are not cached
+        use_cache = not _is_classifier(config) or classification.source_detector(classification.get_crop_settings(config)) is None
+        
+        # Detectors step down to cheaper settings while the job queue is long
+        run_config = config
+        store_results = use_cache
+        level, backlog = policy.current_level() if _is_yolo(config) else (None, None)
+        if level is not None:
+            run_config = policy.level_config(config, level, backlog)
+            # Degraded results are never looked up, so don't fill the cache with them
+            store_results = use_cache and not policy.is_degraded(level)
+        
+        # Recorded with each result so stale detections can be found later. Cached results
+        # were computed at the full level, fresh ones at the current level.
+        model_hash = result_cache.get_model_hash(model_name, config)
+        cached_params_key = result_cache.params_key(model_name, config)
+        params_key = result_cache.params_key(model_name, run_config)
+        
+        # Reuse cached results for images this model already processed with the same settings
+        pending = []
+        for image in images:
+            lookup_start = time.perf_counter()
+            cached = self._lookup_cached_result(image, detector_type, model_name, config) if use_cache else None
+            if cached:
+                cached['timings'] = {'cache': time.perf_counter() - lookup_start}
+                _add_image_stats(image, cached)
+                if level is not None:
+                    image_size = tuple(cached['image_size']) if cached.get('image_size') else _image_size(image)
+                    cached['inference'] = policy.cached_settings(config, image_size)
+                results[image.file_path][detector_type] = {
+                    'model_name': model_name,
+                    'result': cached,
+                    'content_hash': image.content_hash,
+                    'model_hash': model_hash,
+                    'params_key': cached_params_key
+                }
+            else:
+                pending.append(image)
+        
+        if not pending:
+            return
+        
+        model_data = self.get_model(detector_type, model_name)
+        
+        if not model_data:
+            logger.warning(f"No model loaded for {detector_type}, skipping")
+            return
+            
+        model = model_data['model']
+        batch_size = max(1, int(config.get('batch_size', DEFAULT_BATCH_SIZE)))
+        
+        for offset in range(0, len(pending), batch_size):
+            chunk = pending[offset:offset + batch_size]
             
             # Process with the appropriate method based on detector type
             try:
                 if detector_type in ['object_detection', 'military_detection']:
-                    if config['type'] == 'ultralytics':
-                        # Process with YOLO model
-                        result = self._process_with_yolo(file_path, detector_type, model, config)
+                    if _is_yolo(config):
+                        # Process the whole chunk with one YOLO call
+                        chunk_results = self._process_with_yolo_batch(chunk, detector_type, model, run_config)
                     else:
                         logger.warning(f"Unsupported model type for {detector_type}: {config['type']}")
-                        continue
+                        break
                 elif detector_type in ['damage_assessment', 'emergency_recognition']:
-                    if config['type'] == 'keras':
-                        # Process with Keras model
-                        result = self._process_with_keras(file_path, detector_type, model, config)
+                    if _is_classifier(config):
+                        # Classify the crops of the whole chunk together
+                        chunk_results = self._process_with_keras_batch(chunk, detector_type, model, config, results)
                     else:
                         logger.warning(f"Unsupported model type for {detector_type}: {config['type']}")
-                        continue
+                        break
+                else:
+                    logger.warning(f"No processing method for detector type: {detector_type}")
+                    break
                 
-                results[detector_type] = {
-                    'model_name': model_name,
-                    'result': result
-                }
+                for image in chunk:
+                    if image.file_path not in chunk_results:
+                        continue
+                    result = chunk_results[image.file_path]
+                    _add_image_stats(image, result)
+                    results[image.file_path][detector_type] = {
+                        'model_name': model_name,
+                        'result': result,
+                        'content_hash': image.content_hash,
+                        'model_hash': model_hash,
+                        'params_key': params_key
+                    }
+                    if store_results:
+                        self._store_cached_result(image, detector_type, model_name, config, result)
                 
             except Exception as e:
-                logger.error(f"Error processing {detector_type} for {file_path}: {str(e)}")
+                logger.error(f"Error processing {detector_type} for batch {[image.file_path for image in chunk]}: {str(e)}")
                 logger.error(traceback.format_exc())
-        
-        return results
     
-    def _process_with_yolo(self, file_path: str, detector_type: str, model, config: Dict) -> Dict:
+    def _lookup_cached_result(self, image: DecodedImage, detector_type: str, model_name: str, config: Dict) -> Optional[Dict]:
+        """Return a cached result for this image and model, if one exists"""
+        try:
+            output_filename = f"{Path(image.file_path).stem}_{detector_type}.jpg"
+            return result_cache.lookup(image.content_hash, detector_type, model_name, config, output_filename)
+        except Exception as e:
+            logger.error(f"Error reading result cache for {image.file_path}: {str(e)}")
+            return None
+    
+    def _store_cached_result(self, image: DecodedImage, detector_type: str, model_name: str, config: Dict, result: Dict):
+        """Save a fresh result in the cache, ignoring cache failures"""
+        try:
+            result_cache.store(image.content_hash, detector_type, model_name, config, result)
+        except Exception as e:
+            logger.error(f"Error writing result cache for {image.file_path}: {str(e)}")
+    
+    def _process_with_yolo(self, image: DecodedImage, detector_type: str, model, config: Dict) -> Dict:
         """Process an image with a YOLO model"""
-        file_stem = Path(file_path).stem
-        output_filename = f"{file_stem}_{detector_type}.jpg"
+        return self._process_with_yolo_batch([image], detector_type, model, config)[image.file_path]
+    
+    def _process_with_yolo_batch(self, images: List[DecodedImage], detector_type: str, model, config: Dict) -> Dict[str, Dict]:
+        """
+        Process a list of decoded images with a single batched YOLO call
         
-        # Remove any reference to actual file system paths
-        # Only keep storage_path for metadata purposes
-        storage_path = f"detection_results/{detector_type}/{output_filename}" 
+        With a configuration from `policy.level_config`, each image gets its
+        own input size (see `policy.image_config`) and images that picked
+        different sizes are sent in separate calls.
+        """
+        if config.get('policy') and len(images) > 1:
+            groups = {}
+            for image in images:
+                try:
+                    size = policy.image_config(config, _image_size(image))['imgsz']
+                except Exception:
+                    # Reported as an error result by the group's own call
+                    size = None
+                groups.setdefault(size, []).append(image)
+            if len(groups) > 1:
+                results = {}
+                for group in groups.values():
+                    results.update(self._process_with_yolo_batch(group, detector_type, model, config))
+                return results
+        
+        threshold = config.get('threshold', 0.30)
+        iou = config.get('iou', 0.45)
+        results = {}
+        
+        tiling_settings = tiling.get_tiling_settings(config)
+        
+        # Letterbox every image to the model input size once; files that fail to decode get an error result.
+        # Images large enough for tiling are processed separately, tile batches at a time.
+        inputs = []
+        preprocess_times = {}
+        image_configs = {}
+        for image in images:
+            try:
+                image_config = policy.image_config(config, _image_size(image)) if config.get('policy') else config
+                if tiling.should_tile(image.shape, tiling_settings):
+                    results[image.file_path] = self._process_with_yolo_tiled(image, detector_type, model, image_config)
+                    if config.get('policy'):
+                        results[image.file_path]['inference'] = policy.settings_used(image_config, tiled=True)
+                else:
+                    input_size = int(image_config.get('imgsz', DEFAULT_IMAGE_SIZE))
+                    start = time.perf_counter()
+                    inputs.append((image, image.letterbox(input_size)[0]))
+                    preprocess_times[image.file_path] = time.perf_counter() - start
+                    image_configs[image.file_path] = image_config
+            except Exception as e:
+                results[image.file_path] = self._build_error_result(image.file_path, detector_type, e)
+        
+        if not inputs:
+            return results
+        
+        # The images of one call share an input size
+        imgsz = int(image_configs[inputs[0][0].file_path].get('imgsz', DEFAULT_IMAGE_SIZE))
+        
+        logger.info(f"Running batched inference with {detector_type} model on {len(inputs)} images (conf={threshold}, iou={iou}, imgsz={imgsz})")
         
-        annotated_image_content = None # Initialize variable to store image content
-
         try:
-            # Run inference with the model
-            threshold = config.get('threshold', 0.30)
-            iou = config.get('iou', 0.45)
-            logger.info(f"Running inference with {detector_type} model (conf={threshold}, iou={iou})")
-            
             start_time = time.time()
-            results = model(file_path, conf=threshold, iou=iou)
+            batch_results = model(
+                [array for _, array in inputs], 
+                conf=threshold, 
+                iou=iou, 
+                imgsz=imgsz, 
+                batch=len(inputs), 
+                verbose=False
+            )
             inference_time = time.time() - start_time
-            logger.info(f"Inference completed in {inference_time:.2f}s")
-            
-            # Read original image for annotation
-            original_img = cv2.imread(file_path)
-            if original_img is None:
-                logger.error(f"Failed to read image: {file_path}")
-                raise ValueError(f"Could not read image file: {file_path}")
+            logger.info(f"Batched inference completed in {inference_time:.2f}s")
+        except Exception as e:
+            if len(inputs) == 1:
+                results[inputs[0][0].file_path] = self._build_error_result(inputs[0][0].file_path, detector_type, e)
+                return results
             
-            # Extract detection results
-            detections = []
-            result = results[0]  # First image result
+            # One bad input fails the whole batch, so retry the images one by one
+            logger.warning(f"Batched inference failed ({str(e)}), falling back to per-image inference")
+            for image, _ in inputs:
+                results.update(self._process_with_yolo_batch([image], detector_type, model, config))
+            return results
+        
+        # Split the batch back into per-file results, sharing the batch time evenly
+        per_image_time = inference_time / len(inputs)
+        for (image, _), result in zip(inputs, batch_results):
+            try:
+                build_start = time.perf_counter()
+                image_config = image_configs[image.file_path]
+                results[image.file_path] = self._build_yolo_result(result, image, detector_type, image_config, per_image_time)
+                results[image.file_path]['batch_size'] = len(inputs)
+                if config.get('policy'):
+                    results[image.file_path]['inference'] = policy.settings_used(image_config, tiled=False)
+                _record_timings(
+                    results[image.file_path], build_start,
+                    preprocess=preprocess_times[image.file_path], inference=per_image_time
+                )
+            except Exception as e:
+                results[image.file_path] = self._build_error_result(image.file_path, detector_type, e)
+        
+        return results
+    
+    def _process_with_yolo_tiled(self, image: DecodedImage, detector_type: str, model, config: Dict) -> Dict:
+        """
+        Process a large image as overlapping tiles so small objects keep their resolution
+        
+        Tiles are views into the decoded image and are sent to the model
+        `batch_size` at a time, so memory stays bounded by one batch of tiles
+        regardless of the image size. Boxes from all tiles are shifted back to
+        image coordinates and merged with class-aware NMS.
+        """
+        threshold = config.get('threshold', 0.30)
+        iou = config.get('iou', 0.45)
+        batch_size = max(1, int(config.get('batch_size', DEFAULT_BATCH_SIZE)))
+        tiling_settings = tiling.get_tiling_settings(config)
+        tile_size = int(tiling_settings['tile_size'])
+        
+        height, width = image.shape[:2]
+        windows = tiling.tile_grid(height, width, tile_size, tiling_settings['overlap'])
+        logger.info(f"Running tiled inference with {detector_type} model on {len(windows)} tiles of {tile_size}px (image {width}x{height})")
+        
+        all_boxes, all_scores, all_classes = [], [], []
+        names = None
+        preprocess_time = 0.0
+        start_time = time.time()
+        
+        for offset in range(0, len(windows), batch_size):
+            batch_windows = windows[offset:offset + batch_size]
+            tiles = [image.array[y1:y2, x1:x2] for x1, y1, x2, y2 in batch_windows]
+            tile_results = model(tiles, conf=threshold, iou=iou, imgsz=tile_size, batch=len(tiles), verbose=False)
             
-            # Convert YOLO results to our format
-            for box in result.boxes:
-                label_idx = int(box.cls)
-                
-                # Use the YOLO model's class names or config's class list
-                if hasattr(result, 'names') and label_idx in result.names:
-                    label = result.names[label_idx]
-                elif 'classes' in config and label_idx < len(config['classes']):
-                    label = config['classes'][label_idx]
-                else:
-                    label = f"class_{label_idx}"
-                    
-                conf = float(box.conf)
-                
-                # Get coordinates (convert to pixels)
-                x1, y1, x2, y2 = box.xyxy[0].tolist()  # xyxy format (top-left, bottom-right)
-                
+            for (x1, y1, _, _), result in zip(batch_windows, tile_results):
+                names = getattr(result, 'names', names)
+                boxes = _to_numpy(result.boxes.xyxy).astype(np.float64).reshape(-1, 4)
+                if not len(boxes):
+                    continue
+                all_boxes.append(boxes + np.array([x1, y1, x1, y1], dtype=np.float64))
+                all_scores.append(_to_numpy(result.boxes.conf).astype(float).reshape(-1))
+                all_classes.append(_to_numpy(result.boxes.cls).astype(int).reshape(-1))
+        
+        # One pass over the whole downscaled frame keeps objects larger than a tile
+        if tiling_settings['include_full_image']:
+            imgsz = int(config.get('imgsz', DEFAULT_IMAGE_SIZE))
+            letterbox_start = time.perf_counter()
+            letterboxed = image.letterbox(imgsz)[0]
+            preprocess_time = time.perf_counter() - letterbox_start
+            result = model([letterboxed], conf=threshold, iou=iou, imgsz=imgsz, batch=1, verbose=False)[0]
+            names = getattr(result, 'names', names)
+            boxes = image.unletterbox_boxes(_to_numpy(result.boxes.xyxy), imgsz)
+            if len(boxes):
+                all_boxes.append(boxes)
+                all_scores.append(_to_numpy(result.boxes.conf).astype(float).reshape(-1))
+                all_classes.append(_to_numpy(result.boxes.cls).astype(int).reshape(-1))
+        
+        inference_time = time.time() - start_time
+        
+        build_start = time.perf_counter()
+        if all_boxes:
+            xyxy, confidences, class_ids = tiling.merge_tile_detections(
+                np.concatenate(all_boxes), np.concatenate(all_scores), np.concatenate(all_classes), tiling_settings
+            )
+        else:
+            xyxy, confidences, class_ids = np.empty((0, 4)), np.empty(0), np.empty(0, dtype=int)
+        
+        result = self._build_detection_result(image, detector_type, config, names, xyxy, confidences, class_ids, inference_time)
+        result['tiles'] = len(windows)
+        _record_timings(result, build_start, preprocess=preprocess_time, inference=inference_time - preprocess_time)
+        return result
+    
+    def _process_with_keras(self, image: DecodedImage, detector_type: str, model, config: Dict, 
+                            source_results: Dict[str, Dict] = None) -> Dict:
+        """Process an image with a Keras classifier"""
+        return self._process_with_keras_batch([image], detector_type, model, config, source_results)[image.file_path]
+    
+    def _process_with_keras_batch(self, images: List[DecodedImage], detector_type: str, model, config: Dict, 
+                                  source_results: Dict[str, Dict] = None) -> Dict[str, Dict]:
+        """
+        Classify regions of several images with a Keras model
+        
+        The regions of all images (the whole frame, a grid of patches or the
+        boxes of another detector, see `classification.CROP_DEFAULTS`) are resized
+        into one preallocated uint8 buffer, converted to the model input in a
+        single vectorized step and classified with one `predict` call per
+        `crop_batch_size` crops.
+        
+        Args:
+            images: Decoded images to classify
+            detector_type: Classifier detector type
+            model: Loaded Keras model
+            config: Model configuration
+            source_results: Results of detectors already run on the images, keyed by file path,
+                used when crops come from another detector's boxes
+        """
+        labels = config['labels']
+        crops = classification.get_crop_settings(config)
+        source = classification.source_detector(crops)
+        crop_batch_size = max(1, int(config.get('crop_batch_size', DEFAULT_CROP_BATCH_SIZE)))
+        results = {}
+        
+        # Model input size, (None, h, w, 3) for image classifiers
+        input_h, input_w = config.get('input_size') or model.input_shape[1:3]
+        
+        # Collect the regions of every image
+        regions = []
+        for image in images:
+            try:
+                source_detections = None
+                if source:
+                    source_result = (source_results or {}).get(image.file_path, {}).get(source)
+                    source_detections = source_result['result'].get('detections', []) if source_result else None
+                boxes = classification.crop_boxes(image.shape, crops, source_detections)
+                regions.append((image, boxes))
+            except Exception as e:
+                results[image.file_path] = self._build_error_result(image.file_path, detector_type, e)
+        
+        flat_regions = [(image.array, box) for image, boxes in regions for box in boxes]
+        logger.info(f"Classifying {len(flat_regions)} regions from {len(regions)} images with {detector_type} model")
+        
+        # One reusable input buffer bounds memory regardless of the number of crops
+        batch = np.empty((min(crop_batch_size, max(1, len(flat_regions))), input_h, input_w, 3), dtype=np.uint8)
+        probabilities = np.empty((len(flat_regions), len(labels)), dtype=np.float32)
+        
+        timer = StageTimer()
+        start_time = time.time()
+        try:
+            for offset in range(0, len(flat_regions), crop_batch_size):
+                chunk = flat_regions[offset:offset + crop_batch_size]
+                with timer.stage('preprocess'):
+                    classification.fill_batch(chunk, batch)
+                    inputs = classification.preprocess(batch[:len(chunk)], config.get('preprocessing', 'rescale'))
+                with timer.stage('inference'):
+                    probabilities[offset:offset + len(chunk)] = model.predict(inputs, batch_size=len(chunk), verbose=0)
+        except Exception as e:
+            for image, _ in regions:
+                results[image.file_path] = self._build_error_result(image.file_path, detector_type, e)
+            return results
+        inference_time = time.time() - start_time
+        
+        # Split the probabilities back per image, sharing the time by number of crops
+        offset = 0
+        for image, boxes in regions:
+            image_probabilities = probabilities[offset:offset + len(boxes)]
+            offset += len(boxes)
+            share = len(boxes) / max(1, len(flat_regions))
+            build_start = time.perf_counter()
+            results[image.file_path] = self._build_classification_result(
+                image, detector_type, config, boxes, image_probabilities, inference_time * share
+            )
+            results[image.file_path]['batch_size'] = len(regions)
+            _record_timings(
+                results[image.file_path], build_start,
+                **{stage: seconds * share for stage, seconds in timer.seconds.items()}
+            )
+        
+        return results
+    
+    def _build_classification_result(self, image: DecodedImage, detector_type: str, config: Dict, 
+                                     boxes: np.ndarray, probabilities: np.ndarray, inference_time: float) -> Dict:
+        """Build our result format from per-region class probabilities"""
+        labels = config['labels']
+        crops = classification.get_crop_settings(config)
+        output_filename = f"{Path(image.file_path).stem}_{detector_type}.jpg"
+        
+        classifications = classification.summarize(probabilities, labels)
+        
+        # Regions are stored as objects (except the negative class) unless the whole image was classified
+        detections = []
+        if crops['source'] != 'image':
+            top_classes = probabilities.argmax(axis=1)
+            for (x1, y1, x2, y2), class_index, region_probabilities in zip(boxes.tolist(), top_classes.tolist(), probabilities):
+                label = labels[class_index]
+                if label == config.get('negative_label'):
+                    continue
                 detections.append({
                     'label': label,
-                    'confidence': conf,
+                    'confidence': float(region_probabilities[class_index]),
                     'bbox': [x1, y1, x2, y2]
                 })
+        
+        if not classifications:
+            summary = "Nothing to classify"
+        elif crops['source'] == 'image':
+            summary = f"Classified as {classifications[0]['label']} ({classifications[0]['confidence']:.2f})"
+        else:
+            counts = [f"{c['crops']} {c['label']}" for c in classifications if c['crops']]
+            summary = f"Classified {len(boxes)} regions: " + ", ".join(counts)
+        
+        logger.info(f"{detector_type} for {Path(image.file_path).stem}: {summary}")
+        
+        annotated_image_content = None
+        timer = StageTimer()
+        if rendering.get_render_settings()['eager']:
+            with timer.stage('annotate'):
+                annotated_img = self._draw_modern_annotations(image.array, detections, detector_type)
+            with timer.stage('encode'):
+                is_success, buffer = cv2.imencode(".jpg", annotated_img)
+            if is_success:
+                annotated_image_content = ContentFile(buffer.tobytes(), name=output_filename)
+        
+        return {
+            'detections': detections,
+            'classifications': classifications,
+            'relative_path': f"detection_results/{detector_type}/{output_filename}",
+            'summary': summary,
+            'inference_time': inference_time,
+            'annotated_image_content': annotated_image_content,
+            'output_filename': output_filename,
+            'timings': timer.seconds
+        }
+    
+    def _build_yolo_result(self, result, image: DecodedImage, detector_type: str, config: Dict, inference_time: float) -> Dict:
+        """Convert a single ultralytics result into our result format"""
+        imgsz = int(config.get('imgsz', DEFAULT_IMAGE_SIZE))
+        
+        # Boxes were predicted on the letterboxed input, map them back to the original pixels
+        boxes = result.boxes
+        xyxy = image.unletterbox_boxes(_to_numpy(boxes.xyxy), imgsz)
+        class_ids = _to_numpy(boxes.cls).astype(int).reshape(-1)
+        confidences = _to_numpy(boxes.conf).astype(float).reshape(-1)
+        
+        return self._build_detection_result(
+            image, detector_type, config, getattr(result, 'names', None), 
+            xyxy, confidences, class_ids, inference_time
+        )
+    
+    def _build_detection_result(self, image: DecodedImage, detector_type: str, config: Dict, names: Optional[Dict],
+                                xyxy: np.ndarray, confidences: np.ndarray, class_ids: np.ndarray, 
+                                inference_time: float) -> Dict:
+        """Build our result format from boxes in original image coordinates"""
+        file_stem = Path(image.file_path).stem
+        output_filename = f"{file_stem}_{detector_type}.jpg"
+        
+        annotated_image_content = None # Initialize variable to store image content
+        
+        # Extract detection results
+        detections = []
+        
+        # Convert YOLO results to our format
+        for label_idx, conf, (x1, y1, x2, y2) in zip(class_ids.tolist(), confidences.tolist(), xyxy.tolist()):
+            # Use the YOLO model's class names or config's class list
+            if names and label_idx in names:
+                label = names[label_idx]
+            elif 'classes' in config and label_idx < len(config['classes']):
+                label = config['classes'][label_idx]
+            else:
+                label = f"class_{label_idx}"
             
-            logger.info(f"Found {len(detections)} objects in image")
-            
-            # Draw annotations on the image
-            annotated_img = self._draw_modern_annotations(original_img.copy(), detections, detector_type)
+            detections.append({
+                'label': label,
+                'confidence': conf,
+                'bbox': [x1, y1, x2, y2]
+            })
+        
+        logger.info(f"Found {len(detections)} objects in image {file_stem}")
+        
+        # Annotated images are normally rendered on demand from the stored objects (see rendering.py)
+        timer = StageTimer()
+        if rendering.get_render_settings()['eager']:
+            with timer.stage('annotate'):
+                if (config.get('policy') or {}).get('annotation') == 'half':
+                    # Cheaper overlay for very large images or under load
+                    annotated_img = self._draw_modern_annotations(
+                        cv2.resize(image.array, None, fx=0.5, fy=0.5, interpolation=cv2.INTER_AREA),
+                        [{**det, 'bbox': [coord * 0.5 for coord in det['bbox']]} for det in detections],
+                        detector_type
+                    )
+                else:
+                    annotated_img = self._draw_modern_annotations(image.array, detections, detector_type)
             
             # Encode image to bytes and create ContentFile - ONLY store in DB, not filesystem
-            is_success, buffer = cv2.imencode(".jpg", annotated_img)
+            with timer.stage('encode'):
+                is_success, buffer = cv2.imencode(".jpg", annotated_img)
             if not is_success:
                 logger.warning("Failed to encode annotated image buffer.")
             else:
                 annotated_image_content = ContentFile(buffer.tobytes(), name=output_filename)
                 logger.info(f"Encoded annotated image into ContentFile: {output_filename}")
-            
-            # No filesystem saving - REMOVED
-            # cv2.imwrite(output_path, annotated_img)
-            # default_storage.save(storage_path, ContentFile(img_bytes))
-            
-            # Define the URL path for reference only, not for actual file storage
-            relative_path = f"detection_results/{detector_type}/{output_filename}"
-            
-            # Create summary text
-            label_counts = {}
-            for det in detections:
-                label = det['label']
-                label_counts[label] = label_counts.get(label, 0) + 1
-            
-            summary_parts = []
-            for label, count in label_counts.items():
-                summary_parts.append(f"{count} {label}{'s' if count > 1 else ''}")
-            
-            summary = f"Found {len(detections)} objects: " + ", ".join(summary_parts) if detections else "No objects detected"
-            
-            return {
-                'detections': detections,
-                'relative_path': relative_path, # Just for reference in metadata
-                'summary': summary,
-                'inference_time': inference_time,
-                'annotated_image_content': annotated_image_content, # ContentFile for DB storage
-                'output_filename': output_filename # For DB storage
-            }
-            
-        except Exception as e:
-            logger.error(f"Error in YOLO processing: {str(e)}")
-            logger.error(traceback.format_exc())
-            
-            # Create error image
-            error_img = np.zeros((400, 600, 3), dtype=np.uint8)
-            cv2.putText(
-                error_img, 
-                f"Error processing image with {detector_type}", 
-                (20, 150), 
-                cv2.FONT_HERSHEY_SIMPLEX, 
-                0.7, 
-                (255, 255, 255), 
-                1
-            )
-            cv2.putText(
-                error_img, 
-                str(e), 
-                (20, 200), 
-                cv2.FONT_HERSHEY_SIMPLEX, 
-                0.5, 
-                (200, 100, 100), 
-                1
-            )
+        
+        # Define the URL path for reference only, not for actual file storage
+        relative_path = f"detection_results/{detector_type}/{output_filename}"
+        
+        # Create summary text
+        label_counts = {}
+        for det in detections:
+            label = det['label']
+            label_counts[label] = label_counts.get(label, 0) + 1
+        
+        summary_parts = []
+        for label, count in label_counts.items():
+            summary_parts.append(f"{count} {label}{'s' if count > 1 else ''}")
+        
+        summary = f"Found {len(detections)} objects: " + ", ".join(summary_parts) if detections else "No objects detected"
+        
+        return {
+            'detections': detections,
+            'relative_path': relative_path, # Just for reference in metadata
+            'summary': summary,
+            'inference_time': inference_time,
+            'annotated_image_content': annotated_image_content, # ContentFile for DB storage
+            'output_filename': output_filename, # For DB storage
+            'timings': timer.seconds
+        }
+    
+    def _build_error_result(self, file_path: str, detector_type: str, error: Exception) -> Dict:
+        """Build a result with an error image for a file that failed to process"""
+        logger.error(f"Error running {detector_type} on {file_path}: {str(error)}")
+        logger.error(traceback.format_exc())
+        
+        output_filename = f"{Path(file_path).stem}_{detector_type}.jpg"
+        annotated_image_content = None
+        
+        if rendering.get_render_settings()['eager']:
+            error_img = self._draw_error_image(detector_type, str(error))
             
             # Encode error image and create ContentFile - ONLY store in DB
             is_success, buffer = cv2.imencode(".jpg", error_img)
@@ -394,48 +1103,84 @@ class ModelService:
             else:
                 logger.error("Failed to encode error image buffer.")
 
-            # Remove all filesystem saving for error image
-            relative_path = f"detection_results/{detector_type}/{output_filename}"
-            
-            return {
-                'detections': [],
-                'relative_path': relative_path, # Just for reference in metadata
-                'summary': f"Error processing image: {str(e)}",
-                'annotated_image_content': annotated_image_content,
-                'output_filename': output_filename
-            }
-    
-    def _draw_modern_annotations(self, img, detections, detector_type):
-        """Draw modern, minimalistic annotations with segmentation-style labels"""
-        h, w = img.shape[:2]
+        relative_path = f"detection_results/{detector_type}/{output_filename}"
         
-        # Create a clean copy of the image for overlays
-        result_img = img.copy()
+        return {
+            'detections': [],
+            'relative_path': relative_path, # Just for reference in metadata
+            'summary': f"Error processing image: {str(error)}",
+            'annotated_image_content': annotated_image_content,
+            'output_filename': output_filename,
+            'error': True
+        }
+    
+    def _draw_error_image(self, detector_type: str, message: str) -> np.ndarray:
+        """Draw the placeholder image shown for a file that failed to process"""
+        error_img = np.zeros((400, 600, 3), dtype=np.uint8)
+        cv2.putText(
+            error_img, 
+            f"Error processing image with {detector_type}", 
+            (20, 150), 
+            cv2.FONT_HERSHEY_SIMPLEX, 
+            0.7, 
+            (255, 255, 255), 
+            1
+        )
+        cv2.putText(
+            error_img, 
+            message, 
+            (20, 200), 
+            cv2.FONT_HERSHEY_SIMPLEX, 
+            0.5, 
+            (200, 100, 100), 
+            1
+        )
+        return error_img
+    
+    def _draw_modern_annotations(self, img, detections, detector_type, model_name=None):
+        """
+        Draw modern, minimalistic annotations with segmentation-style labels
         
-        # Apply slight brightness enhancement to original image (1.1 = 10% brighter)
-        result_img = cv2.convertScaleAbs(result_img, alpha=1.1, beta=5)
+        All semi-transparent box fills are composited into one colour layer and
+        one alpha mask, then blended with the image in a single pass, so the cost
+        grows with the total box area rather than with detections x image size.
+        The header, image and footer are written into one preallocated buffer.
+        """
+        h, w = img.shape[:2]
         
         # Configure header style based on detector type
+        header_bg_color = (37, 37, 38)  # Dark gray
         if detector_type == 'object_detection':
-            header_bg_color = (37, 37, 38)  # Dark gray
             header_accent = (66, 165, 245)  # Blue
             header_text = "COCO Object Detection"
+        elif detector_type == 'damage_assessment':
+            header_accent = (255, 167, 38)  # Orange
+            header_text = "Damage Assessment"
+        elif detector_type == 'emergency_recognition':
+            header_accent = (255, 112, 67)  # Deep orange
+            header_text = "Emergency Recognition"
         else:  # military_detection
-            header_bg_color = (37, 37, 38)  # Dark gray
             header_accent = (239, 83, 80)   # Red
             header_text = "Military Object Detection"
         
         # Calculate label font scale based on image size
         base_font_scale = 0.4 * max(1, min(w, h) / 500)
-        
-        # Add a minimal modern header
         header_height = int(60 * base_font_scale)
-        header_bar = np.zeros((header_height, w, 3), dtype=np.uint8)
-        header_bar[:] = header_bg_color
-        
-        # Add accent line at bottom of header
+        footer_height = int(40 * base_font_scale)
         accent_height = int(3 * base_font_scale)
-        header_bar[-accent_height:, :] = header_accent
+        
+        # One output buffer for header + image + footer
+        result_img = np.empty((header_height + h + footer_height, w, 3), dtype=np.uint8)
+        header_bar = result_img[:header_height]
+        body = result_img[header_height:header_height + h]
+        footer_bar = result_img[header_height + h:]
+        
+        # Apply slight brightness enhancement to original image (1.1 = 10% brighter)
+        cv2.convertScaleAbs(img, dst=body, alpha=1.1, beta=5)
+        
+        # Add a minimal modern header with an accent line at the bottom
+        header_bar[:] = header_bg_color
+        header_bar[header_height - accent_height:] = header_accent
         
         # Add header text
         font_scale = base_font_scale * 1.1
@@ -450,71 +1195,40 @@ class ModelService:
             font_thickness
         )
         
-        # Add the header to the result image
-        result_img = np.vstack([header_bar, result_img])
-        h = result_img.shape[0]  # Update height with header
-        
-        # Draw detections on the overlay
+        # Clip boxes to the image once
+        boxes = []
         for det in detections:
             x_min, y_min, x_max, y_max = map(int, det['bbox'])
+            x_min, y_min = max(0, x_min), max(0, y_min)
+            x_max, y_max = min(w, x_max), min(h, y_max)
             
-            # Adjust for header
+            # Get color for this class
+            rgba_color = COLOR_PALETTE.get(det['label'].lower(), COLOR_PALETTE['default'])
+            boxes.append((x_min, y_min, x_max, y_max, rgba_color[:3], rgba_color[3], det))
+        
+        # Blend the fills box by box
+        # (cv2.rectangle fills include the bottom-right pixel, slices don't)
+        _blend_box_fills(body, [
+            (x1, y1, min(w, x2 + 1), min(h, y2 + 1), color, alpha) 
+            for x1, y1, x2, y2, color, alpha, _ in boxes
+        ])
+        
+        # Borders and labels are opaque, so they are drawn directly
+        border_thickness = max(2, int(3 * base_font_scale))
+        label_font_scale = base_font_scale * 0.9  # Slightly larger font
+        label_thickness = max(1, int(base_font_scale * 1.2))  # Thicker text
+        padding = int(6 * base_font_scale)
+        
+        for x_min, y_min, x_max, y_max, color, _, det in boxes:
             y_min += header_height
             y_max += header_height
             
-            # Make sure coordinates are within bounds
-            x_min = max(0, x_min)
-            y_min = max(0, y_min)
-            x_max = min(w, x_max)
-            y_max = min(h, y_max)
-            
-            label = det['label']
-            conf = det['confidence']
-            
-            # Get color for this class
-            rgba_color = COLOR_PALETTE.get(label.lower(), COLOR_PALETTE['default'])
-            color = rgba_color[:3]  # BGR format
-            alpha = rgba_color[3]   # Transparency value
-            
-            # Create a more visible detection box (semi-transparent fill)
-            overlay = result_img.copy()
-            cv2.rectangle(overlay, (x_min, y_min), (x_max, y_max), color, -1)
-            
-            # Apply alpha blending for the fill
-            cv2.addWeighted(
-                overlay, 
-                alpha, 
-                result_img, 
-                1 - alpha, 
-                0, 
-                result_img
-            )
-            
             # Draw a solid border (more visible)
-            border_thickness = max(2, int(3 * base_font_scale))
-            cv2.rectangle(
-                result_img, 
-                (x_min, y_min), 
-                (x_max, y_max), 
-                color, 
-                border_thickness
-            )
+            cv2.rectangle(result_img, (x_min, y_min), (x_max, y_max), color, border_thickness)
             
             # Create an improved label with better visibility
-            label_text = f"{label} {conf:.2f}"
-            font_scale = base_font_scale * 0.9  # Slightly larger font
-            thickness = max(1, int(base_font_scale * 1.2))  # Thicker text
-            
-            # Get text size for the label
-            (text_width, text_height), baseline = cv2.getTextSize(
-                label_text, 
-                cv2.FONT_HERSHEY_SIMPLEX, 
-                font_scale, 
-                thickness
-            )
-            
-            # Add padding to label background
-            padding = int(6 * base_font_scale)
+            label_text = f"{det['label']} {det['confidence']:.2f}"
+            (text_width, text_height), baseline = _text_size(label_text, label_font_scale, label_thickness)
             
             # Make sure label doesn't go above the image
             label_y_min = max(header_height, y_min - text_height - padding * 2)
@@ -527,10 +1241,8 @@ class ModelService:
                 [x_min, label_y_min + text_height + padding * 2]
             ], np.int32)
             
-            # Draw solid label background (no transparency)
+            # Draw solid label background with a white border for better visibility
             cv2.fillPoly(result_img, [label_bg], color)
-            
-            # Add a white border around the label for better visibility
             cv2.polylines(result_img, [label_bg], True, (255, 255, 255), 1)
             
             # Draw label text in white with improved visibility
@@ -539,21 +1251,16 @@ class ModelService:
                 label_text,
                 (x_min + padding, label_y_min + text_height + padding),
                 cv2.FONT_HERSHEY_SIMPLEX,
-                font_scale,
+                label_font_scale,
                 (255, 255, 255),
-                thickness
+                label_thickness
             )
         
-        # Add a footer with model info
-        footer_height = int(40 * base_font_scale)
-        footer_bar = np.zeros((footer_height, w, 3), dtype=np.uint8)
+        # Add a footer with model info and an accent line at the top
         footer_bar[:] = header_bg_color
+        footer_bar[:accent_height] = header_accent
         
-        # Add accent line at top of footer
-        footer_bar[:accent_height, :] = header_accent
-        
-        # Add model info
-        model_name = list(MODEL_CONFIG[detector_type].keys())[0]
+        model_name = model_name or self.registry.resolve(detector_type)[0] or list(MODEL_CONFIG[detector_type].keys())[0]
         detection_count = f"Detections: {len(detections)}"
         
         # Add model info to footer
@@ -568,12 +1275,7 @@ class ModelService:
         )
         
         # Add detection count to right side
-        (text_width, _), _ = cv2.getTextSize(
-            detection_count, 
-            cv2.FONT_HERSHEY_SIMPLEX, 
-            base_font_scale * 0.7, 
-            1
-        )
+        (text_width, _), _ = _text_size(detection_count, base_font_scale * 0.7, 1)
         
         cv2.putText(
             footer_bar,
@@ -585,132 +1287,265 @@ class ModelService:
             1
         )
         
-        # Add the footer to the result image
-        result_img = np.vstack([result_img, footer_bar])
-        
         return result_img
 
+@lru_cache(maxsize=4096)
+def _text_size(text: str, font_scale: float, thickness: int) -> Tuple[Tuple[int, int], int]:
+    """Cached cv2.getTextSize for the annotation font"""
+    return cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, font_scale, thickness)
+
+def _blend_box_fills(img: np.ndarray, fills: List[Tuple[int, int, int, int, Tuple[int, int, int], float]]):
+    """
+    Blend semi-transparent box fills into an image in place
+    
+    Each fill is blended in turn inside its own box only, so the cost follows
+    the area of the boxes rather than the size of the image. The result matches
+    blending a filled copy of the whole image once per box to within rounding.
+    
+    Args:
+        img: HxWx3 uint8 image, modified in place
+        fills: List of (x_min, y_min, x_max, y_max, bgr_color, alpha)
+    """
+    for x1, y1, x2, y2, color, alpha in fills:
+        if x2 <= x1 or y2 <= y1:
+            continue
+        
+        # roi * (1 - alpha) + color * alpha in one pass, written back into the view
+        blend = np.hstack([np.eye(3) * (1 - alpha), np.asarray(color, dtype=np.float64)[:, None] * alpha])
+        roi = img[y1:y2, x1:x2]
+        cv2.transform(roi, blend, dst=roi)
+
 # Singleton instance
 model_service = ModelService()
 
-def process_marker_file(marker_file, detector_types: List[str]) -> List[Detection]:
+def _process_rss() -> Optional[int]:
+    """Return the resident memory of this process in bytes, if psutil is available"""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        return None
+
+def _estimate_model_size(model, rss_before: Optional[int] = None) -> int:
     """
-    Process a marker file with the requested detector types
+    Estimate how many bytes a loaded model keeps resident
+    
+    Sums parameter and buffer sizes for PyTorch and Keras models; for anything
+    else falls back to the growth of the process RSS during loading.
+    """
+    # Ultralytics wraps the torch module in `.model`
+    torch_module = getattr(model, 'model', model)
+    if hasattr(torch_module, 'parameters') and hasattr(torch_module, 'buffers'):
+        try:
+            tensors = list(torch_module.parameters()) + list(torch_module.buffers())
+            return sum(t.numel() * t.element_size() for t in tensors)
+        except Exception:
+            pass
+    
+    if hasattr(model, 'weights'):
+        try:
+            return sum(int(np.prod(w.shape)) * np.dtype(getattr(w.dtype, 'name', w.dtype)).itemsize for w in model.weights)
+        except Exception:
+            pass
+    
+    rss_after = _process_rss()
+    if rss_before is not None and rss_after is not None:
+        return max(0, rss_after - rss_before)
+    return 0
+
+def _is_yolo(config: Dict) -> bool:
+    """Check if a model configuration is a YOLO detector (PyTorch or exported)"""
+    return config['type'] == 'ultralytics' or (config['type'] == 'onnx' and config.get('task') == 'detect')
+
+def _is_classifier(config: Dict) -> bool:
+    """Check if a model configuration is an image classifier (Keras or exported)"""
+    return config['type'] == 'keras' or (config['type'] == 'onnx' and config.get('task') == 'classify')
+
+def _to_numpy(values) -> np.ndarray:
+    """Convert a torch tensor (or anything array-like) to a NumPy array"""
+    if hasattr(values, 'cpu'):
+        values = values.cpu()
+    if hasattr(values, 'numpy'):
+        return values.numpy()
+    return np.asarray(values)
+
+def _record_timings(result: Dict, build_start: float, **stages: float):
+    """
+    Add stage timings to a freshly built result
+    
+    Postprocessing is the time since `build_start` minus the annotation and
+    encoding the result builder recorded itself.
+    """
+    timings = result.setdefault('timings', {})
+    rendering_time = timings.get('annotate', 0.0) + timings.get('encode', 0.0)
+    timings['postprocess'] = time.perf_counter() - build_start - rendering_time
+    timings.update(stages)
+
+def _image_size(image: DecodedImage) -> Tuple[int, int]:
+    """Return the (width, height) of an image, decoding it if needed"""
+    height, width = image.shape[:2]
+    return width, height
+
+def _add_image_stats(image: DecodedImage, result: Dict):
+    """Add the file's decode time and pixel size to a result"""
+    if image.decode_seconds:
+        result.setdefault('timings', {})['decode'] = image.decode_seconds
+    # Cache hits don't decode the file, so read the size from its header
+    size = image.size or read_image_size(image.file_path)
+    if size:
+        result['image_size'] = list(size)
+
+def get_processable_path(marker_file) -> Optional[str]:
+    """
+    Return the on-disk path of a marker file if the detectors can read it
     
     Args:
         marker_file: MarkerFile instance
-        detector_types: List of detector types to use
         
     Returns:
-        List of created Detection objects
+        Absolute file path, or None if the file is missing or not an image
     """
-    logger.info(f"Processing file ID {marker_file.id} with detector types: {detector_types}")
-    
-    # Check if file exists
     if not marker_file.file:
         logger.warning(f"File not found: {marker_file.id}")
-        return []
+        return None
     
-    try:
-        file_path = marker_file.file.path
-        if not os.path.exists(file_path):
-            logger.warning(f"File does not exist on disk: {file_path}")
-            return []
-            
-        file_ext = os.path.splitext(file_path)[1].lower()
-        
-        # Check if it's a processable image
-        processable_extensions = ['.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff', '.webp']
-        if file_ext not in processable_extensions:
-            logger.warning(f"Skipping non-processable file: {file_path} (format: {file_ext})")
-            return []
-        
-        # Check for existing detections and remove if requested
-        existing_detections = marker_file.detections.filter(detector_type__in=detector_types)
-        if existing_detections.exists():
-            logger.info(f"Found {existing_detections.count()} existing detections, deleting them for reprocessing")
-            
-            # Delete both DB-stored processed_image files AND any legacy filesystem images
-            for det in existing_detections:
-                # 1. Clean up DB-stored images first
-                if det.processed_image:
-                    try:
-                        det.processed_image.delete(save=False)  # Delete file from storage
-                        logger.info(f"Deleted DB-stored image for detection {det.id}")
-                    except Exception as e:
-                        logger.error(f"Error deleting DB-stored image for detection {det.id}: {str(e)}")
-                
-                # 2. Clean up any legacy filesystem images
-                if det.image_path:
-                    try:
-                        legacy_path = det.image_path
-                        if legacy_path.startswith('/'):
-                            legacy_path = legacy_path[1:]
-                        
-                        # Check if file exists in storage before trying to delete
-                        if default_storage.exists(legacy_path):
-                            default_storage.delete(legacy_path)
-                            logger.info(f"Deleted legacy filesystem image: {legacy_path}")
-                    except Exception as e:
-                        logger.error(f"Error deleting legacy filesystem image: {str(e)}")
-            
-            # Now delete the detection records
-            existing_detections.delete()
+    file_path = marker_file.file.path
+    if not os.path.exists(file_path):
+        logger.warning(f"File does not exist on disk: {file_path}")
+        return None
         
-        # Process with model service
-        try:
-            logger.info(f"Calling model service for file {marker_file.id}")
-            start_time = time.time()
-            results = model_service.process_image(file_path, detector_types)
-            logger.info(f"Model processing completed in {time.time() - start_time:.2f}s for detector types: {list(results.keys())}")
-        except Exception as e:
-            logger.error(f"Error in model processing: {str(e)}")
-            logger.error(traceback.format_exc())
-            return []
-        
-        # Create detection records
-        detection_objects = []
+    file_ext = os.path.splitext(file_path)[1].lower()
+    
+    # Check if it's a processable image
+    if file_ext not in PROCESSABLE_EXTENSIONS:
+        logger.warning(f"Skipping non-processable file: {file_path} (format: {file_ext})")
+        return None
+    
+    return file_path
+
+def delete_existing_detections(marker_file, detector_types: List[str]) -> int:
+    """
+    Delete a file's detections for the given detector types, including stored images
+    
+    Stored images are removed only once the surrounding transaction commits,
+    so a rolled back reprocess keeps both the old rows and their files.
+    
+    Args:
+        marker_file: MarkerFile instance
+        detector_types: List of detector types to clear
         
-        for detector_type, result_data in results.items():
+    Returns:
+        Number of Detection records deleted
+    """
+    existing_detections = marker_file.detections.filter(detector_type__in=detector_types)
+    
+    # Collect the files before the rows go away
+    stored_images = []
+    legacy_paths = []
+    for det in existing_detections.only('id', 'processed_image', 'image_path'):
+        if det.processed_image:
+            stored_images.append(det.processed_image.name)
+        if det.image_path:
+            legacy_paths.append(det.image_path.lstrip('/'))
+    
+    count, _ = existing_detections.delete()
+    if not count:
+        return 0
+    
+    logger.info(f"Deleted {count} existing records for file {marker_file.id} for reprocessing")
+    
+    def delete_files():
+        # Delete both DB-stored processed_image files AND any legacy filesystem images
+        for path in stored_images + legacy_paths:
             try:
-                logger.info(f"Creating detection record for {detector_type}")
-                
+                # Check if file exists in storage before trying to delete
+                if default_storage.exists(path):
+                    default_storage.delete(path)
+                    logger.info(f"Deleted stored detection image: {path}")
+            except Exception as e:
+                logger.error(f"Error deleting stored detection image {path}: {str(e)}")
+    
+    transaction.on_commit(delete_files)
+    return count
+
+def save_detection_results(marker_file, results: Dict[str, Any]) -> List[Detection]:
+    """
+    Create Detection and ObjectDetection records from `process_image` results
+    
+    All rows for the file are written in one transaction, with the objects of
+    every detector inserted by a single `bulk_create`. Images written to storage
+    are deleted again if the transaction rolls back, so a failure leaves neither
+    rows nor orphaned files behind.
+    
+    Args:
+        marker_file: MarkerFile instance the results belong to
+        results: Dictionary of results per detector type
+        
+    Returns:
+        List of created Detection objects
+    """
+    detection_objects = []
+    object_detections = []
+    classification_results = []
+    written_images = []
+    timers = []
+    
+    try:
+        with transaction.atomic():
+            for detector_type, result_data in results.items():
                 result = result_data['result']
+                timer = StageTimer()
                 
                 # Create base detection with only the processed_image field, not image_path
                 detection = Detection(
                     marker_file=marker_file,
                     detector_type=detector_type,
                     model_name=result_data['model_name'],
-                    summary=result.get('summary', '')
+                    summary=result.get('summary', ''),
+                    fingerprint=result_data.get('params_key') or ''
                 )
                 
                 # Set metadata
                 if 'inference_time' in result:
                     detection.metadata = {'inference_time': result['inference_time']}
+                    if 'batch_size' in result:
+                        detection.metadata['batch_size'] = result['batch_size']
+                
+                # Inputs the result was computed from, compared by staleness.stale_pairs
+                fingerprint = {key: result_data[key] for key in staleness.FINGERPRINT_KEYS if result_data.get(key)}
+                if fingerprint:
+                    detection.metadata = {**(detection.metadata or {}), **fingerprint}
+                
+                # Lets the on-demand renderer show the error placeholder
+                if result.get('error'):
+                    detection.metadata = {**(detection.metadata or {}), 'error': True}
+                
+                # Input size, tiling and annotation picked by the inference policy
+                if result.get('inference'):
+                    detection.metadata = {**(detection.metadata or {}), 'inference': result['inference']}
+                
+                # Pixel size of the file, reported next to the stage timings by timing.aggregate_timings
+                if result.get('image_size'):
+                    width, height = result['image_size']
+                    detection.metadata = {**(detection.metadata or {}), 'image': {'width': width, 'height': height}}
                 
                 # Store image ONLY in the processed_image field, not filesystem
                 annotated_image_content = result.get('annotated_image_content')
                 output_filename = result.get('output_filename')
                 
                 if annotated_image_content and output_filename:
-                    try:
+                    with timer.stage('storage'):
                         detection.processed_image.save(output_filename, annotated_image_content, save=False)
-                        logger.info(f"Saved processed image to database for detection {detector_type}")
-                    except Exception as e:
-                        logger.error(f"Error saving processed image to database: {str(e)}")
-                        
-                    # Don't set image_path for new detections - use only processed_image field
-                else:
-                    logger.warning(f"No image content for {detector_type} detection")
+                    written_images.append(detection.processed_image.name)
                 
                 # Save the detection record
-                detection.save()
-                logger.info(f"Saved detection ID {detection.id}")
+                with timer.stage('db'):
+                    detection.save()
+                timers.append((result.get('timings', {}), timer))
                 
-                # Store individual detections (ObjectDetection instances)
+                # Individual detections (ObjectDetection instances) are inserted together below
                 for det_data in result.get('detections', []):
-                    ObjectDetection.objects.create(
+                    object_detections.append(ObjectDetection(
                         detection=detection,
                         label=det_data['label'],
                         confidence=det_data['confidence'],
@@ -718,34 +1553,246 @@ def process_marker_file(marker_file, detector_types: List[str]) -> List[Detectio
                         y_min=det_data['bbox'][1],
                         x_max=det_data['bbox'][2],
                         y_max=det_data['bbox'][3]
-                    )
-                    # logger.info(f"Created object detection {object_detection.id}: {det_data['label']} ({det_data['confidence']:.2f})") # Redundant logging
+                    ))
                 
-                detection_objects.append(detection)
+                # Image-level labels of classifiers (ClassificationResult instances)
+                for class_data in result.get('classifications', []):
+                    classification_results.append(ClassificationResult(
+                        detection=detection,
+                        label=class_data['label'],
+                        confidence=class_data['confidence'],
+                        metadata={'crops': class_data['crops']} if 'crops' in class_data else None
+                    ))
                 
+                detection_objects.append(detection)
+            
+            bulk_start = time.perf_counter()
+            ObjectDetection.objects.bulk_create(object_detections, batch_size=BULK_INSERT_BATCH_SIZE)
+            ClassificationResult.objects.bulk_create(classification_results, batch_size=BULK_INSERT_BATCH_SIZE)
+            bulk_time = (time.perf_counter() - bulk_start) / max(1, len(detection_objects))
+            
+            # The database stage is only known once everything is inserted, so timings are added last
+            for detection, (timings, timer) in zip(detection_objects, timers):
+                timer.add('db', bulk_time)
+                detection.metadata = {
+                    **(detection.metadata or {}),
+                    'timings': {stage: round(seconds, 6) for stage, seconds in {**timings, **timer.seconds}.items()}
+                }
+            Detection._default_manager.bulk_update(detection_objects, ['metadata'])
+    except Exception:
+        # The rows were rolled back, remove the images written for them
+        for path in written_images:
+            try:
+                default_storage.delete(path)
             except Exception as e:
-                logger.error(f"Error creating detection record: {str(e)}")
-                logger.error(traceback.format_exc())
+                logger.error(f"Error deleting orphaned detection image {path}: {str(e)}")
+        raise
+    
+    logger.info(f"Saved {len(detection_objects)} detections with {len(object_detections)} objects for file {marker_file.id}")
+    return detection_objects
+
+def replace_detection_results(marker_file, detector_types: List[str], results: Dict[str, Any]) -> List[Detection]:
+    """
+    Replace a file's detections for the given detector types in one transaction
+    
+    Args:
+        marker_file: MarkerFile instance
+        detector_types: Detector types the file was processed with
+        results: Dictionary of results per detector type
+        
+    Returns:
+        List of created Detection objects
+    """
+    with transaction.atomic():
+        delete_existing_detections(marker_file, detector_types)
+        return save_detection_results(marker_file, results)
+
+def process_marker_file(marker_file, detector_types: List[str]) -> List[Detection]:
+    """
+    Process a marker file with the requested detector types
+    
+    Args:
+        marker_file: MarkerFile instance
+        detector_types: List of detector types to use
         
-        return detection_objects
+    Returns:
+        List of created Detection objects
+    """
+    logger.info(f"Processing file ID {marker_file.id} with detector types: {detector_types}")
+    
+    try:
+        file_path = get_processable_path(marker_file)
+        if file_path is None:
+            return []
+        
+        # Process with model service
+        try:
+            logger.info(f"Calling model service for file {marker_file.id}")
+            start_time = time.time()
+            results = model_service.process_image(file_path, detector_types)
+            logger.info(f"Model processing completed in {time.time() - start_time:.2f}s for detector types: {list(results.keys())}")
+        except Exception as e:
+            logger.error(f"Error in model processing: {str(e)}")
+            logger.error(traceback.format_exc())
+            return []
+        
+        # Replace the existing detections with the new records
+        return replace_detection_results(marker_file, detector_types, results)
         
     except Exception as e:
         logger.error(f"Error in process_marker_file: {str(e)}")
         logger.error(traceback.format_exc())
         return []
 
-def process_marker(marker) -> Dict[str, int]:
+def process_marker_files_batched(marker_files, detector_types: List[str], batch_size: int = None, 
+                                 progress: ProgressTracker = None) -> Dict[int, List[Detection]]:
     """
-    Process all files for a marker based on its detection settings
+    Process several marker files together so each detector runs on batches of images
     
     Args:
-        marker: Marker instance
+        marker_files: Iterable of MarkerFile instances
+        detector_types: List of detector types to use
+        batch_size: Maximum number of files decoded and sent to the models at once.
+            Defaults to the largest `batch_size` among the requested detectors.
+            Batches are also kept within `batch_memory_mb` of decoded pixels.
+        progress: Tracker updated as each detector finishes a batch and as files are saved
         
     Returns:
-        Summary of processed files and detections
+        Dictionary mapping marker file ID to its created Detection objects
     """
-    logger.info(f"Starting process_marker for marker ID {marker.id}")
+    if batch_size is None:
+        batch_size = get_batch_size(detector_types)
+    memory_budget = model_service.cache_settings['batch_memory_mb'] * 1024 * 1024
     
+    # Keep only files the detectors can read
+    marker_files = list(marker_files)
+    processable = []
+    for marker_file in marker_files:
+        file_path = get_processable_path(marker_file)
+        if file_path is not None:
+            processable.append((marker_file, file_path))
+    
+    # Unreadable files count as handled straight away
+    if progress:
+        progress.files_skipped(len(marker_files) - len(processable))
+    
+    created = {}
+    for chunk in chunk_files(processable, batch_size, memory_budget):
+        # Lets a cancelled or overdue job stop before the next batch
+        if progress:
+            progress.batch_started(len(chunk))
+        
+        try:
+            start_time = time.time()
+            batch_results = model_service.process_batch([file_path for _, file_path in chunk], detector_types, progress)
+            logger.info(f"Model processing of {len(chunk)} files completed in {time.time() - start_time:.2f}s")
+        except ProcessingAborted:
+            raise
+        except Exception as e:
+            logger.error(f"Error in batched model processing: {str(e)}")
+            logger.error(traceback.format_exc())
+            if progress:
+                progress.files_skipped(len(chunk))
+            continue
+        
+        for marker_file, file_path in chunk:
+            try:
+                created[marker_file.id] = replace_detection_results(marker_file, detector_types, batch_results.get(file_path, {}))
+            except Exception as e:
+                logger.error(f"Error saving results for file {marker_file.id}: {str(e)}")
+                logger.error(traceback.format_exc())
+        
+        # Saved results are visible to pollers from here on
+        if progress:
+            progress.files_finished([marker_file.id for marker_file, _ in chunk])
+    
+    return created
+
+def process_stale_files(marker_files, detector_types: List[str], progress: ProgressTracker = None) -> Dict[int, List[Detection]]:
+    """
+    Process only the (file, detector) pairs whose results are missing or out of date
+    
+    Up-to-date results are kept as they are. Files with the same set of stale
+    detectors are batched together.
+    
+    Args:
+        marker_files: Iterable of MarkerFile instances
+        detector_types: List of detector types to use
+        progress: Tracker updated as work completes; up-to-date pairs count as done
+        
+    Returns:
+        Dictionary mapping marker file ID to its created Detection objects
+    """
+    marker_files = list(marker_files)
+    stale = staleness.stale_pairs(marker_files, detector_types)
+    logger.info(f"{len(stale)} of {len(marker_files)} files have stale results for {detector_types}")
+    
+    if progress:
+        progress.files_skipped(len(marker_files) - len(stale))
+    
+    # Group files by the detectors they need, keeping the detector order so box sources run before classifiers
+    groups = OrderedDict()
+    for marker_file in marker_files:
+        reasons = stale.get(marker_file.id)
+        if reasons:
+            groups.setdefault(tuple(dt for dt in detector_types if dt in reasons), []).append(marker_file)
+    
+    created = {}
+    for group_types, group_files in groups.items():
+        if progress:
+            for detector_type in detector_types:
+                if detector_type not in group_types:
+                    progress.detector_skipped(detector_type, len(group_files))
+        created.update(process_marker_files_batched(group_files, list(group_types), progress=progress))
+    
+    return created
+
+def estimate_decoded_bytes(file_path: str) -> int:
+    """Estimate the memory a file takes once decoded to BGR pixels, without decoding it"""
+    size = read_image_size(file_path)
+    if size:
+        return size[0] * size[1] * 3
+    try:
+        return os.path.getsize(file_path) * DECODED_BYTES_PER_FILE_BYTE
+    except OSError:
+        return 0
+
+def chunk_files(processable: List[Tuple[Any, str]], batch_size: int, memory_budget: int) -> List[List[Tuple[Any, str]]]:
+    """
+    Split (marker file, path) pairs into batches of at most `batch_size` files
+    and `memory_budget` bytes of decoded pixels
+    
+    A file larger than the budget on its own gets a batch to itself.
+    """
+    chunks = []
+    chunk, chunk_bytes = [], 0
+    for item in processable:
+        decoded_bytes = estimate_decoded_bytes(item[1])
+        if chunk and (len(chunk) >= batch_size or chunk_bytes + decoded_bytes > memory_budget):
+            chunks.append(chunk)
+            chunk, chunk_bytes = [], 0
+        chunk.append(item)
+        chunk_bytes += decoded_bytes
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+def get_batch_size(detector_types: List[str]) -> int:
+    """Return the largest configured batch size among the given detector types"""
+    configs = [model_service.resolve_model(detector_type)[1] for detector_type in detector_types]
+    sizes = [config.get('batch_size', DEFAULT_BATCH_SIZE) for config in configs if config]
+    return max(sizes, default=DEFAULT_BATCH_SIZE)
+
+def get_marker_detector_types(marker) -> List[str]:
+    """
+    Return the detector types enabled on a marker
+    
+    Args:
+        marker: Marker instance
+        
+    Returns:
+        List of detector type names
+    """
     detector_types = []
     
     # Check which detector types are enabled - use the correct field names
@@ -758,6 +1805,35 @@ def process_marker(marker) -> Dict[str, int]:
     if marker.thermal_analysis:  # Model field name
         detector_types.append('emergency_recognition')  # Detector type name
     
+    return detector_types
+
+def process_marker(marker, batched: bool = True, progress_callback: Callable[[Dict[str, Any]], None] = None,
+                   incremental: bool = False, detector_types: List[str] = None,
+                   heartbeat: Callable[[int], None] = None, file_ids: List[int] = None) -> Dict[str, int]:
+    """
+    Process all files for a marker based on its detection settings
+    
+    Args:
+        marker: Marker instance
+        batched: Send files to the models in batches instead of one at a time
+        progress_callback: Called with a progress snapshot (files and per-detector
+            counts, throughput, ETA and recently finished file IDs) as work completes.
+            It may raise ProcessingAborted to stop the run.
+        incremental: Only process files whose results are missing or stale (new or
+            replaced files, changed weights or parameters) and keep the others
+        detector_types: Detector types to run instead of the ones enabled on the marker
+        heartbeat: Called with the size of the current batch each time work starts
+            or advances (see ProgressTracker)
+        file_ids: Only process these files of the marker
+        
+    Returns:
+        Summary of processed files and detections
+    """
+    logger.info(f"Starting process_marker for marker ID {marker.id}")
+    
+    if detector_types is None:
+        detector_types = get_marker_detector_types(marker)
+    
     logger.info(f"Enabled detector types: {detector_types}")
     
     if not detector_types:
@@ -770,30 +1846,48 @@ def process_marker(marker) -> Dict[str, int]:
     error_count = 0
     start_time = time.time()
     
-    # Process all files
-    for marker_file in marker.files.all():
-        try:
-            file_path = marker_file.file.path
-            # Check if the file exists
-            if not os.path.exists(file_path):
-                logger.warning(f"File not found on disk: {file_path}")
-                error_count += 1
-                continue
-                
-            logger.info(f"Processing file {marker_file.id} with detector types {detector_types}")
-            detections = process_marker_file(marker_file, detector_types)
-            
-            if detections:
-                processed_count += 1
-                detection_count += len(detections)
-                logger.info(f"Created {len(detections)} detections for file {marker_file.id}")
-            else:
-                logger.info(f"No detections created for file {marker_file.id}")
-                
-        except Exception as e:
-            logger.error(f"Error processing file {marker_file.id}: {str(e)}")
-            logger.error(traceback.format_exc())
+    # Files missing on disk are counted as errors up front
+    all_files = marker.files.all()
+    if file_ids:
+        all_files = all_files.filter(id__in=file_ids)
+    all_files = list(all_files)
+    marker_files = []
+    for marker_file in all_files:
+        if not marker_file.file or not os.path.exists(marker_file.file.path):
+            logger.warning(f"File not found on disk: {marker_file.file}")
             error_count += 1
+        else:
+            marker_files.append(marker_file)
+    
+    progress = ProgressTracker(len(all_files), detector_types, callback=progress_callback, heartbeat=heartbeat)
+    progress.files_skipped(len(all_files) - len(marker_files))
+    
+    if incremental:
+        created = process_stale_files(marker_files, detector_types, progress=progress)
+    elif batched:
+        created = process_marker_files_batched(marker_files, detector_types, progress=progress)
+    else:
+        created = {}
+        for marker_file in marker_files:
+            progress.batch_started(1)
+            try:
+                logger.info(f"Processing file {marker_file.id} with detector types {detector_types}")
+                created[marker_file.id] = process_marker_file(marker_file, detector_types)
+            except Exception as e:
+                logger.error(f"Error processing file {marker_file.id}: {str(e)}")
+                logger.error(traceback.format_exc())
+                error_count += 1
+            for detector_type in detector_types:
+                progress.detector_done(detector_type, 1)
+            progress.files_finished([marker_file.id])
+    
+    for marker_file_id, detections in created.items():
+        if detections:
+            processed_count += 1
+            detection_count += len(detections)
+            logger.info(f"Created {len(detections)} detections for file {marker_file_id}")
+        else:
+            logger.info(f"No detections created for file {marker_file_id}")
     
     # Calculate total processing time
     total_time = time.time() - start_time
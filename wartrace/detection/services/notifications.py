@@ -0,0 +1,101 @@
+import logging
+import time
+from datetime import datetime, timezone as dt_timezone
+from typing import Any, Dict, List, Optional
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db.models import Count
+
+from ..models import Detection, DetectionJob
+from . import jobs
+
+logger = logging.getLogger(__name__)
+
+
+def marker_group(marker_id: int) -> str:
+    """Name of the channel layer group receiving a marker's processing updates"""
+    return f"detection_marker_{marker_id}"
+
+
+def new_results(marker_id: int, since: float) -> List[Dict[str, Any]]:
+    """
+    List the detections saved for a marker's files after a given time
+
+    Args:
+        marker_id: ID of the marker whose detections are listed
+        since: Unix timestamp; only detections created after it are returned
+
+    Returns:
+        One dictionary per detection with its file, summary and image URL
+    """
+    detections = Detection._default_manager.filter(
+        marker_file__marker_id=marker_id,
+        created_at__gt=datetime.fromtimestamp(since, tz=dt_timezone.utc)
+    ).annotate(
+        object_count=Count('objects')
+    ).order_by('created_at')
+
+    return [
+        {
+            'file_id': detection.marker_file_id,
+            'detection_id': detection.id,
+            'detector_type': detection.detector_type,
+            'summary': detection.summary,
+            'object_count': detection.object_count,
+            'image_url': detection.image_url,
+        }
+        for detection in detections
+    ]
+
+
+def status_message(job: Optional[DetectionJob], marker_id: int, since: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Build a status message, the same payload `marker_processing_status` returns
+
+    Args:
+        job: Latest job of the marker, if any
+        marker_id: ID of the marker
+        since: Include results saved after this Unix timestamp
+
+    Returns:
+        The job status with `server_time` and, with `since`, `new_results`
+    """
+    # Read the clock before querying so nothing saved in between is missed next time
+    server_time = time.time()
+    message = jobs.job_status_payload(job)
+    message['server_time'] = server_time
+    if since is not None:
+        message['new_results'] = new_results(marker_id, since)
+    return message
+
+
+def publish_status(job: DetectionJob, since: Optional[float] = None) -> Optional[float]:
+    """
+    Send a job's status to the WebSocket clients watching its marker
+
+    Failures are logged and swallowed: clients fall back to polling the
+    status endpoint, so an unavailable channel layer must not fail the job.
+
+    Args:
+        job: The job whose state changed
+        since: Include results saved after this Unix timestamp
+
+    Returns:
+        The message's server_time to pass as `since` next time, or None if nothing was sent
+    """
+    try:
+        # A missing or misconfigured backend raises here
+        channel_layer = get_channel_layer()
+        if channel_layer is None:
+            return None
+
+        message = status_message(job, job.marker_id, since)
+        async_to_sync(channel_layer.group_send)(
+            marker_group(job.marker_id),
+            {'type': 'processing_status', 'status': message}
+        )
+        return message['server_time']
+    except Exception as e:
+        logger.error(f"Error publishing status of detection job {job.id}: {str(e)}")
+        return None
@@ -0,0 +1,173 @@
+import logging
+import os
+from typing import Dict, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Values of DETECTION_MODELS['backend']
+BACKEND_NATIVE = 'native'        # PyTorch through ultralytics, TensorFlow for Keras models
+BACKEND_ONNX = 'onnx'            # Exported float32 ONNX models on ONNX Runtime
+BACKEND_ONNX_INT8 = 'onnx_int8'  # Exported and dynamically quantized int8 ONNX models
+
+BACKENDS = [BACKEND_NATIVE, BACKEND_ONNX, BACKEND_ONNX_INT8]
+
+# Exports already reported missing, so the warning is logged once per process
+_missing_exports = set()
+
+
+def onnx_path(model_path: str, quantized: bool = False) -> str:
+    """Return where the ONNX export of a native model file is stored"""
+    stem = os.path.splitext(model_path)[0]
+    return f"{stem}.int8.onnx" if quantized else f"{stem}.onnx"
+
+
+def apply_backend(config: Dict, backend: str) -> Dict:
+    """
+    Return a model configuration switched to the requested backend
+
+    The exported file must exist (see the `export_onnx_models` command);
+    otherwise the native configuration is returned unchanged.
+    """
+    if backend == BACKEND_NATIVE or config['type'] not in ('ultralytics', 'keras'):
+        return config
+
+    path = onnx_path(config['model_path'], quantized=backend == BACKEND_ONNX_INT8)
+    if not os.path.exists(path):
+        if path not in _missing_exports:
+            logger.warning(f"No {backend} export at {path}, using the native model")
+            _missing_exports.add(path)
+        return config
+
+    return {
+        **config,
+        'type': 'onnx',
+        'task': 'detect' if config['type'] == 'ultralytics' else 'classify',
+        'model_path': path,
+        'native_model_path': config['model_path'],
+    }
+
+
+def session_options(threads: Optional[int] = None):
+    """ONNX Runtime session options honouring the worker's thread budget"""
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    threads = threads or int(os.environ.get('OMP_NUM_THREADS', 0))
+    if threads:
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+    return options
+
+
+class OnnxClassifier:
+    """
+    ONNX Runtime session exposing the part of the Keras model API used by ModelService
+
+    Supports `input_shape` and `predict`, so exported classifiers go through
+    the same batched crop path as the Keras originals.
+    """
+
+    def __init__(self, model_path: str, threads: Optional[int] = None):
+        import onnxruntime as ort
+
+        self.session = ort.InferenceSession(
+            model_path,
+            sess_options=session_options(threads),
+            providers=['CPUExecutionProvider']
+        )
+        self.input_name = self.session.get_inputs()[0].name
+        self.output_name = self.session.get_outputs()[0].name
+
+    @property
+    def input_shape(self):
+        """Input shape with None for dynamic dimensions, like `keras.Model.input_shape`"""
+        return tuple(dim if isinstance(dim, int) else None for dim in self.session.get_inputs()[0].shape)
+
+    def predict(self, inputs: np.ndarray, batch_size: int = None, verbose: int = 0) -> np.ndarray:
+        """Run the classifier on a float32 NHWC batch"""
+        inputs = np.ascontiguousarray(inputs, dtype=np.float32)
+        batch_size = batch_size or len(inputs)
+
+        outputs = [
+            self.session.run([self.output_name], {self.input_name: inputs[offset:offset + batch_size]})[0]
+            for offset in range(0, len(inputs), batch_size)
+        ]
+        return np.concatenate(outputs) if outputs else np.empty((0,), dtype=np.float32)
+
+
+def load_onnx_model(config: Dict, threads: Optional[int] = None):
+    """
+    Load an exported model for inference
+
+    Detectors are loaded through ultralytics, which runs `.onnx` files on
+    ONNX Runtime with the same call interface as the PyTorch models.
+
+    Args:
+        config: Model configuration switched to the export by `apply_backend`
+        threads: Intra-op threads of classifier sessions (default: the worker's budget)
+    """
+    if config.get('task') == 'classify':
+        return OnnxClassifier(config['model_path'], threads)
+
+    from ultralytics import YOLO
+    return YOLO(config['model_path'], task='detect')
+
+
+def export_model(config: Dict, opset: int = 17) -> str:
+    """
+    Export a native model file to ONNX next to the original
+
+    Args:
+        config: Native model configuration from MODEL_CONFIG
+        opset: ONNX opset version
+
+    Returns:
+        Path of the exported float32 model
+    """
+    target = onnx_path(config['model_path'])
+
+    if config['type'] == 'ultralytics':
+        from ultralytics import YOLO
+
+        # Dynamic axes so batched and tiled calls can use any batch size
+        exported = YOLO(config['model_path']).export(
+            format='onnx',
+            imgsz=int(config.get('imgsz', 640)),
+            dynamic=True,
+            simplify=True,
+            opset=opset
+        )
+        if os.path.abspath(exported) != os.path.abspath(target):
+            os.replace(exported, target)
+
+    elif config['type'] == 'keras':
+        import tensorflow as tf
+        import tf2onnx
+
+        model = tf.keras.models.load_model(config['model_path'])
+        signature = (tf.TensorSpec((None,) + tuple(model.input_shape[1:]), tf.float32, name='input'),)
+        tf2onnx.convert.from_keras(model, input_signature=signature, opset=opset, output_path=target)
+
+    else:
+        raise ValueError(f"Cannot export model type to ONNX: {config['type']}")
+
+    logger.info(f"Exported {config['model_path']} to {target}")
+    return target
+
+
+def quantize_model(fp32_path: str) -> str:
+    """
+    Quantize an exported model's weights to int8 with dynamic activation quantization
+
+    Returns:
+        Path of the quantized model
+    """
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    target = fp32_path[:-len('.onnx')] + '.int8.onnx'
+    quantize_dynamic(fp32_path, target, weight_type=QuantType.QInt8)
+    logger.info(f"Quantized {fp32_path} to {target}")
+    return target
@@ -0,0 +1,199 @@
+import logging
+import math
+import time
+import traceback
+from typing import Any, Dict, Optional, Tuple
+
+from django.conf import settings
+
+from ..models import DetectionJob
+from . import tiling
+
+logger = logging.getLogger(__name__)
+
+# Degradation levels, cheapest last. A level applies once the estimated
+# backlog (seconds of queued work, see `admission`) reaches `min_backlog_seconds`.
+LEVELS = [
+    {
+        'name': 'full',
+        'min_backlog_seconds': 0,
+        'max_imgsz': None,           # Cap on the configured input size (None = as configured)
+        'tiling': True,              # Keep tiling as configured
+        'tile_min_image_size': None, # Raise the size from which images are tiled (None = as configured)
+        'annotation': 'full',        # Overlays drawn at full resolution (eager and on-demand renders)
+    },
+    {
+        'name': 'reduced',
+        'min_backlog_seconds': 300,
+        'max_imgsz': 512,
+        'tiling': True,
+        'tile_min_image_size': 4000,  # Only very large frames are still tiled
+        'annotation': 'half',
+    },
+    {
+        'name': 'minimal',
+        'min_backlog_seconds': 900,
+        'max_imgsz': 416,
+        'tiling': False,
+        'tile_min_image_size': None,
+        'annotation': 'half',
+    },
+]
+
+# Defaults for settings.DETECTION_POLICY
+POLICY_DEFAULTS = {
+    'enabled': True,
+    'check_interval': 10.0,          # Seconds between two measurements of the queue depth
+    'min_imgsz': 320,                # Small images run at their own size rounded up to the stride, but not below this
+    'stride': 32,                    # Input sizes are multiples of the model stride
+    'half_annotation_size': 4000,    # Images whose longer side is at least this are annotated at half size
+    'levels': LEVELS,
+}
+
+# Last measured level, shared by every detector of the process
+_current = {'level': None, 'backlog_seconds': None, 'checked_at': 0.0}
+
+
+def get_policy_settings() -> Dict[str, Any]:
+    """Return the policy settings merged over the defaults"""
+    policy_settings = dict(POLICY_DEFAULTS)
+    policy_settings.update(getattr(settings, 'DETECTION_POLICY', {}))
+    return policy_settings
+
+
+def backlog_seconds() -> float:
+    """Estimate the seconds of work waiting in the job queue, including what running jobs have left"""
+    from . import admission
+
+    _, files = admission.queue_ahead(DetectionJob.PRIORITY_BACKGROUND)
+    return files / admission.files_per_second()
+
+
+def current_level() -> Tuple[Optional[Dict[str, Any]], Optional[float]]:
+    """
+    Return the level the pipeline runs at now and the backlog it was chosen from
+
+    The queue is measured at most every `check_interval` seconds. If it
+    can't be measured, the full level is used.
+
+    Returns:
+        Tuple of (level, backlog seconds), or (None, None) if the policy is disabled
+    """
+    policy_settings = get_policy_settings()
+    levels = policy_settings['levels']
+    if not policy_settings['enabled']:
+        return None, None
+
+    now = time.time()
+    if _current['level'] is None or now - _current['checked_at'] >= policy_settings['check_interval']:
+        try:
+            backlog = backlog_seconds()
+        except Exception as e:
+            logger.error(f"Error measuring the detection backlog: {str(e)}")
+            logger.error(traceback.format_exc())
+            backlog = None
+
+        level = levels[0]
+        if backlog is not None:
+            for candidate in levels:
+                if backlog >= candidate['min_backlog_seconds']:
+                    level = candidate
+
+        if _current['level'] is not None and level['name'] != _current['level']['name']:
+            logger.warning(f"Detection backlog at {'~%.0fs' % backlog if backlog is not None else 'unknown'}, "
+                           f"switching from {_current['level']['name']} to {level['name']} inference settings")
+        _current.update(level=level, backlog_seconds=backlog, checked_at=now)
+
+    return _current['level'], _current['backlog_seconds']
+
+
+def is_degraded(level: Dict[str, Any]) -> bool:
+    """Check whether a level trades recall for speed"""
+    return level['name'] != get_policy_settings()['levels'][0]['name']
+
+
+def level_config(config: Dict, level: Dict[str, Any], backlog: Optional[float] = None) -> Dict:
+    """
+    Apply a level to a YOLO detector's configuration
+
+    The returned configuration feeds `result_cache.params_key`, so results
+    computed at a degraded level don't look up to date and are redone by the
+    next incremental run.
+
+    Args:
+        config: Effective detector configuration from `ModelService.resolve_model`
+        level: One of the policy levels
+        backlog: Backlog the level was chosen from, recorded with the results
+    """
+    config = dict(config)
+    if level['max_imgsz']:
+        config['imgsz'] = min(int(config.get('imgsz', level['max_imgsz'])), level['max_imgsz'])
+
+    tiling_settings = tiling.get_tiling_settings(config)
+    if not level['tiling']:
+        tiling_settings['enabled'] = False
+    elif level['tile_min_image_size']:
+        tiling_settings['min_image_size'] = max(tiling_settings['min_image_size'], level['tile_min_image_size'])
+    if tiling_settings != tiling.get_tiling_settings(config):
+        config['tiling'] = tiling_settings
+
+    config['policy'] = {'level': level['name'], 'annotation': level['annotation'], 'backlog_seconds': backlog}
+    return config
+
+
+def image_config(config: Dict, image_size: Tuple[int, int]) -> Dict:
+    """
+    Pick the input size and annotation scale for one image
+
+    Images smaller than the input size are run at their own size rounded up
+    to the stride instead of being upscaled, and very large images are
+    annotated at half size. Both depend only on the image, so they don't
+    change the result's fingerprint.
+
+    Args:
+        config: Configuration from `level_config`
+        image_size: (width, height) of the decoded image
+    """
+    policy_settings = get_policy_settings()
+    stride = policy_settings['stride']
+    longer_side = max(image_size)
+
+    config = dict(config)
+    configured = int(config.get('imgsz', 640))
+    native = int(math.ceil(longer_side / stride) * stride)
+    config['imgsz'] = max(min(configured, native), min(configured, policy_settings['min_imgsz']))
+
+    policy = dict(config.get('policy') or {})
+    if longer_side >= policy_settings['half_annotation_size']:
+        policy['annotation'] = 'half'
+    config['policy'] = policy
+    return config
+
+
+def settings_used(config: Dict, tiled: bool) -> Dict[str, Any]:
+    """Describe the settings an image was processed with, stored in Detection.metadata['inference']"""
+    policy = config.get('policy') or {}
+    backlog = policy.get('backlog_seconds')
+    return {
+        'level': policy.get('level'),
+        'imgsz': int(config['imgsz']),
+        'tiled': tiled,
+        'annotation': policy.get('annotation', 'full'),
+        'backlog_seconds': round(backlog, 1) if backlog is not None else None,
+    }
+
+
+def cached_settings(config: Dict, image_size: Tuple[int, int]) -> Dict[str, Any]:
+    """
+    Describe the settings of a result reused from the result cache
+
+    Only results computed at the full level are cached, so this is what the
+    full level would have used for the image, whatever the current level.
+
+    Args:
+        config: Effective detector configuration from `ModelService.resolve_model`
+        image_size: (width, height) of the image
+    """
+    full_config = image_config(level_config(config, get_policy_settings()['levels'][0]), image_size)
+    tiled = tiling.should_tile(image_size, tiling.get_tiling_settings(full_config))
+    return {**settings_used(full_config, tiled), 'cached': True}
@@ -0,0 +1,146 @@
+import logging
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Minimum seconds between two progress reports (the last one is always sent)
+REPORT_INTERVAL = 1.0
+
+# Number of recently finished files listed in each report
+RECENT_FILES = 20
+
+
+class ProcessingAborted(Exception):
+    """Raised from a progress callback or heartbeat to stop processing (e.g. the job was taken over)"""
+
+
+class ProgressTracker:
+    """
+    Tracks progress of a marker run per file and per detector
+
+    One unit of work is one file processed by one detector. Throughput is
+    measured on units actually processed, so files skipped up front don't make
+    the ETA look better than it is.
+    """
+
+    def __init__(self, files_total: int, detector_types: List[str],
+                 callback: Optional[Callable[[Dict[str, Any]], None]] = None,
+                 report_interval: float = REPORT_INTERVAL,
+                 heartbeat: Optional[Callable[[int], None]] = None):
+        """
+        Args:
+            files_total: Files in the run
+            detector_types: Detector types run on the files
+            callback: Receives snapshots; may raise ProcessingAborted to stop the run
+            report_interval: Minimum seconds between two snapshots
+            heartbeat: Called with the number of files in the current batch whenever
+                work starts or advances, without throttling (used by the worker watchdog
+                and job lease); may raise ProcessingAborted
+        """
+        self.files_total = files_total
+        self.detector_types = list(detector_types)
+        self.callback = callback
+        self.report_interval = report_interval
+        self.heartbeat = heartbeat
+        self.batch_files = 1
+
+        self.files_done = 0
+        self.detectors = {detector_type: 0 for detector_type in self.detector_types}
+        self.skipped = {detector_type: 0 for detector_type in self.detector_types}
+        self.recent_file_ids = deque(maxlen=RECENT_FILES)
+
+        self.started_at = time.time()
+        self._reported_at = 0.0
+
+    @property
+    def units_total(self) -> int:
+        return self.files_total * len(self.detector_types)
+
+    @property
+    def units_done(self) -> int:
+        return min(self.units_total, sum(self.detectors.values()) + sum(self.skipped.values()))
+
+    def files_skipped(self, count: int = 1):
+        """Count files that won't be processed (missing or unreadable) as done"""
+        if not count:
+            return
+        self.files_done += count
+        for detector_type in self.detector_types:
+            self.skipped[detector_type] += count
+        self.report()
+
+    def detector_skipped(self, detector_type: str, count: int):
+        """Count files a detector doesn't need to process (e.g. up-to-date results) as done"""
+        self.skipped[detector_type] = self.skipped.get(detector_type, 0) + count
+
+    def batch_started(self, file_count: int):
+        """
+        Record that a batch of files is about to be processed
+
+        Always reports, so the callback can stop the run between batches.
+        """
+        self.batch_files = max(1, file_count)
+        self._beat()
+        self.report(force=True)
+
+    def detector_done(self, detector_type: str, count: int):
+        """Record that a detector finished `count` more files"""
+        self.detectors[detector_type] = self.detectors.get(detector_type, 0) + count
+        self._beat()
+        self.report()
+
+    def files_finished(self, marker_file_ids: Iterable[int]):
+        """Record files whose results are saved and visible"""
+        marker_file_ids = list(marker_file_ids)
+        self.files_done += len(marker_file_ids)
+        self.recent_file_ids.extend(marker_file_ids)
+        self.report(force=self.files_done >= self.files_total)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return the current progress, throughput and ETA"""
+        elapsed = time.time() - self.started_at
+        processed_units = sum(self.detectors.values())
+        throughput = processed_units / elapsed if elapsed > 0 else 0.0
+        remaining_units = self.units_total - self.units_done
+
+        if remaining_units <= 0:
+            eta_seconds = 0
+        elif throughput > 0:
+            eta_seconds = int(round(remaining_units / throughput))
+        else:
+            eta_seconds = None
+
+        return {
+            'files_done': min(self.files_done, self.files_total),
+            'files_total': self.files_total,
+            'units_done': self.units_done,
+            'units_total': self.units_total,
+            'detectors': {
+                detector_type: {
+                    'done': min(self.files_total, done + self.skipped.get(detector_type, 0)),
+                    'total': self.files_total
+                }
+                for detector_type, done in self.detectors.items()
+            },
+            'elapsed_seconds': round(elapsed, 1),
+            'throughput': round(throughput, 3),
+            'eta_seconds': eta_seconds,
+            'recent_file_ids': list(self.recent_file_ids),
+        }
+
+    def report(self, force: bool = False):
+        """Send a snapshot to the callback, at most once per report interval unless forced"""
+        if not self.callback:
+            return
+        now = time.time()
+        if not force and now - self._reported_at < self.report_interval:
+            return
+        self._reported_at = now
+        self.callback(self.snapshot())
+
+    def _beat(self):
+        """Call the heartbeat with the size of the current batch"""
+        if self.heartbeat:
+            self.heartbeat(self.batch_files)
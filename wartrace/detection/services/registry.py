@@ -0,0 +1,123 @@
+import logging
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from django.conf import settings
+from django.db.models import Count, Max, Sum
+
+from ..models import DetectionConfig
+
+logger = logging.getLogger(__name__)
+
+# Defaults for settings.DETECTION_REGISTRY
+REGISTRY_DEFAULTS = {
+    'check_interval': 5.0,  # Seconds between checks of DetectionConfig for changes
+}
+
+# DetectionConfig.config keys that override the MODEL_CONFIG entry
+OVERRIDE_KEYS = [
+    'model_path',        # Weights file to load instead of the default one
+    'batch_size',        # Images per forward pass
+    'imgsz',             # Letterboxed input size
+    'crop_batch_size',   # Crops per predict call of classifiers
+    'preprocessing',     # Classifier input normalisation
+]
+
+# DetectionConfig.config keys holding dictionaries merged into the MODEL_CONFIG ones
+MERGED_KEYS = ['tiling', 'crops']
+
+
+def get_registry_settings() -> Dict[str, Any]:
+    """Return the registry settings merged over the defaults"""
+    registry_settings = dict(REGISTRY_DEFAULTS)
+    registry_settings.update(getattr(settings, 'DETECTION_REGISTRY', {}))
+    return registry_settings
+
+
+class ModelRegistry:
+    """
+    Resolves which model and parameters each detector type uses
+
+    Defaults come from MODEL_CONFIG and are overridden by the DetectionConfig
+    rows edited in the admin. Rows are cached in memory; every
+    `check_interval` seconds one aggregate query over the row versions tells
+    whether anything changed, so edits reach running workers without a restart.
+    """
+
+    def __init__(self, model_config: Dict[str, Dict[str, Dict]]):
+        self.model_config = model_config
+        self._rows: Dict[str, Dict[str, Any]] = {}
+        self._signature = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def refresh(self, force: bool = False):
+        """Reload the DetectionConfig rows if any of them changed since the last check"""
+        if not force and time.time() - self._checked_at < get_registry_settings()['check_interval']:
+            return
+
+        with self._lock:
+            try:
+                signature = DetectionConfig.objects.aggregate(
+                    count=Count('id'), versions=Sum('version'), updated=Max('updated_at')
+                )
+                if force or signature != self._signature:
+                    self._rows = {
+                        row['detector_type']: row
+                        for row in DetectionConfig.objects.values(
+                            'detector_type', 'is_enabled', 'config', 'confidence_threshold', 'iou_threshold', 'version'
+                        )
+                    }
+                    if self._signature is not None:
+                        logger.info(f"Detection configuration changed, reloaded {len(self._rows)} detector settings")
+                    self._signature = signature
+            except Exception as e:
+                # Keep serving the last known configuration
+                logger.error(f"Error reading DetectionConfig: {str(e)}")
+
+            self._checked_at = time.time()
+
+    def resolve(self, detector_type: str) -> Tuple[Optional[str], Optional[Dict]]:
+        """
+        Return the model name and effective configuration for a detector type
+
+        Returns:
+            Tuple of (model name, configuration), or (None, None) if the detector
+            type is unknown or disabled in DetectionConfig
+        """
+        models = self.model_config.get(detector_type)
+        if not models:
+            return None, None
+
+        self.refresh()
+        row = self._rows.get(detector_type)
+        if row is None:
+            model_name = next(iter(models))
+            return model_name, {**models[model_name], 'config_version': 0}
+
+        if not row['is_enabled']:
+            return None, None
+
+        overrides = row['config'] if isinstance(row['config'], dict) else {}
+        model_name = overrides.get('model_name') or next(iter(models))
+        if model_name not in models:
+            logger.error(f"Unknown model {model_name} configured for {detector_type}, using the default")
+            model_name = next(iter(models))
+
+        config = dict(models[model_name])
+        config['threshold'] = row['confidence_threshold']
+        config['iou'] = row['iou_threshold']
+        for key in OVERRIDE_KEYS:
+            if overrides.get(key) is not None:
+                config[key] = overrides[key]
+        for key in MERGED_KEYS:
+            if overrides.get(key):
+                config[key] = {**(config.get(key) or {}), **overrides[key]}
+        config['config_version'] = row['version']
+
+        return model_name, config
+
+    def is_enabled(self, detector_type: str) -> bool:
+        """Check if a detector type is known and not disabled"""
+        return self.resolve(detector_type)[0] is not None
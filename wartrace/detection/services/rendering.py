@@ -0,0 +1,181 @@
+import hashlib
+import logging
+import os
+import traceback
+import uuid
+from typing import Any, Dict, Iterable, Optional
+
+import cv2
+from django.conf import settings
+
+from ..models import Detection
+from .images import decode_image
+
+logger = logging.getLogger(__name__)
+
+# Defaults for settings.DETECTION_RENDERING
+RENDER_DEFAULTS = {
+    'eager': False,          # Render and store an annotated JPEG for every run (the old behaviour)
+    'cache_dir': None,       # Directory for rendered images (None = MEDIA_ROOT/detection_renders)
+    'max_size_mb': 512,      # Evict least recently used renders above this total size
+    'jpeg_quality': 90,
+}
+
+# Bump when the annotation style changes so old renders are not served
+RENDER_VERSION = 1
+
+
+def get_render_settings() -> Dict[str, Any]:
+    """Return the rendering settings merged over the defaults"""
+    render_settings = dict(RENDER_DEFAULTS)
+    render_settings.update(getattr(settings, 'DETECTION_RENDERING', {}))
+    if not render_settings['cache_dir']:
+        render_settings['cache_dir'] = os.path.join(settings.MEDIA_ROOT, 'detection_renders')
+    return render_settings
+
+
+def render_key(detection: Detection, min_confidence: Optional[float] = None, labels: Iterable[str] = None) -> str:
+    """
+    Build the cache key for a rendering of a detection with the given filters
+
+    The key includes the detection's `updated_at`, so reprocessed results never
+    hit renders of the previous run, and the annotation scale picked by the
+    inference policy.
+    """
+    parts = [
+        str(RENDER_VERSION),
+        str(detection.id),
+        detection.updated_at.isoformat() if detection.updated_at else '',
+        _annotation(detection),
+        f"{min_confidence:.4f}" if min_confidence is not None else '',
+        ','.join(sorted(labels or [])),
+    ]
+    return hashlib.sha256('|'.join(parts).encode()).hexdigest()
+
+
+def render_detection(detection: Detection, min_confidence: Optional[float] = None, labels: Iterable[str] = None) -> str:
+    """
+    Return the path of a JPEG with the detection's boxes drawn over the original file
+
+    Renders are cached on disk, so only the first request for a detection and
+    filter combination decodes the original image and draws the overlay.
+
+    Args:
+        detection: Detection to render
+        min_confidence: Only draw objects at or above this confidence
+        labels: Only draw objects with these labels (case-insensitive)
+
+    Returns:
+        Absolute path of the rendered image
+    """
+    labels = {label.lower() for label in labels} if labels else None
+    render_settings = get_render_settings()
+    cache_dir = render_settings['cache_dir']
+    os.makedirs(cache_dir, exist_ok=True)
+
+    path = os.path.join(cache_dir, f"{render_key(detection, min_confidence, labels)}.jpg")
+    if os.path.exists(path):
+        # Mark as recently used for eviction
+        try:
+            os.utime(path)
+            return path
+        except FileNotFoundError:
+            # Evicted by another process in the meantime
+            pass
+
+    image_bytes = _render_jpeg(detection, min_confidence, labels, render_settings['jpeg_quality'])
+
+    # Write to a temporary name first so readers never see a partial file
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(image_bytes)
+    os.replace(tmp_path, path)
+
+    evict(render_settings)
+    return path
+
+
+def _annotation(detection: Detection) -> str:
+    """Return the annotation scale recorded by the inference policy, 'full' or 'half'"""
+    inference = (detection.metadata or {}).get('inference') or {}
+    return inference.get('annotation') or 'full'
+
+
+def _render_jpeg(detection: Detection, min_confidence: Optional[float], labels: Optional[set], quality: int) -> bytes:
+    """Draw the detection's stored objects over its original image and encode it"""
+    from .main import model_service
+
+    if detection.metadata and detection.metadata.get('error'):
+        img = model_service._draw_error_image(detection.detector_type, detection.summary)
+    else:
+        try:
+            img = decode_image(detection.marker_file.file.path)
+        except Exception as e:
+            logger.error(f"Error reading original image for detection {detection.id}: {str(e)}")
+            img = model_service._draw_error_image(detection.detector_type, str(e))
+        else:
+            objects = detection.objects.all()
+            if min_confidence is not None:
+                objects = objects.filter(confidence__gte=min_confidence)
+
+            detections = [
+                {'label': obj.label, 'confidence': obj.confidence, 'bbox': [obj.x_min, obj.y_min, obj.x_max, obj.y_max]}
+                for obj in objects
+                if labels is None or obj.label.lower() in labels
+            ]
+            if _annotation(detection) == 'half':
+                # Cheaper overlay for very large images or results computed under load
+                img = cv2.resize(img, None, fx=0.5, fy=0.5, interpolation=cv2.INTER_AREA)
+                detections = [{**det, 'bbox': [coord * 0.5 for coord in det['bbox']]} for det in detections]
+            img = model_service._draw_modern_annotations(img, detections, detection.detector_type, detection.model_name)
+
+    is_success, buffer = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, int(quality)])
+    if not is_success:
+        raise ValueError(f"Failed to encode rendered image for detection {detection.id}")
+    return buffer.tobytes()
+
+
+def evict(render_settings: Dict[str, Any] = None) -> int:
+    """
+    Delete least recently used renders until the cache is within its size budget
+
+    Returns:
+        Number of files deleted
+    """
+    render_settings = render_settings or get_render_settings()
+    max_bytes = render_settings['max_size_mb'] * 1024 * 1024
+
+    try:
+        entries = [entry for entry in os.scandir(render_settings['cache_dir']) if entry.name.endswith('.jpg')]
+    except FileNotFoundError:
+        return 0
+
+    stats = []
+    for entry in entries:
+        try:
+            stat = entry.stat()
+        except FileNotFoundError:
+            continue
+        stats.append((stat.st_mtime, stat.st_size, entry.path))
+
+    total_bytes = sum(size for _, size, _ in stats)
+    if total_bytes <= max_bytes:
+        return 0
+
+    evicted = 0
+    for _, size, path in sorted(stats):
+        if total_bytes <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.error(f"Error evicting render {path}: {str(e)}")
+            logger.error(traceback.format_exc())
+            continue
+        total_bytes -= size
+        evicted += 1
+
+    logger.info(f"Evicted {evicted} cached renders")
+    return evicted
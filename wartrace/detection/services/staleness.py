@@ -0,0 +1,209 @@
+import logging
+import os
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional
+
+from django.db.models import Q
+
+from content.models import Marker
+from ..models import Detection, DetectionJob
+from . import cache as result_cache
+from . import jobs
+from . import classification
+from .images import hash_file
+
+logger = logging.getLogger(__name__)
+
+# Detection.metadata keys describing the inputs a result was computed from
+FINGERPRINT_KEYS = ['content_hash', 'model_hash', 'params_key']
+
+# Why a (file, detector) pair needs processing
+REASON_NEW = 'new'                          # No result for this detector yet
+REASON_ERROR = 'error'                      # The last run failed
+REASON_UNKNOWN = 'no_fingerprint'           # Processed before fingerprints were recorded
+REASON_CONTENT = 'content_changed'          # The file was replaced
+REASON_MODEL = 'model_changed'              # Other weights are configured
+REASON_SETTINGS = 'settings_changed'        # Thresholds, input size, tiling or crops changed
+REASON_SOURCE = 'source_changed'            # A classifier's box source is being reprocessed
+REASON_REQUIRED = 'required_by_classifier'  # Boxes needed by a stale classifier
+
+
+def current_fingerprints(detector_types: Iterable[str]) -> Dict[str, Dict[str, str]]:
+    """
+    Return the model and parameter hashes each detector type would run with now
+
+    Disabled and unknown detector types are left out.
+    """
+    from .main import model_service, _is_classifier
+
+    fingerprints = {}
+    for detector_type in detector_types:
+        model_name, config = model_service.resolve_model(detector_type)
+        if model_name is None:
+            continue
+        fingerprints[detector_type] = {
+            'model_hash': result_cache.get_model_hash(model_name, config),
+            'params_key': result_cache.params_key(model_name, config),
+            'source': classification.source_detector(classification.get_crop_settings(config))
+                      if _is_classifier(config) else None,
+        }
+    return fingerprints
+
+
+def stale_reason(metadata: Optional[Dict], fingerprint: Dict[str, str], content_hash: Optional[str]) -> Optional[str]:
+    """
+    Compare a stored detection with the current inputs
+
+    Args:
+        metadata: Detection.metadata of the existing result, None if there is none
+        fingerprint: Current hashes from `current_fingerprints`
+        content_hash: Current SHA-256 of the file
+
+    Returns:
+        One of the REASON_* values, or None if the result is up to date
+    """
+    if metadata is None:
+        return REASON_NEW
+    if metadata.get('error'):
+        return REASON_ERROR
+    if not all(metadata.get(key) for key in FINGERPRINT_KEYS):
+        return REASON_UNKNOWN
+    if metadata['content_hash'] != content_hash:
+        return REASON_CONTENT
+    if metadata['model_hash'] != fingerprint['model_hash']:
+        return REASON_MODEL
+    if metadata['params_key'] != fingerprint['params_key']:
+        return REASON_SETTINGS
+    return None
+
+
+def stale_pairs(marker_files, detector_types: List[str]) -> Dict[int, Dict[str, str]]:
+    """
+    Find the (file, detector) pairs whose results are missing or out of date
+
+    A pair is stale when the file has no result for the detector, the file
+    content changed, or the detector now runs with other weights or
+    parameters. Files the detectors can't read are left out.
+
+    Args:
+        marker_files: Iterable of MarkerFile instances
+        detector_types: Detector types to check
+
+    Returns:
+        Mapping of marker file ID to {detector type: reason} for files with stale pairs
+    """
+    from .main import PROCESSABLE_EXTENSIONS
+
+    fingerprints = current_fingerprints(detector_types)
+    if not fingerprints:
+        return {}
+
+    marker_files = list(marker_files)
+    existing = {
+        (marker_file_id, detector_type): metadata or {}
+        for marker_file_id, detector_type, metadata in Detection._default_manager.filter(
+            marker_file__in=[marker_file.id for marker_file in marker_files],
+            detector_type__in=list(fingerprints)
+        ).values_list('marker_file_id', 'detector_type', 'metadata')
+    }
+
+    stale = {}
+    for marker_file in marker_files:
+        if not marker_file.file or not os.path.exists(marker_file.file.path):
+            continue
+        if os.path.splitext(marker_file.file.path)[1].lower() not in PROCESSABLE_EXTENSIONS:
+            continue
+
+        content_hash = None
+        reasons = OrderedDict()
+        for detector_type, fingerprint in fingerprints.items():
+            metadata = existing.get((marker_file.id, detector_type))
+            if metadata is not None and metadata.get('content_hash') and content_hash is None:
+                content_hash = hash_file(marker_file.file.path)
+
+            reason = stale_reason(metadata, fingerprint, content_hash)
+            if reason:
+                reasons[detector_type] = reason
+
+        # Classifiers cropping a detector's boxes follow that detector
+        for detector_type, fingerprint in fingerprints.items():
+            source = fingerprint['source']
+            if not source or source not in fingerprints:
+                continue
+            if source in reasons and detector_type not in reasons:
+                reasons[detector_type] = REASON_SOURCE
+            elif detector_type in reasons and source not in reasons:
+                reasons[source] = REASON_REQUIRED
+
+        if reasons:
+            stale[marker_file.id] = dict(reasons)
+
+    return stale
+
+
+def stale_detections(detector_types: Iterable[str] = None):
+    """
+    Return the detections computed with other weights or parameters than their detector uses now
+
+    Uses the indexed `Detection.fingerprint`, so it is a single query however
+    large the archive is. Replaced files are not found this way; those are
+    picked up by `stale_pairs` when their marker is processed.
+
+    Args:
+        detector_types: Detector types to check (default: all configured ones)
+
+    Returns:
+        Detection QuerySet
+    """
+    from .main import MODEL_CONFIG
+
+    fingerprints = current_fingerprints(detector_types or list(MODEL_CONFIG))
+    if not fingerprints:
+        return Detection._default_manager.none()
+
+    condition = Q()
+    for detector_type, fingerprint in fingerprints.items():
+        condition |= Q(detector_type=detector_type) & ~Q(fingerprint=fingerprint['params_key'])
+    return Detection._default_manager.filter(condition)
+
+
+def queue_stale_reprocessing(detections=None, limit: int = None) -> int:
+    """
+    Queue background jobs reprocessing the markers of stale detections
+
+    Markers are queued newest event first, at background priority, so
+    interactive requests keep going ahead of the backfill. The jobs are
+    incremental and only recompute the stale pairs.
+
+    Args:
+        detections: Detection QuerySet to reprocess (default: `stale_detections()`)
+        limit: Maximum number of markers to queue
+
+    Returns:
+        Number of jobs queued
+    """
+    from .main import MODEL_CONFIG
+
+    if detections is None:
+        detections = stale_detections()
+
+    detector_types_by_marker = {}
+    for marker_id, detector_type in detections.order_by().values_list('marker_file__marker_id', 'detector_type').distinct():
+        detector_types_by_marker.setdefault(marker_id, set()).add(detector_type)
+
+    markers = Marker.objects.filter(id__in=list(detector_types_by_marker)).order_by('-date', '-created_at')
+    if limit:
+        markers = markers[:limit]
+
+    queued = 0
+    for marker in markers:
+        # Keep the pipeline order so box sources run before classifiers
+        detector_types = [dt for dt in MODEL_CONFIG if dt in detector_types_by_marker[marker.id]]
+        job, created = jobs.enqueue_job(marker, detector_types, priority=DetectionJob.PRIORITY_BACKGROUND)
+        if created:
+            queued += 1
+        else:
+            logger.info(f"Marker {marker.id} already has an active job, not queueing a reprocess")
+
+    logger.info(f"Queued {queued} background jobs reprocessing stale detections")
+    return queued
@@ -0,0 +1,126 @@
+import logging
+from typing import Dict, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Defaults for the per-detector 'tiling' configuration
+TILING_DEFAULTS = {
+    'enabled': False,
+    'tile_size': 640,            # Side of each square tile in original image pixels
+    'overlap': 0.2,              # Fraction of the tile shared with its neighbours
+    'min_image_size': 2000,      # Only tile images whose longer side is at least this
+    'include_full_image': True,  # Also run one pass on the whole (downscaled) image for large objects
+    'merge_metric': 'ios',       # 'iou' or 'ios' (intersection over the smaller box) for cross-tile merging
+    'merge_threshold': 0.6,      # Overlap above which same-class boxes are merged
+}
+
+
+def get_tiling_settings(config: Dict) -> Dict:
+    """Return a detector's tiling configuration merged over the defaults"""
+    tiling = dict(TILING_DEFAULTS)
+    tiling.update(config.get('tiling') or {})
+    return tiling
+
+
+def should_tile(image_shape: Tuple[int, ...], tiling: Dict) -> bool:
+    """Check whether an image is large enough to be processed in tiles"""
+    return bool(tiling['enabled']) and max(image_shape[:2]) >= tiling['min_image_size']
+
+
+def tile_grid(height: int, width: int, tile_size: int, overlap: float) -> np.ndarray:
+    """
+    Compute overlapping tile windows covering an image
+
+    The last row and column are aligned to the image edge, so every tile
+    has the full size unless the image itself is smaller than a tile.
+
+    Returns:
+        Nx4 int array of (x1, y1, x2, y2) windows
+    """
+    stride = max(1, int(tile_size * (1 - overlap)))
+
+    def starts(length):
+        if length <= tile_size:
+            return np.array([0])
+        positions = np.arange(0, length - tile_size, stride)
+        return np.append(positions, length - tile_size)
+
+    xs, ys = np.meshgrid(starts(width), starts(height))
+    xs, ys = xs.ravel(), ys.ravel()
+    return np.stack([
+        xs,
+        ys,
+        np.minimum(xs + tile_size, width),
+        np.minimum(ys + tile_size, height)
+    ], axis=1)
+
+
+def box_overlaps(box: np.ndarray, boxes: np.ndarray, metric: str = 'iou') -> np.ndarray:
+    """
+    Overlap between one box and many boxes
+
+    Args:
+        box: (4,) xyxy box
+        boxes: Nx4 xyxy boxes
+        metric: 'iou' for intersection over union, 'ios' for intersection over the smaller area
+    """
+    ix1 = np.maximum(box[0], boxes[:, 0])
+    iy1 = np.maximum(box[1], boxes[:, 1])
+    ix2 = np.minimum(box[2], boxes[:, 2])
+    iy2 = np.minimum(box[3], boxes[:, 3])
+    intersection = np.clip(ix2 - ix1, 0, None) * np.clip(iy2 - iy1, 0, None)
+
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+
+    if metric == 'ios':
+        denominator = np.minimum(area, areas)
+    else:
+        denominator = area + areas - intersection
+    return intersection / np.maximum(denominator, 1e-9)
+
+
+def nms(boxes: np.ndarray, scores: np.ndarray, class_ids: np.ndarray,
+        threshold: float, metric: str = 'iou') -> np.ndarray:
+    """
+    Class-aware non-maximum suppression
+
+    Boxes of different classes are shifted apart by a per-class offset so a
+    single pass never suppresses across classes. Each step compares the best
+    remaining box against all others at once.
+
+    Returns:
+        Indices of the kept boxes, highest score first
+    """
+    if len(boxes) == 0:
+        return np.empty(0, dtype=int)
+
+    offset = boxes.max() + 1
+    shifted = boxes + (class_ids.astype(boxes.dtype) * offset)[:, None]
+
+    order = np.argsort(-scores)
+    keep = []
+    while order.size:
+        best = order[0]
+        keep.append(best)
+        if order.size == 1:
+            break
+        overlaps = box_overlaps(shifted[best], shifted[order[1:]], metric)
+        order = order[1:][overlaps <= threshold]
+
+    return np.array(keep, dtype=int)
+
+
+def merge_tile_detections(boxes: np.ndarray, scores: np.ndarray, class_ids: np.ndarray,
+                          tiling: Dict) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Merge boxes predicted on overlapping tiles (already in image coordinates)
+
+    Returns:
+        Tuple of (boxes, scores, class_ids) after suppression
+    """
+    keep = nms(boxes, scores, class_ids, tiling['merge_threshold'], tiling['merge_metric'])
+    logger.info(f"Merged {len(boxes)} tile detections into {len(keep)}")
+    return boxes[keep], scores[keep], class_ids[keep]
@@ -0,0 +1,102 @@
+import logging
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from typing import Any, Dict, Iterable, List
+
+import numpy as np
+from django.utils import timezone
+
+from ..models import Detection
+
+logger = logging.getLogger(__name__)
+
+# Pipeline stages recorded in Detection.metadata['timings'], in pipeline order
+STAGES = [
+    'cache',        # Result cache lookup (cache hits skip every model stage)
+    'decode',       # Reading and decoding the file (shared by every detector of the file)
+    'preprocess',   # Letterboxing, or cropping, resizing and normalising classifier inputs
+    'inference',    # Model forward pass, including the model's own NMS
+    'postprocess',  # Mapping boxes back, tile merging, building the result
+    'annotate',     # Drawing the overlay (eager rendering only)
+    'encode',       # JPEG encoding of the overlay (eager rendering only)
+    'storage',      # Writing the overlay to storage (eager rendering only)
+    'db',           # Inserting the Detection and its objects
+]
+
+PERCENTILES = [50, 95, 99]
+
+# Defaults of the aggregate endpoint
+DEFAULT_DAYS = 7
+MAX_SAMPLES = 20000
+
+
+class StageTimer:
+    """Accumulates wall time per pipeline stage"""
+
+    def __init__(self):
+        self.seconds: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time the enclosed block as part of a stage"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name: str, seconds: float):
+        self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    """Return the PERCENTILES of a list of durations in milliseconds"""
+    points = np.percentile(np.asarray(values, dtype=np.float64) * 1000, PERCENTILES)
+    return {f"p{q}": round(float(value), 2) for q, value in zip(PERCENTILES, points)}
+
+
+def aggregate_timings(days: int = DEFAULT_DAYS, detector_types: Iterable[str] = None,
+                      max_samples: int = MAX_SAMPLES) -> List[Dict[str, Any]]:
+    """
+    Summarize recorded stage timings per detector type and model
+
+    Args:
+        days: Only detections created in the last `days` days
+        detector_types: Only these detector types (default: all)
+        max_samples: Use at most this many of the most recent detections
+
+    Returns:
+        One entry per (detector type, model) with the sample count, the image
+        size and the p50/p95/p99 of every stage and of the total, in milliseconds
+    """
+    detections = Detection._default_manager.filter(
+        created_at__gte=timezone.now() - timedelta(days=days),
+        metadata__has_key='timings'
+    )
+    if detector_types:
+        detections = detections.filter(detector_type__in=list(detector_types))
+
+    groups: Dict[tuple, Dict[str, Any]] = {}
+    rows = detections.order_by('-created_at').values_list('detector_type', 'model_name', 'metadata')[:max_samples]
+    for detector_type, model_name, metadata in rows:
+        group = groups.setdefault((detector_type, model_name), {'stages': {}, 'total': [], 'megapixels': []})
+        timings = metadata['timings']
+        for stage, seconds in timings.items():
+            group['stages'].setdefault(stage, []).append(seconds)
+        group['total'].append(sum(timings.values()))
+        if metadata.get('image'):
+            group['megapixels'].append(metadata['image']['width'] * metadata['image']['height'] / 1e6)
+
+    summary = []
+    for (detector_type, model_name), group in sorted(groups.items()):
+        stages = {stage: percentiles(group['stages'][stage]) for stage in STAGES if stage in group['stages']}
+        summary.append({
+            'detector_type': detector_type,
+            'model_name': model_name,
+            'count': len(group['total']),
+            'stages': stages,
+            'total': percentiles(group['total']),
+            'median_megapixels': round(float(np.median(group['megapixels'])), 2) if group['megapixels'] else None,
+        })
+    return summary
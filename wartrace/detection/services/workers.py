@@ -0,0 +1,267 @@
+import logging
+import os
+import socket
+import time
+import traceback
+from multiprocessing import Event, Process, Value
+from typing import Any, Dict
+
+from django.conf import settings
+from django.db import close_old_connections, connections
+
+from ..models import DetectionJob
+from . import jobs, notifications
+
+logger = logging.getLogger(__name__)
+
+# Defaults for settings.DETECTION_WORKERS
+WORKER_DEFAULTS = {
+    'concurrency': 2,                  # Number of inference worker processes
+    'threads_per_worker': None,        # Intra-op threads per worker (None = cpu_count // concurrency)
+    'cleanup_interval': 3600,          # Seconds between purges of expired finished jobs
+}
+
+
+def get_worker_settings() -> Dict[str, Any]:
+    """Return the worker settings merged over the defaults"""
+    worker_settings = dict(WORKER_DEFAULTS)
+    worker_settings.update(getattr(settings, 'DETECTION_WORKERS', {}))
+    return worker_settings
+
+
+def run_job(job: DetectionJob, deadline=None) -> bool:
+    """
+    Process one claimed job and record its outcome
+
+    A cancelled job stops at the next batch boundary and its partial
+    results are deleted; a job past its time budget is failed.
+
+    Args:
+        job: Job leased to the calling worker
+        deadline: Shared value the worker keeps set to the time (epoch seconds)
+            by which the current batch must be done, read by the pool's watchdog
+
+    Returns:
+        True if the job finished successfully
+    """
+    from .main import process_marker
+
+    marker_id = job.marker_id
+    job_settings = jobs.get_job_settings()
+    job_deadline = job.deadline_at.timestamp() + job_settings['watchdog_grace_seconds'] if job.deadline_at else None
+
+    def heartbeat(batch_files):
+        # Raises JobCancelled, so a cancel takes effect after the detector in progress
+        jobs.extend_lease(job, batch_files)
+        if deadline is None:
+            return
+        batch_deadline = time.time() + job_settings['max_file_seconds'] * batch_files
+        deadline.value = min(batch_deadline, job_deadline) if job_deadline else batch_deadline
+
+    # Results saved after this moment are pushed to WebSocket clients with the next update
+    published = {'since': time.time()}
+
+    def publish():
+        published['since'] = notifications.publish_status(job, published['since']) or published['since']
+
+    def report_progress(progress):
+        # Also extends the lease; raises JobLeaseLost if another worker took over
+        jobs.update_progress(job, progress)
+        publish()
+
+    try:
+        logger.info(f"Starting background processing for marker {marker_id} (job {job.id})")
+
+        # Process marker with selected detector types
+        result = process_marker(job.marker, progress_callback=report_progress, incremental=job.incremental,
+                                detector_types=job.detector_types or None, heartbeat=heartbeat,
+                                file_ids=job.file_ids or None)
+
+        logger.info(f"Completed background processing for marker {marker_id}: {result}")
+        finished = jobs.finish_job(job, DetectionJob.STATUS_DONE, result={
+            'success': True,
+            'message': 'Processing completed successfully',
+            'processed': result.get('processed', 0),
+            'detections': result.get('detections', 0),
+            'result_images': result.get('detections', 0),
+            'processing_time': result.get('processing_time')
+        })
+        if finished:
+            publish()
+            jobs.queue_followup(job)
+        return finished
+
+    except jobs.JobLeaseLost as e:
+        logger.warning(str(e))
+        return False
+
+    except jobs.JobCancelled as e:
+        # Each file's results are replaced in one transaction, so the files the job finished
+        # keep their new results and the others their previous ones
+        logger.info(str(e))
+        if jobs.finish_job(job, DetectionJob.STATUS_CANCELLED):
+            publish()
+        return False
+
+    except Exception as e:
+        logger.error(f"Error in background processing for marker {marker_id}: {str(e)}")
+        logger.error(traceback.format_exc())
+        if jobs.finish_job(job, DetectionJob.STATUS_FAILED, error=str(e)):
+            publish()
+            jobs.queue_followup(job)
+        return False
+
+    finally:
+        if deadline is not None:
+            deadline.value = 0.0
+
+
+def _configure_threads(threads: int):
+    """Limit intra-op threads so concurrent workers don't oversubscribe the CPU"""
+    os.environ['OMP_NUM_THREADS'] = str(threads)
+    try:
+        import torch
+        from .main import model_service
+        # Detectors running concurrently in the worker share its threads
+        torch.set_num_threads(model_service.detector_threads() or threads)
+    except ImportError:
+        pass
+
+
+def worker_main(worker_index: int, threads: int, stop_event, deadline=None):
+    """
+    Entry point of an inference worker process
+
+    Models are cached in the process-wide `model_service`, so each worker loads
+    them once and reuses them for every job it claims from the queue.
+    `deadline` is the shared value the pool's watchdog reads, see `run_job`.
+    """
+    _configure_threads(threads)
+    worker_settings = get_worker_settings()
+    poll_interval = jobs.get_job_settings()['poll_interval']
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    last_cleanup = 0.0
+
+    logger.info(f"Inference worker {worker_index} started as {worker_id} ({threads} threads)")
+
+    # Load and warm up models before taking the first job
+    from .main import model_service
+    try:
+        model_service.preload_models()
+    except Exception as e:
+        logger.error(f"Error preloading models: {str(e)}")
+        logger.error(traceback.format_exc())
+
+    while not stop_event.is_set():
+        close_old_connections()
+
+        try:
+            if worker_index == 0 and time.time() - last_cleanup > worker_settings['cleanup_interval']:
+                jobs.cleanup_finished_jobs()
+                last_cleanup = time.time()
+
+            job = jobs.claim_next_job(worker_id)
+        except Exception as e:
+            logger.error(f"Error polling detection jobs: {str(e)}")
+            job = None
+
+        if job is None:
+            stop_event.wait(poll_interval)
+            continue
+
+        run_job(job, deadline)
+
+    close_old_connections()
+    logger.info(f"Inference worker {worker_index} stopped")
+
+
+class InferenceWorkerPool:
+    """
+    A fixed pool of inference worker processes polling the job table
+
+    Used by the `run_detection_workers` management command. Each worker
+    publishes the deadline of the batch it is working on, and a worker stuck
+    past it (a decoder hanging on a corrupt file, a huge image) is killed,
+    its job failed and the worker replaced, so the pool never loses capacity.
+    """
+
+    def __init__(self, concurrency: int = None):
+        self.settings = get_worker_settings()
+        self.concurrency = concurrency or self.settings['concurrency']
+        self.threads = self.settings['threads_per_worker'] or max(1, (os.cpu_count() or 1) // self.concurrency)
+        self.stop_event = Event()
+        self.processes = []
+        self.deadlines = []
+
+    def start(self):
+        """Start the worker processes"""
+        # Forked workers must not share the parent's database connections
+        connections.close_all()
+
+        for index in range(self.concurrency):
+            self.deadlines.append(Value('d', 0.0))
+            self.processes.append(self._spawn(index))
+
+    def _spawn(self, index: int) -> Process:
+        self.deadlines[index].value = 0.0
+        process = Process(
+            target=worker_main,
+            args=(index, self.threads, self.stop_event, self.deadlines[index]),
+            name=f"detection-worker-{index}",
+            daemon=True
+        )
+        process.start()
+        return process
+
+    def supervise(self, interval: float = 5.0):
+        """Block, restarting any worker process that dies or overruns its deadline"""
+        while not self.stop_event.is_set():
+            time.sleep(interval)
+            self.check_workers()
+
+    def check_workers(self):
+        """Restart dead workers and kill and replace hung ones"""
+        for index, process in enumerate(self.processes):
+            deadline = self.deadlines[index].value
+            if process.is_alive() and deadline and time.time() > deadline:
+                logger.warning(f"Worker {index} (pid {process.pid}) overran its deadline by "
+                               f"{time.time() - deadline:.0f}s, killing it")
+                self._kill(process)
+                self._fail_jobs(process, 'Processing a file took longer than its time budget')
+                self.processes[index] = self._spawn(index)
+            elif not process.is_alive():
+                # Crashed (e.g. killed for memory or a segfault in a native library)
+                logger.warning(f"Worker {index} exited with code {process.exitcode}, restarting")
+                self._fail_jobs(process, f"The worker processing the job exited with code {process.exitcode}")
+                self.processes[index] = self._spawn(index)
+
+    def _kill(self, process: Process, timeout: float = 5.0):
+        process.terminate()
+        process.join(timeout)
+        if process.is_alive():
+            process.kill()
+            process.join(timeout)
+
+    def _fail_jobs(self, process: Process, error: str):
+        """Fail the jobs of a killed or crashed worker right away instead of waiting for their leases to expire"""
+        worker_id = f"{socket.gethostname()}:{process.pid}"
+        try:
+            for job in jobs.fail_worker_jobs(worker_id, error):
+                notifications.publish_status(job, time.time())
+        except Exception as e:
+            logger.error(f"Error failing the jobs of worker {worker_id}: {str(e)}")
+            logger.error(traceback.format_exc())
+        finally:
+            # Don't hand the supervisor's connection to the replacement worker
+            connections.close_all()
+
+    def stop(self, timeout: float = 30.0):
+        """Ask workers to finish their current job and exit"""
+        self.stop_event.set()
+
+        for process in self.processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+
+        self.processes = []
@@ -1,3 +1,843 @@
-from django.test import TestCase
+import shutil
+import socket
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
+from multiprocessing import Process, Value
+from unittest import mock
 
-# Create your tests here.
+import cv2
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.files.base import ContentFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from content.models import Marker, MarkerFile
+from .management.commands.benchmark_detection import parse_resolution
+from .models import Detection, DetectionConfig, DetectionJob, ObjectDetection
+from .services import (
+    admission, backfill, benchmark, classification, images, jobs, main, policy, progress, registry, staleness, tiling, workers
+)
+from .services import cache as result_cache
+
+MEDIA_ROOT = tempfile.mkdtemp(prefix='detection-tests-')
+
+
+def make_marker(user, files=0, size=(64, 48), **fields):
+    """Create a marker with `files` JPEG files of `size` (width, height)"""
+    marker = Marker.objects.create(user=user, title='Test', description='Test marker', **fields)
+    for index in range(files):
+        image = np.full((size[1], size[0], 3), index * 40, dtype=np.uint8)
+        _, buffer = cv2.imencode('.jpg', image)
+        marker_file = MarkerFile(marker=marker)
+        marker_file.file.save(f"test{index}.jpg", ContentFile(buffer.tobytes()), save=True)
+    return marker
+
+
+@override_settings(
+    MEDIA_ROOT=MEDIA_ROOT,
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+)
+class DetectionTestCase(TestCase):
+    """Base class giving each test two users and a scratch MEDIA_ROOT"""
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.alice = User.objects.create_user('alice', password='password')
+        self.bob = User.objects.create_user('bob', password='password')
+
+
+class BatchingTests(DetectionTestCase):
+
+    def test_read_image_size(self):
+        marker_file = make_marker(self.alice, files=1).files.get()
+        self.assertEqual(images.read_image_size(marker_file.file.path), (64, 48))
+
+        png_path = f"{MEDIA_ROOT}/size-test.png"
+        cv2.imwrite(png_path, np.zeros((30, 20, 3), dtype=np.uint8))
+        self.assertEqual(images.read_image_size(png_path), (20, 30))
+
+        with open(f"{MEDIA_ROOT}/size-test.txt", 'w') as f:
+            f.write('not an image')
+        self.assertIsNone(images.read_image_size(f"{MEDIA_ROOT}/size-test.txt"))
+
+    def test_chunk_files_by_count_and_decoded_size(self):
+        files = [(marker_file, marker_file.file.path) for marker_file in make_marker(self.alice, files=3).files.all()]
+        decoded_bytes = 64 * 48 * 3
+
+        def chunk_sizes(batch_size, memory_budget):
+            return [len(chunk) for chunk in main.chunk_files(files, batch_size, memory_budget)]
+
+        self.assertEqual(chunk_sizes(2, 10 ** 9), [2, 1])
+        self.assertEqual(chunk_sizes(8, decoded_bytes * 2), [2, 1])
+        # A file over the budget on its own still gets a batch
+        self.assertEqual(chunk_sizes(8, 1), [1, 1, 1])
+
+    @override_settings(DETECTION_RESULT_CACHE={'enabled': False})
+    def test_files_are_sent_to_the_model_in_batches(self):
+        marker = make_marker(self.alice, files=3)
+        with benchmark.stub_models(['object_detection'], density=2):
+            version = main.model_service.resolve_model('object_detection')[0]
+            model_data = main.model_service.loaded_models[f"object_detection_{version}"]
+            model_data['model'] = mock.Mock(side_effect=model_data['model'])
+            with mock.patch.object(main, 'get_batch_size', return_value=2):
+                created = main.process_marker_files_batched(marker.files.all(), ['object_detection'])
+
+        self.assertEqual([len(call.args[0]) for call in model_data['model'].call_args_list], [2, 1])
+        self.assertEqual(len(created), 3)
+        self.assertEqual(ObjectDetection.objects.filter(detection__marker_file__marker=marker).count(), 6)
+
+
+class DecodedImageTests(DetectionTestCase):
+
+    def test_decodes_once_and_maps_boxes_back(self):
+        path = make_marker(self.alice, files=1, size=(200, 100)).files.get().file.path
+        with mock.patch.object(images, 'decode_image', side_effect=images.decode_image) as decode_image:
+            image = images.DecodedImage(path)
+            self.assertEqual(image.shape, (100, 200, 3))
+            boxed, scale, padding = image.letterbox(64)
+            self.assertIs(image.letterbox(64)[0], boxed)
+
+        decode_image.assert_called_once_with(path)
+        self.assertEqual(boxed.shape, (64, 64, 3))
+        self.assertEqual((scale, padding), (0.32, (0, 16)))
+        self.assertEqual(image.size, (200, 100))
+        np.testing.assert_allclose(image.unletterbox_boxes(np.array([[0, 16, 32, 48]]), 64), [[0, 0, 100, 100]])
+
+    @override_settings(DETECTION_RESULT_CACHE={'enabled': False})
+    def test_detectors_share_one_decode_per_file(self):
+        marker = make_marker(self.alice, files=2)
+        with benchmark.stub_models(['object_detection', 'military_detection'], density=2):
+            with mock.patch.object(images, 'decode_image', side_effect=images.decode_image) as decode_image:
+                main.process_marker_files_batched(marker.files.all(), ['object_detection', 'military_detection'])
+
+        self.assertEqual(decode_image.call_count, 2)
+
+
+class SaveResultsTests(DetectionTestCase):
+
+    def results(self):
+        detections = [
+            {'label': 'car', 'confidence': 0.9, 'bbox': [1, 2, 10, 20]},
+            {'label': 'person', 'confidence': 0.6, 'bbox': [5, 5, 15, 25]},
+        ]
+        return {'object_detection': {'model_name': 'stub', 'result': {
+            'detections': detections,
+            'summary': '2 objects',
+            'annotated_image_content': ContentFile(b'annotated'),
+            'output_filename': 'annotated.jpg',
+        }}}
+
+    def test_results_are_saved_together(self):
+        marker_file = make_marker(self.alice, files=1).files.get()
+
+        created = main.save_detection_results(marker_file, self.results())
+
+        detection = Detection._default_manager.get(marker_file=marker_file)
+        self.assertEqual(created, [detection])
+        self.assertEqual(sorted(detection.objects.values_list('label', flat=True)), ['car', 'person'])
+        self.assertIn('db', detection.metadata['timings'])
+        self.assertTrue(detection.processed_image.storage.exists(detection.processed_image.name))
+
+    def test_failed_replace_keeps_the_previous_results(self):
+        marker_file = make_marker(self.alice, files=1).files.get()
+        previous = main.save_detection_results(marker_file, self.results())[0]
+
+        with mock.patch.object(ObjectDetection.objects, 'bulk_create', side_effect=RuntimeError('disk full')):
+            with mock.patch.object(main.default_storage, 'delete', wraps=main.default_storage.delete) as delete:
+                with self.assertRaises(RuntimeError):
+                    main.replace_detection_results(marker_file, ['object_detection'], self.results())
+
+        self.assertEqual(list(Detection._default_manager.filter(marker_file=marker_file)), [previous])
+        self.assertEqual(previous.objects.count(), 2)
+        # The image written for the rolled back rows is removed, the previous one is kept
+        deleted_path = delete.call_args.args[0]
+        self.assertNotEqual(deleted_path, previous.processed_image.name)
+        self.assertFalse(main.default_storage.exists(deleted_path))
+        self.assertTrue(main.default_storage.exists(previous.processed_image.name))
+
+
+class ClassificationTests(DetectionTestCase):
+
+    def test_crops_of_all_images_are_classified_in_batches(self):
+        paths = [marker_file.file.path for marker_file in make_marker(self.alice, files=2, size=(512, 512)).files.all()]
+        _, config = main.model_service.resolve_model('damage_assessment')
+        model = benchmark.StubClassifier(config['labels'])
+
+        with mock.patch.object(model, 'predict', wraps=model.predict) as predict:
+            results = main.model_service._process_with_keras_batch(
+                [images.DecodedImage(path) for path in paths], 'damage_assessment', model, {**config, 'crop_batch_size': 3}
+            )
+
+        # Four 256 px tiles per image, eight crops in predict calls of at most three
+        self.assertEqual([len(call.args[0]) for call in predict.call_args_list], [3, 3, 2])
+        self.assertEqual(predict.call_args_list[0].args[0].shape[1:], (224, 224, 3))
+        for path in paths:
+            result = results[path]
+            self.assertEqual(len(result['detections']), 4)
+            self.assertEqual(result['classifications'][0], {
+                'label': 'destroyed', 'confidence': result['classifications'][0]['confidence'], 'crops': 4
+            })
+
+    def test_crop_boxes_from_another_detector(self):
+        crops = classification.get_crop_settings({'crops': {'source': 'object_detection', 'labels': ['car']}})
+        detections = [
+            {'label': 'car', 'bbox': [10, 10, 30, 50]},
+            {'label': 'Car', 'bbox': [0, 0, 4, 4]},          # Too small
+            {'label': 'person', 'bbox': [40, 40, 60, 60]},   # Not a classified label
+        ]
+
+        boxes = classification.crop_boxes((100, 100, 3), crops, detections)
+
+        # Padded by 10% of the box size on each side
+        self.assertEqual(boxes.tolist(), [[8, 6, 32, 54]])
+        # Without results of the source detector the whole image is classified
+        self.assertEqual(classification.crop_boxes((100, 80, 3), crops, None).tolist(), [[0, 0, 80, 100]])
+
+
+class RegistryTests(DetectionTestCase):
+
+    def test_admin_changes_reach_running_workers(self):
+        model_registry = registry.ModelRegistry(main.MODEL_CONFIG)
+        default_name = next(iter(main.MODEL_CONFIG['object_detection']))
+        model_name, config = model_registry.resolve('object_detection')
+        self.assertEqual((model_name, config['config_version']), (default_name, 0))
+
+        row = DetectionConfig.objects.create(
+            detector_type='object_detection', display_name='Objects', confidence_threshold=0.5,
+            config={'imgsz': 512, 'tiling': {'overlap': 0.3}}
+        )
+        # Rows are cached between checks
+        self.assertEqual(model_registry.resolve('object_detection')[1]['config_version'], 0)
+
+        with self.settings(DETECTION_REGISTRY={'check_interval': 0}):
+            config = model_registry.resolve('object_detection')[1]
+            self.assertEqual(config['threshold'], 0.5)
+            self.assertEqual(config['imgsz'], 512)
+            default_tiling = main.MODEL_CONFIG['object_detection'][default_name]['tiling']
+            self.assertEqual(config['tiling'], {**default_tiling, 'overlap': 0.3})
+            self.assertEqual(config['config_version'], row.version)
+
+            row.is_enabled = False
+            row.save()
+            self.assertEqual(model_registry.resolve('object_detection'), (None, None))
+            self.assertFalse(model_registry.is_enabled('object_detection'))
+
+
+class ProgressTests(TestCase):
+
+    def test_snapshot_eta_and_reporting(self):
+        snapshots, beats = [], []
+        with mock.patch.object(progress.time, 'time', return_value=1000.0) as clock:
+            tracker = progress.ProgressTracker(
+                4, ['object_detection', 'military_detection'],
+                callback=snapshots.append, report_interval=5.0, heartbeat=beats.append
+            )
+            tracker.files_skipped(1)
+            tracker.batch_started(3)
+
+            clock.return_value = 1010.0
+            tracker.detector_done('object_detection', 1)
+            tracker.detector_done('military_detection', 1)
+            tracker.files_finished([7])
+            snapshot = tracker.snapshot()
+
+        self.assertEqual((snapshot['files_done'], snapshot['units_done'], snapshot['units_total']), (2, 4, 8))
+        self.assertEqual(snapshot['detectors']['object_detection'], {'done': 2, 'total': 4})
+        # Two units processed in 10 s, skipped files don't count towards the throughput
+        self.assertEqual(snapshot['throughput'], 0.2)
+        self.assertEqual(snapshot['eta_seconds'], 20)
+        self.assertEqual(snapshot['recent_file_ids'], [7])
+
+        # Throttled to one report per interval, except at the start of a batch
+        self.assertEqual(len(snapshots), 3)
+        self.assertEqual(beats, [3, 3, 3])
+
+    def test_callback_can_stop_the_run(self):
+        def stop(snapshot):
+            raise progress.ProcessingAborted()
+
+        tracker = progress.ProgressTracker(2, ['object_detection'], callback=stop)
+        with self.assertRaises(progress.ProcessingAborted):
+            tracker.batch_started(2)
+
+
+class ConcurrentDetectorTests(DetectionTestCase):
+
+    @override_settings(DETECTION_MODELS={'concurrent_detectors': 2}, DETECTION_RESULT_CACHE={'enabled': False})
+    def test_independent_detectors_overlap_and_dependent_ones_wait(self):
+        detector_types = ['object_detection', 'military_detection', 'damage_assessment']
+        marker = make_marker(self.alice, files=2)
+        military_started = threading.Event()
+        events = []
+
+        def dependency(detector_type, requested):
+            # The damage classifier crops the object detector's boxes
+            return 'object_detection' if detector_type == 'damage_assessment' else None
+
+        with benchmark.stub_models(detector_types, density=2):
+            models = {
+                detector_type: main.model_service.loaded_models[
+                    f"{detector_type}_{main.model_service.resolve_model(detector_type)[0]}"
+                ]
+                for detector_type in detector_types
+            }
+            object_detector = models['object_detection']['model']
+            military_detector = models['military_detection']['model']
+            classifier = models['damage_assessment']['model']
+
+            def detect_objects(source, **kwargs):
+                events.append(('object_detection overlapped', military_started.wait(5)))
+                result = object_detector(source, **kwargs)
+                events.append('object_detection done')
+                return result
+
+            def detect_military(source, **kwargs):
+                military_started.set()
+                return military_detector(source, **kwargs)
+
+            def classify(inputs, **kwargs):
+                events.append('damage_assessment started')
+                return classifier.predict(inputs, **kwargs)
+
+            models['object_detection']['model'] = detect_objects
+            models['military_detection']['model'] = detect_military
+            models['damage_assessment']['model'] = mock.Mock(input_shape=classifier.input_shape, predict=classify)
+            with mock.patch.object(main.model_service, '_detector_dependency', side_effect=dependency):
+                results = main.model_service.process_batch(
+                    [marker_file.file.path for marker_file in marker.files.all()], detector_types
+                )
+
+        self.assertEqual(
+            events, [('object_detection overlapped', True), 'object_detection done', 'damage_assessment started']
+        )
+        for file_results in results.values():
+            self.assertEqual(list(file_results), detector_types)
+
+
+class JobQueueTests(DetectionTestCase):
+
+    def test_expired_lease_is_requeued_then_failed(self):
+        job, _ = jobs.enqueue_job(make_marker(self.alice), ['object_detection'], self.alice)
+        job = jobs.claim_next_job('worker-1')
+        DetectionJob.objects.filter(id=job.id).update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(jobs.requeue_expired_jobs(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, DetectionJob.STATUS_QUEUED)
+        self.assertEqual(job.worker_id, '')
+
+        # The worker that lost the lease can no longer report progress
+        stale_job = DetectionJob.objects.get(id=job.id)
+        stale_job.worker_id = 'worker-1'
+        with self.assertRaises(jobs.JobLeaseLost):
+            jobs.update_progress(stale_job, {'files_done': 0, 'files_total': 0, 'units_done': 0, 'units_total': 0})
+
+        DetectionJob.objects.filter(id=job.id).update(
+            status=DetectionJob.STATUS_RUNNING,
+            attempts=jobs.get_job_settings()['max_attempts'],
+            lease_expires_at=timezone.now() - timedelta(seconds=1)
+        )
+        jobs.requeue_expired_jobs()
+        job.refresh_from_db()
+        self.assertEqual(job.status, DetectionJob.STATUS_FAILED)
+
+    def test_claim_order_prefers_priority_then_takes_turns(self):
+        background, _ = jobs.enqueue_job(
+            make_marker(self.alice), ['object_detection'], priority=DetectionJob.PRIORITY_BACKGROUND
+        )
+        alice_first, _ = jobs.enqueue_job(make_marker(self.alice), ['object_detection'], self.alice)
+        alice_second, _ = jobs.enqueue_job(make_marker(self.alice), ['object_detection'], self.alice)
+        bob_first, _ = jobs.enqueue_job(make_marker(self.bob), ['object_detection'], self.bob)
+
+        self.assertEqual(jobs.claim_order(), [alice_first.id, bob_first.id])
+
+        claimed = jobs.claim_next_job('worker-1')
+        self.assertEqual(claimed.id, alice_first.id)
+        # Alice has a job running now, so Bob goes first even though his job is newer
+        self.assertEqual(jobs.claim_order(), [bob_first.id, alice_second.id])
+        self.assertNotIn(background.id, jobs.claim_order())
+
+    def test_extend_lease_covers_the_batch_budget(self):
+        jobs.enqueue_job(make_marker(self.alice), ['object_detection'], self.alice)
+        job = jobs.claim_next_job('worker-1')
+
+        with self.settings(DETECTION_JOBS={'lease_seconds': 60, 'max_file_seconds': 120, 'watchdog_grace_seconds': 30}):
+            jobs.extend_lease(job, 16)
+            job.refresh_from_db()
+            self.assertGreater(job.lease_expires_at, timezone.now() + timedelta(seconds=120 * 16))
+
+            # Progress reports don't shorten it
+            jobs.update_progress(job, {'files_done': 1, 'files_total': 16, 'units_done': 1, 'units_total': 16})
+            job.refresh_from_db()
+            self.assertGreater(job.lease_expires_at, timezone.now() + timedelta(seconds=120 * 16))
+
+
+class AdmissionTests(DetectionTestCase):
+
+    @override_settings(DETECTION_ADMISSION={'max_queued_files': 5, 'min_retry_after': 15})
+    def test_full_queue_is_refused_with_retry_after(self):
+        DetectionJob.objects.create(
+            marker=make_marker(self.bob), detector_types=['object_detection'], files_total=10
+        )
+        marker = make_marker(self.alice, object_detection=True)
+
+        self.client.login(username='alice', password='password')
+        response = self.client.post(reverse('detection:auto_process_marker', args=[marker.id]))
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], str(response.json()['retry_after']))
+        self.assertGreaterEqual(int(response['Retry-After']), 15)
+        self.assertFalse(DetectionJob.objects.filter(marker=marker).exists())
+
+    def test_save_raises_the_priority_of_a_queued_background_job(self):
+        marker = make_marker(self.alice, files=2, object_detection=True)
+        first_file = marker.files.order_by('id').first()
+        job, _ = jobs.enqueue_job(
+            marker, ['object_detection'], priority=DetectionJob.PRIORITY_BACKGROUND, file_ids=[first_file.id]
+        )
+
+        submission = admission.submit(marker, ['object_detection'], self.alice)
+
+        job.refresh_from_db()
+        self.assertEqual(submission['outcome'], admission.OUTCOME_COALESCED)
+        self.assertEqual(job.priority, DetectionJob.PRIORITY_INTERACTIVE)
+        # The save covers the whole marker, so the job is widened to it
+        self.assertEqual(job.file_ids, [])
+        self.assertEqual(job.files_total, 2)
+
+    def test_targeted_requests_merge_their_files(self):
+        marker = make_marker(self.alice, files=3)
+        first_file, second_file, _ = marker.files.order_by('id')
+        job, _ = jobs.enqueue_job(
+            marker, ['object_detection'], priority=DetectionJob.PRIORITY_BACKGROUND, file_ids=[first_file.id]
+        )
+
+        outcome = jobs.coalesce_submission(
+            job, ['military_detection'], priority=DetectionJob.PRIORITY_BACKGROUND, file_ids=[second_file.id]
+        )
+
+        job.refresh_from_db()
+        self.assertEqual(outcome, 'coalesced')
+        self.assertEqual(job.file_ids, [first_file.id, second_file.id])
+        self.assertEqual(job.files_total, 2)
+        self.assertEqual(job.detector_types, ['object_detection', 'military_detection'])
+        self.assertEqual(job.priority, DetectionJob.PRIORITY_BACKGROUND)
+
+
+class ProcessMarkerViewTests(DetectionTestCase):
+
+    def test_get_confirms_and_post_queues(self):
+        marker = make_marker(self.alice, files=1, object_detection=True)
+        url = reverse('detection:process_marker', args=[marker.id])
+        self.client.login(username='alice', password='password')
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'detection/confirm_reprocess.html')
+        self.assertFalse(DetectionJob.objects.exists())
+
+        response = self.client.post(url, {'confirm_reprocess': 'yes'})
+        self.assertEqual(response.status_code, 302)
+        job = DetectionJob.objects.get(marker=marker)
+        self.assertFalse(job.incremental)
+        self.assertEqual(job.detector_types, ['object_detection'])
+
+
+class CancelTests(DetectionTestCase):
+
+    def test_cancel_queued_running_and_finished_jobs(self):
+        queued, _ = jobs.enqueue_job(make_marker(self.alice), ['object_detection'], self.alice)
+        self.assertEqual(jobs.cancel_job(queued), 'cancelled')
+        self.assertEqual(jobs.cancel_job(queued), None)
+
+        jobs.enqueue_job(make_marker(self.alice), ['object_detection'], self.alice)
+        running = jobs.claim_next_job('worker-1')
+        self.assertEqual(jobs.cancel_job(running), 'cancelling')
+        with self.assertRaises(jobs.JobCancelled):
+            jobs.extend_lease(running, 1)
+        with self.assertRaises(jobs.JobCancelled):
+            jobs.update_progress(running, {'files_done': 0, 'files_total': 0, 'units_done': 0, 'units_total': 0})
+
+    def test_cancel_survives_an_expired_lease(self):
+        jobs.enqueue_job(make_marker(self.alice), ['object_detection'], self.alice)
+        job = jobs.claim_next_job('worker-1')
+        jobs.cancel_job(job)
+        DetectionJob.objects.filter(id=job.id).update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+
+        jobs.requeue_expired_jobs()
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, DetectionJob.STATUS_CANCELLED)
+        self.assertIsNotNone(job.finished_at)
+        self.assertIsNone(jobs.claim_next_job('worker-2'))
+
+    @override_settings(DETECTION_RESULT_CACHE={'enabled': False})
+    def test_cancelled_run_keeps_the_results_of_finished_files(self):
+        marker = make_marker(self.alice, files=4)
+        with benchmark.stub_models(['object_detection'], density=2):
+            main.process_marker(marker, detector_types=['object_detection'])
+            previous = dict(Detection._default_manager.values_list('marker_file_id', 'id'))
+
+            jobs.enqueue_job(marker, ['object_detection'], self.alice, incremental=False)
+            job = jobs.claim_next_job('worker-1')
+
+            # Cancel while the detector runs on the second batch of two files
+            version = main.model_service.resolve_model('object_detection')[0]
+            model_data = main.model_service.loaded_models[f"object_detection_{version}"]
+            detector = model_data['model']
+            calls = []
+
+            def cancelling_detector(source, **kwargs):
+                calls.append(len(source))
+                if len(calls) == 2:
+                    jobs.cancel_job(job)
+                return detector(source, **kwargs)
+
+            model_data['model'] = cancelling_detector
+            with mock.patch.object(main, 'get_batch_size', return_value=2):
+                self.assertFalse(workers.run_job(job))
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, DetectionJob.STATUS_CANCELLED)
+        current = dict(Detection._default_manager.values_list('marker_file_id', 'id'))
+        first, second, third, fourth = sorted(previous)
+        self.assertNotEqual(current[first], previous[first])
+        self.assertNotEqual(current[second], previous[second])
+        self.assertEqual(current[third], previous[third])
+        self.assertEqual(current[fourth], previous[fourth])
+
+    def test_cancel_view_permissions(self):
+        job, _ = jobs.enqueue_job(make_marker(self.alice), ['object_detection'], self.alice)
+        url = reverse('detection:cancel_job', args=[job.id])
+
+        self.client.login(username='bob', password='password')
+        self.assertEqual(self.client.post(url).status_code, 403)
+
+        self.client.login(username='alice', password='password')
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['job_status'], DetectionJob.STATUS_CANCELLED)
+        self.assertEqual(self.client.post(url).status_code, 409)
+
+
+class WorkerPoolTests(DetectionTestCase):
+
+    def test_crashed_worker_fails_its_job(self):
+        crashed = Process(target=time.sleep, args=(0,))
+        crashed.start()
+        crashed.join()
+
+        jobs.enqueue_job(make_marker(self.alice), ['object_detection'], self.alice)
+        job = jobs.claim_next_job(f"{socket.gethostname()}:{crashed.pid}")
+
+        pool = workers.InferenceWorkerPool(1)
+        pool.processes = [crashed]
+        pool.deadlines = [Value('d', 0.0)]
+        with mock.patch.object(pool, '_spawn', return_value='replacement'):
+            pool.check_workers()
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, DetectionJob.STATUS_FAILED)
+        self.assertEqual(pool.processes, ['replacement'])
+
+
+class PolicyTests(TestCase):
+
+    def test_levels_and_image_sizes(self):
+        config = {'imgsz': 640, 'tiling': {'enabled': True, 'min_image_size': 2000}}
+        full, reduced, minimal = policy.LEVELS
+
+        self.assertEqual(policy.level_config(config, full)['imgsz'], 640)
+        self.assertEqual(policy.level_config(config, reduced)['imgsz'], 512)
+        self.assertEqual(policy.level_config(config, reduced)['tiling']['min_image_size'], 4000)
+        self.assertFalse(policy.level_config(config, minimal)['tiling']['enabled'])
+
+        # Small images are not upscaled, very large ones are annotated at half size
+        full_config = policy.level_config(config, full)
+        self.assertEqual(policy.image_config(full_config, (400, 300))['imgsz'], 416)
+        self.assertEqual(policy.image_config(full_config, (100, 80))['imgsz'], 320)
+        self.assertEqual(policy.image_config(full_config, (1920, 1080))['policy']['annotation'], 'full')
+        self.assertEqual(policy.image_config(full_config, (6000, 4000))['policy']['annotation'], 'half')
+
+    def test_degraded_results_get_their_own_params_key(self):
+        config = {'threshold': 0.3, 'iou': 0.45, 'imgsz': 640}
+        full, reduced, _ = policy.LEVELS
+
+        self.assertEqual(
+            result_cache.params_key('yolo11m', policy.level_config(config, full)),
+            result_cache.params_key('yolo11m', config)
+        )
+        self.assertNotEqual(
+            result_cache.params_key('yolo11m', policy.level_config(config, reduced)),
+            result_cache.params_key('yolo11m', config)
+        )
+
+
+class CacheKeyTests(TestCase):
+
+    def test_keys_follow_the_parameters_that_change_results(self):
+        config = {'threshold': 0.3, 'iou': 0.45, 'imgsz': 640}
+        key = result_cache.make_cache_key('abc', 'object_detection', 'yolo11m', config)
+
+        self.assertEqual(key, result_cache.make_cache_key('abc', 'object_detection', 'yolo11m', dict(config)))
+        self.assertNotEqual(key, result_cache.make_cache_key('abd', 'object_detection', 'yolo11m', config))
+        self.assertNotEqual(key, result_cache.make_cache_key('abc', 'military_detection', 'yolo11m', config))
+        self.assertNotEqual(key, result_cache.make_cache_key('abc', 'object_detection', 'yolo11m', {**config, 'threshold': 0.5}))
+        self.assertNotEqual(key, result_cache.make_cache_key('abc', 'object_detection', 'yolo11m', {**config, 'imgsz': 512}))
+
+        # Settings that don't change the results don't change the fingerprint
+        params_key = result_cache.params_key('yolo11m', config)
+        self.assertEqual(params_key, result_cache.params_key('yolo11m', {**config, 'batch_size': 16, 'policy': {'level': 'full'}}))
+        self.assertNotEqual(params_key, result_cache.params_key('yolo11m', {**config, 'tiling': {'enabled': True}}))
+
+
+class TilingTests(TestCase):
+
+    def test_merge_tile_detections_merges_overlaps_of_the_same_class(self):
+        boxes = np.array([
+            [0, 0, 100, 100],
+            [10, 10, 100, 100],     # Same object seen by the next tile, inside the first box
+            [10, 10, 100, 100],     # Other class at the same place
+            [300, 300, 400, 400],   # Separate object
+        ], dtype=np.float32)
+        scores = np.array([0.9, 0.8, 0.7, 0.6], dtype=np.float32)
+        class_ids = np.array([0, 0, 1, 0])
+
+        merged_boxes, merged_scores, merged_classes = tiling.merge_tile_detections(
+            boxes, scores, class_ids, tiling.get_tiling_settings({})
+        )
+
+        np.testing.assert_allclose(merged_scores, [0.9, 0.7, 0.6])
+        self.assertEqual(merged_classes.tolist(), [0, 1, 0])
+        self.assertEqual(merged_boxes[0].tolist(), [0, 0, 100, 100])
+
+
+class RenderingTests(DetectionTestCase):
+
+    def setUp(self):
+        super().setUp()
+        marker_file = make_marker(self.alice, files=1).files.get()
+        self.detection = Detection._default_manager.create(
+            marker_file=marker_file, detector_type='object_detection', model_name='stub', metadata={}
+        )
+        self.detection.objects.create(label='car', confidence=0.9, x_min=5, y_min=5, x_max=30, y_max=30)
+        self.url = reverse('detection:detection_image', args=[self.detection.id])
+        self.client.login(username='alice', password='password')
+
+    def test_etag_revalidation(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        etag = response['ETag']
+
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertNotEqual(self.client.get(self.url, {'min_confidence': '0.95'})['ETag'], etag)
+
+    def test_etag_changes_with_the_result(self):
+        etag = self.client.get(self.url)['ETag']
+
+        self.detection.metadata = {'inference': {'annotation': 'half'}}
+        self.detection.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class CachedResultTests(DetectionTestCase):
+
+    @override_settings(DETECTION_RENDERING={'eager': False})
+    def test_cache_hits_record_the_image_size(self):
+        marker_file = make_marker(self.alice, files=1).files.get()
+        with benchmark.stub_models(['object_detection'], density=2):
+            main.process_marker_files_batched([marker_file], ['object_detection'])
+
+            # The second run is served from the result cache, without decoding the file
+            version = main.model_service.resolve_model('object_detection')[0]
+            model_data = main.model_service.loaded_models[f"object_detection_{version}"]
+            model_data['model'] = mock.Mock(side_effect=model_data['model'])
+            main.process_marker_files_batched([marker_file], ['object_detection'])
+
+        model_data['model'].assert_not_called()
+        detection = Detection._default_manager.get(marker_file=marker_file)
+        self.assertEqual(detection.metadata['image'], {'width': 64, 'height': 48})
+
+
+class BoxFillTests(TestCase):
+
+    def test_fills_match_blending_the_whole_image_per_box(self):
+        rng = np.random.default_rng(0)
+        image = rng.integers(0, 256, (300, 400, 3), dtype=np.uint8)
+        fills = []
+        for _ in range(150):
+            x, y = int(rng.integers(0, 380)), int(rng.integers(0, 280))
+            width, height = rng.integers(5, 200, size=2)
+            color = tuple(int(c) for c in rng.integers(0, 256, size=3))
+            fills.append((x, y, min(400, x + int(width)), min(300, y + int(height)), color, 0.3))
+
+        # How boxes used to be filled: blend a filled copy of the whole image per box
+        expected = image.copy()
+        for x1, y1, x2, y2, color, alpha in fills:
+            overlay = expected.copy()
+            cv2.rectangle(overlay, (x1, y1), (x2 - 1, y2 - 1), color, -1)
+            cv2.addWeighted(overlay, alpha, expected, 1 - alpha, 0, expected)
+
+        main._blend_box_fills(image, fills)
+
+        # Only rounding may differ
+        difference = np.abs(image.astype(np.int16) - expected)
+        self.assertLessEqual(difference.max(), 1)
+        self.assertLess(np.count_nonzero(difference) / difference.size, 0.05)
+
+
+class StalenessTests(DetectionTestCase):
+
+    def test_stale_pairs(self):
+        marker_file = make_marker(self.alice, files=1).files.get()
+        self.assertEqual(
+            staleness.stale_pairs([marker_file], ['object_detection']),
+            {marker_file.id: {'object_detection': staleness.REASON_NEW}}
+        )
+
+        model_name, config = main.model_service.resolve_model('object_detection')
+        fingerprint = {
+            'content_hash': images.hash_file(marker_file.file.path),
+            'model_hash': result_cache.get_model_hash(model_name, config),
+            'params_key': result_cache.params_key(model_name, config),
+        }
+        detection = Detection._default_manager.create(
+            marker_file=marker_file, detector_type='object_detection', model_name=model_name, metadata=fingerprint
+        )
+        self.assertEqual(staleness.stale_pairs([marker_file], ['object_detection']), {})
+
+        detection.metadata = {**fingerprint, 'params_key': 'older settings'}
+        detection.save()
+        self.assertEqual(
+            staleness.stale_pairs([marker_file], ['object_detection']),
+            {marker_file.id: {'object_detection': staleness.REASON_SETTINGS}}
+        )
+
+        detection.metadata = {**fingerprint, 'content_hash': 'replaced file'}
+        detection.save()
+        self.assertEqual(
+            staleness.stale_pairs([marker_file], ['object_detection']),
+            {marker_file.id: {'object_detection': staleness.REASON_CONTENT}}
+        )
+
+
+def benchmark_report(p50, **meta):
+    """A benchmark report with one case whose median run took `p50` ms"""
+    return {
+        'meta': {'version': benchmark.BENCHMARK_VERSION, 'models': 'stub', 'machine': 'x86_64', 'cpu_count': 8, **meta},
+        'cases': {'annotate/640x480/d10': {'p50': p50, 'p95': p50 * 2, 'min': p50 / 2}},
+    }
+
+
+class BenchmarkTests(TestCase):
+
+    def test_compare_flags_slower_medians(self):
+        baseline = benchmark_report(10.0)
+
+        self.assertEqual(benchmark.compare(benchmark_report(12.0), baseline), [])
+        # Within the tolerance, or too few milliseconds to tell from noise
+        self.assertEqual(benchmark.compare(benchmark_report(12.4), baseline, tolerance=0.25), [])
+        self.assertEqual(benchmark.compare(benchmark_report(1.5), benchmark_report(1.0)), [])
+
+        self.assertEqual(benchmark.compare(benchmark_report(15.0), baseline), [{
+            'case': 'annotate/640x480/d10', 'baseline_p50': 10.0, 'p50': 15.0, 'ratio': 1.5
+        }])
+
+    def test_compare_refuses_baselines_from_other_machines(self):
+        with self.assertRaises(ValueError):
+            benchmark.compare(benchmark_report(10.0), benchmark_report(10.0, cpu_count=4))
+        with self.assertRaises(ValueError):
+            benchmark.compare(benchmark_report(10.0), benchmark_report(10.0, machine='arm64'))
+        with self.assertRaises(ValueError):
+            benchmark.compare(benchmark_report(10.0), benchmark_report(10.0, models='real'))
+
+    def test_parse_resolution(self):
+        self.assertEqual(parse_resolution('1920x1080'), (1920, 1080))
+        self.assertEqual(parse_resolution('640X480'), (640, 480))
+        for value in ('1920', '1920x1080x3', 'widexhigh'):
+            with self.assertRaises(ValueError):
+                parse_resolution(value)
+
+    def test_command_fails_on_regressions(self):
+        workdir = tempfile.mkdtemp(prefix='detection-benchmark-tests-')
+        self.addCleanup(shutil.rmtree, workdir, ignore_errors=True)
+        options = {
+            'detector_types': ['object_detection'],
+            'output': f"{workdir}/report.json",
+            'baseline': f"{workdir}/baseline.json",
+            'stdout': StringIO(),
+            'stderr': StringIO(),
+        }
+
+        with mock.patch.object(benchmark, 'run', return_value=benchmark_report(10.0)):
+            with self.assertRaisesMessage(CommandError, 'create one with --update-baseline'):
+                call_command('benchmark_detection', **options)
+            call_command('benchmark_detection', update_baseline=True, **options)
+            call_command('benchmark_detection', **options)
+
+        with mock.patch.object(benchmark, 'run', return_value=benchmark_report(20.0)):
+            with self.assertRaisesMessage(CommandError, '1 cases regressed'):
+                call_command('benchmark_detection', **options)
+
+        with mock.patch.object(benchmark, 'run', return_value=benchmark_report(10.0, cpu_count=64)):
+            with self.assertRaisesMessage(CommandError, 'record a new baseline'):
+                call_command('benchmark_detection', **options)
+
+
+class ReprocessTests(DetectionTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.marker = make_marker(self.alice, files=2)
+        workdir = tempfile.mkdtemp(prefix='detection-reprocess-tests-')
+        self.addCleanup(shutil.rmtree, workdir, ignore_errors=True)
+        self.checkpoint = f"{workdir}/checkpoint.json"
+        # Only the object detector has weights
+        has_weights = mock.patch.object(
+            main.model_service, 'has_weights', side_effect=lambda detector_type: detector_type == 'object_detection'
+        )
+        has_weights.start()
+        self.addCleanup(has_weights.stop)
+
+    def test_gives_up_without_workers_and_skips_detectors_without_weights(self):
+        stdout = StringIO()
+        with mock.patch.object(backfill.time, 'sleep'):
+            with self.assertRaisesMessage(CommandError, 'No detection worker took the queued jobs'):
+                call_command(
+                    'reprocess_detections', detector_types=['object_detection', 'damage_assessment'], missing=True,
+                    worker_timeout=0, checkpoint=self.checkpoint, stdout=stdout
+                )
+
+        self.assertEqual(stdout.getvalue().count('damage_assessment: no model weights, skipping'), 1)
+        job = DetectionJob.objects.get(marker=self.marker)
+        self.assertEqual(job.status, DetectionJob.STATUS_CANCELLED)
+        self.assertEqual(job.detector_types, ['object_detection'])
+
+    @override_settings(DETECTION_RESULT_CACHE={'enabled': False})
+    def test_local_processes(self):
+        stdout = StringIO()
+        with benchmark.stub_models(['object_detection'], density=2):
+            call_command(
+                'reprocess_detections', detector_types=['object_detection', 'damage_assessment'], missing=True,
+                processes=1, checkpoint=self.checkpoint, stdout=stdout
+            )
+
+        self.assertIn('Reprocessed 2 files', stdout.getvalue())
+        self.assertEqual(
+            Detection._default_manager.filter(marker_file__marker=self.marker, detector_type='object_detection').count(), 2
+        )
+        self.assertFalse(DetectionJob.objects.exists())
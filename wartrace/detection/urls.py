@@ -13,7 +13,13 @@ urlpatterns = [
     path('files/<int:file_id>/process/', views.process_file_view, name='process_file'),
     path('files/<int:file_id>/results/', views.file_detection_results, name='file_results'),
     
+    # Detection-level endpoints
+    path('detections/<int:detection_id>/image/', views.detection_image, name='detection_image'),
+    
     # API endpoints
     path('api/markers/<int:marker_id>/process/', views.process_marker_api, name='process_marker_api'),
     path('api/markers/<int:marker_id>/auto-process/', views.auto_process_marker, name='auto_process_marker'),
+    path('api/jobs/<int:job_id>/cancel/', views.cancel_job_view, name='cancel_job'),
+    path('api/timings/', views.detection_timings, name='detection_timings'),
+    path('api/queue/', views.detection_queue, name='detection_queue'),
 ]
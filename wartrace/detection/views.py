@@ -1,11 +1,8 @@
-import json
 import os
 import traceback
 import logging
-import threading
-import time
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, FileResponse, HttpResponseBadRequest, HttpResponseNotModified
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.http import require_http_methods
 from django.core.files.storage import default_storage
@@ -14,20 +11,15 @@ from django.urls import reverse
 from django.db import models, transaction
 from django.conf import settings
 from django.contrib import messages
-from concurrent.futures import ThreadPoolExecutor
 
 from content.models import Marker, MarkerFile
-from .models import Detection, ObjectDetection, ClassificationResult, DetectionConfig
-from .services.main import process_marker, process_marker_file, model_service, MODEL_CONFIG, ensure_detection_directories
+from .models import Detection, ObjectDetection, ClassificationResult, DetectionConfig, DetectionJob
+from .services.main import process_marker_file, model_service, MODEL_CONFIG, ensure_detection_directories
+from .services import admission, jobs, notifications, rendering, timing
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
-# Global worker pool for processing
-worker_pool = ThreadPoolExecutor(max_workers=2)
-# Track processing status
-processing_markers = {}
-
 def can_edit_marker(user, marker):
     """
     Check if a user has permission to edit a marker.
@@ -75,15 +67,16 @@ def process_marker_view(request, marker_id):
     """
     Process a marker with AI detection.
     
-    Renders a confirmation page for reprocessing if needed, then triggers
-    the AI detection process for the marker's files.
+    A GET renders a confirmation page. A POST queues the files whose results
+    are missing or stale (new or replaced files, changed weights or thresholds)
+    for the inference workers, or every file with `confirm_reprocess=yes`.
     
     Args:
         request: HttpRequest object containing metadata about the request
         marker_id: The ID of the marker to process
         
     Returns:
-        HttpResponse object with the processing result or confirmation page
+        The confirmation page, or a redirect to the marker page, which shows the job's progress
     """
     marker = get_object_or_404(Marker, id=marker_id)
     
@@ -108,69 +101,44 @@ def process_marker_view(request, marker_id):
     if marker.thermal_analysis:
         detector_types.append('emergency_recognition')
     
-    # Clear previous detections if reprocessing
-    # Fix: access marker_file.detections.all() first to get a related manager
-    detection_count = 0
-    for marker_file in marker.files.all():
-        detections = marker_file.detections.all()  # Get the related manager
-        detection_count += detections.filter(detector_type__in=detector_types).count()
-    
-    if detection_count > 0:
-        if request.method == 'POST' and request.POST.get('confirm_reprocess') == 'yes':
-            # User confirmed reprocessing, delete old detections
-            logger.info(f"Reprocessing marker {marker_id} - deleting {detection_count} existing detections")
-            
-            for marker_file in marker.files.all():
-                file_detections = marker_file.detections.filter(detector_type__in=detector_types)
-                
-                # Clean up both DB-stored and legacy filesystem images before deleting records
-                for detection in file_detections:
-                    # Clean up DB-stored images
-                    if detection.processed_image:
-                        try:
-                            detection.processed_image.delete(save=False)
-                            logger.info(f"Deleted DB-stored image for detection {detection.id}")
-                        except Exception as e:
-                            logger.error(f"Error deleting DB-stored image: {str(e)}")
-                    
-                    # Clean up legacy filesystem images
-                    if detection.image_path:
-                        try:
-                            legacy_path = detection.image_path
-                            if legacy_path.startswith('/'):
-                                legacy_path = legacy_path[1:]
-                            
-                            if default_storage.exists(legacy_path):
-                                default_storage.delete(legacy_path)
-                                logger.info(f"Deleted legacy filesystem image: {legacy_path}")
-                        except Exception as e:
-                            logger.error(f"Error deleting legacy filesystem image: {str(e)}")
-                
-                # Now delete the detection records
-                file_detections.delete()
-        else:
-            # Ask for confirmation before reprocessing
-            return render(request, 'detection/confirm_reprocess.html', {
-                'marker': marker,
-                'detection_count': detection_count,
-                'detector_types': detector_types
-            })
+    if not detector_types:
+        messages.warning(request, "No detection types are enabled for this marker.")
+        return redirect('detection:marker_results', marker_id=marker.id)
+    
+    # Only a POST changes anything
+    if request.method != 'POST':
+        detection_count = Detection._default_manager.filter(
+            marker_file__marker=marker, detector_type__in=detector_types
+        ).count()
+        return render(request, 'detection/confirm_reprocess.html', {
+            'marker': marker,
+            'file_count': file_count,
+            'detection_count': detection_count,
+            'detector_types': detector_types
+        })
     
-    # Process the marker
+    # Without a confirmed full reprocess, only missing and stale results are computed
+    # and up-to-date ones are kept. A full reprocess replaces each file's results as
+    # the worker reaches it.
+    full_reprocess = request.POST.get('confirm_reprocess') == 'yes'
+    
+    # Queue the marker for the inference workers through admission control
     try:
-        # Use the processing service
-        from .services.main import process_marker
-        result = process_marker(marker)
-        
-        # Show success message
-        messages.success(request, f"Processing complete: {result['processed']} files processed with {result['detections']} detections.")
-        
-    except Exception as e:
-        logger.exception(f"Error processing marker {marker_id}: {str(e)}")
-        messages.error(request, f"Error during processing: {str(e)}")
+        submission = admission.submit(marker, detector_types, request.user, incremental=not full_reprocess)
+    except admission.AdmissionRejected as e:
+        messages.error(request, f"{e} (retry in about {e.retry_after} seconds).")
+        return redirect('detection:marker_results', marker_id=marker.id)
     
-    # Redirect to the results page
-    return redirect('detection:marker_results', marker_id=marker.id)
+    messages_by_outcome = {
+        admission.OUTCOME_QUEUED: "Processing has been queued.",
+        admission.OUTCOME_DEFERRED: "The queue is busy, processing will start when it clears.",
+        admission.OUTCOME_COALESCED: "Processing is already queued, it will include these changes.",
+        admission.OUTCOME_FOLLOWUP: "Processing is in progress, these changes will be processed next.",
+    }
+    messages.info(request, messages_by_outcome[submission['outcome']])
+    
+    # The marker page follows the job's progress and opens the results when it is done
+    return redirect(f"{reverse('content:marker_detail', args=[marker.id])}?processing=1")
 
 @login_required
 @require_http_methods(["POST"])
@@ -198,7 +166,7 @@ def process_marker_api(request, marker_id):
         }, status=403)
     
     # Check if already processing
-    if marker_id in processing_markers and processing_markers[marker_id]['status'] == 'processing':
+    if jobs.get_active_job(marker_id):
         return JsonResponse({
             'success': False,
             'message': 'Processing already in progress'
@@ -228,23 +196,24 @@ def process_marker_api(request, marker_id):
         # Save updated marker
         marker.save()
         
-        # Start processing in background
-        processing_markers[marker_id] = {
-            'status': 'processing',
-            'progress': 0,
-            'detector_types': detector_types
-        }
-        
-        # Start background processing task
-        worker_pool.submit(
-            process_marker_background,
-            marker, 
-            detector_types
-        )
+        # Queue the marker for the inference workers, new markers ahead of reprocessing
+        try:
+            job, created = jobs.enqueue_job(marker, detector_types, request.user, priority=jobs.default_priority(marker))
+        except jobs.QueueLimitExceeded as e:
+            return JsonResponse({
+                'success': False,
+                'message': str(e)
+            }, status=429)
+        if not created:
+            return JsonResponse({
+                'success': False,
+                'message': 'Processing already in progress'
+            })
         
         return JsonResponse({
             'success': True,
             'message': 'Processing started',
+            'job_id': job.id,
             'detector_types': detector_types
         })
     
@@ -261,14 +230,19 @@ def marker_processing_status(request, marker_id):
     """
     Get the current processing status for a marker.
     
-    Retrieves the processing status from the global tracking dictionary.
+    Retrieves the status of the marker's most recent detection job. Clients
+    with a WebSocket receive the same payload from ProcessingStatusConsumer;
+    this endpoint is the fallback for those without one. With a
+    `since` query parameter (server_time of the previous response), results
+    saved after that moment are included so they can be shown before the whole
+    job finishes.
     
     Args:
         request: HttpRequest object containing metadata about the request
         marker_id: The ID of the marker to check status for
         
     Returns:
-        JsonResponse with the current processing status and progress
+        JsonResponse with the current processing status, progress and new results
     """
     marker = get_object_or_404(Marker, id=marker_id)
     
@@ -279,18 +253,57 @@ def marker_processing_status(request, marker_id):
             'message': 'Permission denied'
         }, status=403)
     
+    since = None
+    if request.GET.get('since'):
+        try:
+            since = float(request.GET['since'])
+        except ValueError:
+            return HttpResponseBadRequest('since must be a timestamp')
+    
     # Get current status
-    if marker_id in processing_markers:
-        status_data = processing_markers[marker_id]
+    return JsonResponse(notifications.status_message(jobs.get_latest_job(marker_id), marker.id, since))
+
+@login_required
+@require_http_methods(["POST"])
+def cancel_job_view(request, job_id):
+    """
+    Cancel a detection job.
+    
+    A queued job is cancelled right away. A running job stops after the
+    detector it is running; files it already finished keep their new
+    results and the others keep their previous ones.
+    
+    Args:
+        request: HttpRequest object containing metadata about the request
+        job_id: The ID of the job to cancel
+        
+    Returns:
+        JsonResponse with the job status after the request
+    """
+    job = get_object_or_404(DetectionJob.objects.select_related('marker'), id=job_id)
+    
+    # Check permissions
+    if not request.user.is_staff and job.user != request.user and job.marker.user != request.user:
         return JsonResponse({
-            'status': status_data['status'],
-            'progress': status_data.get('progress', 0),
-            'result': status_data.get('result')
-        })
-    else:
+            'success': False,
+            'message': 'Permission denied'
+        }, status=403)
+    
+    state = jobs.cancel_job(job)
+    if state is None:
         return JsonResponse({
-            'status': 'idle'
-        })
+            'success': False,
+            'message': 'The job has already finished',
+            'job_status': job.status
+        }, status=409)
+    
+    notifications.publish_status(job)
+    return JsonResponse({
+        'success': True,
+        'status': state,
+        'job_id': job.id,
+        'job_status': job.status
+    })
 
 @login_required
 @require_http_methods(["POST"])
@@ -299,14 +312,17 @@ def auto_process_marker(request, marker_id):
     Automatically start processing for a marker based on its detection settings.
     
     Uses the marker's existing detection settings to determine which detector
-    types to run.
+    types to run. Called after every marker save, so requests go through
+    admission control: repeated saves are coalesced into the marker's active
+    job, and when the queue is full the request is refused with 429 and a
+    Retry-After header.
     
     Args:
         request: HttpRequest object containing metadata about the request
         marker_id: The ID of the marker to process
         
     Returns:
-        JsonResponse with the processing status and detector types
+        JsonResponse with the processing status, detector types and queue position
     """
     marker = get_object_or_404(Marker, id=marker_id)
     
@@ -318,13 +334,6 @@ def auto_process_marker(request, marker_id):
         }, status=403)
     
     try:
-        # Check if already processing
-        if marker_id in processing_markers and processing_markers[marker_id]['status'] == 'processing':
-            return JsonResponse({
-                'success': False,
-                'message': 'Processing already in progress'
-            })
-        
         # Map model types to detector types
         model_map = {
             'object_detection': marker.object_detection,
@@ -342,23 +351,34 @@ def auto_process_marker(request, marker_id):
                 'message': 'No detection types enabled'
             })
         
-        # Start processing in background
-        processing_markers[marker_id] = {
-            'status': 'processing',
-            'progress': 0,
-            'detector_types': detector_types
+        # Queue the marker for the inference workers, or merge into its active job
+        try:
+            submission = admission.submit(marker, detector_types, request.user)
+        except admission.AdmissionRejected as e:
+            response = JsonResponse({
+                'success': False,
+                'message': str(e),
+                'retry_after': e.retry_after,
+                'queue_position': e.queue_position,
+                'estimated_wait_seconds': round(e.estimated_wait)
+            }, status=429)
+            response['Retry-After'] = str(e.retry_after)
+            return response
+        
+        messages_by_outcome = {
+            admission.OUTCOME_QUEUED: 'Processing started',
+            admission.OUTCOME_DEFERRED: 'The queue is busy, processing will start when it clears',
+            admission.OUTCOME_COALESCED: 'Processing is already queued, it will include these changes',
+            admission.OUTCOME_FOLLOWUP: 'Processing is in progress, these changes will be processed next',
         }
-        
-        # Start background processing task
-        worker_pool.submit(
-            process_marker_background,
-            marker, 
-            detector_types
-        )
-        
+        estimated_wait = submission['estimated_wait']
         return JsonResponse({
             'success': True,
-            'message': 'Processing started',
+            'message': messages_by_outcome[submission['outcome']],
+            'outcome': submission['outcome'],
+            'job_id': submission['job'].id,
+            'queue_position': submission['queue_position'],
+            'estimated_wait_seconds': round(estimated_wait) if estimated_wait is not None else None,
             'detector_types': detector_types
         })
     
@@ -370,59 +390,6 @@ def auto_process_marker(request, marker_id):
             'message': f'Error starting processing: {str(e)}'
         }, status=500)
 
-def process_marker_background(marker, detector_types):
-    """
-    Process a marker in background thread.
-    
-    Handles the actual processing work asynchronously, updating the global
-    status dictionary with progress and results.
-    
-    Args:
-        marker: The Marker object to process
-        detector_types: List of detector type identifiers to apply
-        
-    Returns:
-        None
-    """
-    marker_id = marker.id
-    
-    try:
-        logger.info(f"Starting background processing for marker {marker_id}")
-        
-        # Process marker with selected detector types
-        result = process_marker(marker)
-        
-        # Update status to completed
-        processing_markers[marker_id] = {
-            'status': 'completed',
-            'progress': 100,
-            'detector_types': detector_types,
-            'result': {
-                'success': True,
-                'message': 'Processing completed successfully',
-                'processed': result.get('processed', 0),
-                'detections': result.get('detections', 0),
-                'result_images': result.get('detections', 0),
-                'processing_time': result.get('processing_time')
-            }
-        }
-        logger.info(f"Completed background processing for marker {marker_id}: {result}")
-    
-    except Exception as e:
-        logger.error(f"Error in background processing for marker {marker_id}: {str(e)}")
-        logger.error(traceback.format_exc())
-        
-        # Update status to error
-        processing_markers[marker_id] = {
-            'status': 'error',
-            'progress': 0,
-            'detector_types': detector_types,
-            'result': {
-                'success': False,
-                'message': f'Error during processing: {str(e)}'
-            }
-        }
-
 @login_required
 def marker_detection_results(request, marker_id):
     """
@@ -586,10 +553,9 @@ def detection_detail(request, detection_id):
         config = DetectionConfig.objects.get(detector_type=detector_type)
         display_name = config.display_name
         
-        # Get model description from model configuration
-        model_info = model_service.get_model(detector_type, detection.model_name)
-        if model_info and 'config' in model_info:
-            model_description = model_info['config'].get('description', '')
+        # Get model description from model configuration without loading the model
+        model_config = MODEL_CONFIG.get(detector_type, {}).get(detection.model_name, {})
+        model_description = model_config.get('description', '')
     except DetectionConfig.DoesNotExist:
         pass
     except Exception as e:
@@ -613,6 +579,53 @@ def detection_detail(request, detection_id):
     
     return render(request, 'detection/detection_detail.html', context)
 
+@login_required
+def detection_image(request, detection_id):
+    """
+    Serve a detection's annotated image, rendered on demand.
+
+    Boxes are drawn from the stored ObjectDetection rows over the original
+    file; renders are cached on disk, so repeated views are served directly.
+
+    Args:
+        request: HttpRequest object containing metadata about the request.
+            Optional GET parameters: `min_confidence` (0-1) and `labels`
+            (comma-separated) to draw only some of the objects.
+        detection_id: The ID of the detection to render
+
+    Returns:
+        FileResponse with the JPEG image
+    """
+    detection = get_object_or_404(Detection, id=detection_id)
+
+    # Check if user has permission to view this marker
+    if not can_view_marker(request.user, detection.marker_file.marker):
+        return render(request, '403.html', status=403)
+
+    try:
+        min_confidence = request.GET.get('min_confidence')
+        min_confidence = float(min_confidence) if min_confidence else None
+    except ValueError:
+        return HttpResponseBadRequest('min_confidence must be a number')
+
+    labels = [label.strip() for label in request.GET.get('labels', '').split(',') if label.strip()]
+
+    etag = f'"{rendering.render_key(detection, min_confidence, {label.lower() for label in labels})}"'
+    if request.headers.get('If-None-Match') == etag:
+        return HttpResponseNotModified()
+
+    try:
+        path = rendering.render_detection(detection, min_confidence, labels)
+    except Exception as e:
+        logger.error(f"Error rendering detection {detection_id}: {str(e)}")
+        logger.error(traceback.format_exc())
+        return HttpResponse(status=500)
+
+    response = FileResponse(open(path, 'rb'), content_type='image/jpeg')
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, max-age=3600'
+    return response
+
 @login_required
 def available_models(request):
     """
@@ -643,6 +656,72 @@ def available_models(request):
         'models': models
     })
 
+@login_required
+def detection_timings(request):
+    """
+    API endpoint reporting how long each processing stage takes.
+    
+    Aggregates the stage timings recorded with recent detections into
+    p50/p95/p99 latencies per detector type and model. Staff only.
+    
+    Args:
+        request: HttpRequest object containing metadata about the request.
+            Optional query parameters: `days` (window, default 7) and
+            `detector_type` (repeatable).
+        
+    Returns:
+        JsonResponse with the percentiles in milliseconds per stage
+    """
+    if not request.user.is_staff:
+        return JsonResponse({
+            'success': False,
+            'message': 'Permission denied'
+        }, status=403)
+    
+    try:
+        days = int(request.GET.get('days', timing.DEFAULT_DAYS))
+    except ValueError:
+        return HttpResponseBadRequest('days must be an integer')
+    
+    return JsonResponse({
+        'success': True,
+        'days': days,
+        'stages': timing.STAGES,
+        'models': timing.aggregate_timings(days, request.GET.getlist('detector_type'))
+    })
+
+@login_required
+def detection_queue(request):
+    """
+    API endpoint reporting the state of the detection job queue.
+    
+    Lists per priority class the jobs and files waiting and how long started
+    jobs waited for a worker (p50/p95/p99). Staff only.
+    
+    Args:
+        request: HttpRequest object containing metadata about the request.
+            Optional query parameter: `hours` (window of the wait times, default 24).
+        
+    Returns:
+        JsonResponse with the queue metrics per priority class
+    """
+    if not request.user.is_staff:
+        return JsonResponse({
+            'success': False,
+            'message': 'Permission denied'
+        }, status=403)
+    
+    try:
+        hours = int(request.GET.get('hours', 24))
+    except ValueError:
+        return HttpResponseBadRequest('hours must be an integer')
+    
+    return JsonResponse({
+        'success': True,
+        'hours': hours,
+        'classes': jobs.queue_metrics(hours)
+    })
+
 @login_required
 def process_file_view(request, file_id):
     """
@@ -345,6 +345,9 @@ document.addEventListener('DOMContentLoaded', function() {
           .then(processingData => {
             if (processingData.success) {
               showNotification('ШІ-аналіз запущено. Результати будуть доступні на сторінці маркера.');
+            } else if (processingData.retry_after) {
+              // The processing queue is full (HTTP 429), the marker can be processed later from its page
+              showNotification(`Черга обробки переповнена. Спробуйте запустити аналіз через ${Math.ceil(processingData.retry_after / 60)} хв.`);
             } else {
               console.error('Processing error:', processingData);
               showNotification(`Помилка обробки: ${processingData.message || 'Невідома помилка'}`);
@@ -449,6 +449,9 @@ document.addEventListener('DOMContentLoaded', function() {
       if (processingData) {
         if (processingData.success) {
           showNotification('Аналіз ШІ запущено. Результати будуть доступні незабаром.');
+        } else if (processingData.retry_after) {
+          // The processing queue is full (HTTP 429), the marker can be processed later from its page
+          showNotification(`Черга обробки переповнена. Спробуйте запустити аналіз через ${Math.ceil(processingData.retry_after / 60)} хв.`);
         } else {
           console.error('Processing error:', processingData);
           showNotification(`Помилка обробки: ${processingData.message || 'Невідома помилка'}`);
@@ -13,20 +13,18 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'wartrace.settings')
 
-application = get_asgi_application()
-import os
-from django.core.asgi import get_asgi_application
+# Set up Django before importing consumers, which use the models
+django_asgi_app = get_asgi_application()
+
 from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.auth import AuthMiddlewareStack
 import wartrace.routing
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'your_project_name.settings')
-
 application = ProtocolTypeRouter({
-    "http": get_asgi_application(),
+    "http": django_asgi_app,
     "websocket": AuthMiddlewareStack(
         URLRouter(
             wartrace.routing.websocket_urlpatterns
         )
     ),
-})
\ No newline at end of file
+})
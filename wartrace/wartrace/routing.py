@@ -0,0 +1,4 @@
+from chat.routing import websocket_urlpatterns as chat_websocket_urlpatterns
+from detection.routing import websocket_urlpatterns as detection_websocket_urlpatterns
+
+websocket_urlpatterns = chat_websocket_urlpatterns + detection_websocket_urlpatterns
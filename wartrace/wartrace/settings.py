@@ -93,6 +93,12 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Several inference worker processes write results concurrently: take the
+        # write lock when a transaction starts and wait for it instead of failing
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
     }
 }
 
@@ -143,7 +149,7 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
-ASGI_APPLICATION = 'your_project_name.asgi.wartrace'
+ASGI_APPLICATION = 'wartrace.asgi.application'
 
 CHANNEL_LAYERS = {
     'default': {
@@ -152,4 +158,61 @@ CHANNEL_LAYERS = {
             "hosts": [('127.0.0.1', 6379)],
         },
     },
-}
\ No newline at end of file
+}
+
+# Detection inference workers, started with `python manage.py run_detection_workers`
+DETECTION_WORKERS = {
+    'concurrency': 2,
+}
+
+# Detection job queue stored in the database
+DETECTION_JOBS = {
+    'lease_seconds': 600,
+    'ttl_hours': 24 * 7,
+    'max_queued_files_per_user': 1000,
+    # Time budgets: a job past max_job_seconds is failed between batches, and a worker
+    # stuck on one batch for longer than max_file_seconds per file is killed and replaced
+    'max_job_seconds': 3600,
+    'max_file_seconds': 120,
+}
+
+# Admission control for the auto-process endpoint called after every marker save
+DETECTION_ADMISSION = {
+    'defer_wait_seconds': 300,
+    'max_wait_seconds': 1800,
+    'max_queued_files': 5000,
+}
+
+# Inference settings step down (smaller input size, less tiling, half-size overlays) while the job backlog is long
+DETECTION_POLICY = {
+    'enabled': True,
+}
+
+# Detection model cache in each worker: models loaded at startup and the memory budget for LRU eviction
+DETECTION_MODELS = {
+    'preload': ['object_detection', 'military_detection'],
+    'warm_up': True,
+    'memory_budget_mb': 4096,
+    # 'onnx' / 'onnx_int8' run the exports made by `python manage.py export_onnx_models [--quantize]`
+    'backend': 'native',
+    # Object and military detection run side by side on each batch, each with half of the worker's threads
+    'concurrent_detectors': 2,
+}
+
+# Cache of detection results keyed by image content, model weights and thresholds
+DETECTION_RESULT_CACHE = {
+    'enabled': True,
+    'max_entries': 10000,
+    'max_size_mb': 2048,
+}
+
+# Annotated detection images are rendered on demand and cached on disk instead of stored per run
+DETECTION_RENDERING = {
+    'eager': False,
+    'max_size_mb': 512,
+}
+
+# How often inference workers check DetectionConfig (edited in the admin) for new thresholds and model settings
+DETECTION_REGISTRY = {
+    'check_interval': 5.0,
+}